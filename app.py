@@ -3,7 +3,6 @@ os.environ["PYTHONUNBUFFERED"] = "1"
 import sys
 import subprocess
 import logging
-import zipfile
 import shutil
 from flask import Flask, render_template, request, jsonify, send_from_directory, Response, send_file
 from flask_socketio import SocketIO, emit
@@ -11,10 +10,15 @@ from flask_cors import CORS  # 导入 flask_cors
 import numpy as np
 import time
 from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import safe_join
 import warnings
 import threading
-import queue
 import uuid
+import json
+import wave
+import shlex
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 # 忽略警告
 warnings.filterwarnings("ignore")
@@ -33,6 +37,8 @@ SAVE_MODEL_ROOT = "/home/believe/AI_Voice_Platform/models/Save_ASR_train_models"
 SAVE_AUDIO_ROOT = "/home/believe/AI_Voice_Platform/Save_audio"
 SAVE_TTS_TRAIN_ROOT = "/home/believe/AI_Voice_Platform/models/Save_TTS_train"
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'Uploads')
+CACHE_ROOT = os.path.join(os.getcwd(), 'Cache')
+METRICS_ROOT = os.path.join(os.getcwd(), 'TrainingMetrics')  # 训练指标时序
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 if not os.path.exists(SAVE_MODEL_ROOT):
@@ -42,25 +48,247 @@ if not os.path.exists(SAVE_AUDIO_ROOT):
 if not os.path.exists(SAVE_TTS_TRAIN_ROOT):
     os.makedirs(SAVE_TTS_TRAIN_ROOT)
 
+# 模型管理各 section 对应的模型目录
+MODEL_SECTION_DIRS = {
+    'asr': MODEL_ROOT,
+    'asr-train': TRAIN_MODEL_ROOT,
+    'asr-finetune': TRAIN_MODEL_ROOT,
+    'tts': TTS_MODEL_ROOT,
+    'voice': TTS_VOICE_MODEL_ROOT,
+    'vits': SAVE_TTS_TRAIN_ROOT,
+    'vits-save': SAVE_TTS_TRAIN_ROOT,
+}
+# 模型压缩包解压后的大小上限（MB），0 表示只检查磁盘可用空间
+MODEL_UPLOAD_MAX_EXTRACTED_MB = int(os.environ.get("MODEL_UPLOAD_MAX_EXTRACTED_MB", 50 * 1024))
+
+# 音频下载：浏览器缓存时长（秒）；部署在 nginx/Apache 后面时可开启 X-Sendfile 由前端服务器直接发送文件
+AUDIO_CACHE_MAX_AGE = int(os.environ.get("AUDIO_CACHE_MAX_AGE", 3600))
+AUDIO_X_SENDFILE = os.environ.get("AUDIO_X_SENDFILE", "0") == "1"
+# 上传目录与音频输出目录的配额清理：大小上限（MB）与最长保留天数，0 表示不限制；
+# 最近 STORAGE_GC_GRACE_SECONDS 秒内访问或修改过的文件不清理
+UPLOAD_QUOTA_MB = int(os.environ.get("UPLOAD_QUOTA_MB", 20 * 1024))
+UPLOAD_MAX_AGE_DAYS = float(os.environ.get("UPLOAD_MAX_AGE_DAYS", 30))
+SAVE_AUDIO_QUOTA_MB = int(os.environ.get("SAVE_AUDIO_QUOTA_MB", 10 * 1024))
+SAVE_AUDIO_MAX_AGE_DAYS = float(os.environ.get("SAVE_AUDIO_MAX_AGE_DAYS", 14))
+CLONE_REFERENCE_QUOTA_MB = int(os.environ.get("CLONE_REFERENCE_QUOTA_MB", 2 * 1024))
+CLONE_REFERENCE_MAX_AGE_DAYS = float(os.environ.get("CLONE_REFERENCE_MAX_AGE_DAYS", 30))
+STORAGE_GC_INTERVAL_SECONDS = float(os.environ.get("STORAGE_GC_INTERVAL_SECONDS", 600))
+STORAGE_GC_GRACE_SECONDS = float(os.environ.get("STORAGE_GC_GRACE_SECONDS", 3600))
+# 模型注册表检查模型目录变化的间隔（秒）
+MODEL_REGISTRY_POLL_SECONDS = float(os.environ.get("MODEL_REGISTRY_POLL_SECONDS", 30))
+# 识别结果缓存上限（字节）
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# 语音合成结果缓存：位于音频输出目录下，超出容量时按最近访问淘汰
+SYNTHESIS_CACHE_DIR = 'tts_cache'
+SYNTHESIS_CACHE_MAX_BYTES = int(os.environ.get("SYNTHESIS_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+# 常驻 ASR 工作进程池配置：每个模型的进程数，例如 ASR_POOL_SIZES="paraformer=2,whisper=1"
+CONDA_ACTIVATE = "/home/believe/anaconda3/bin/activate"
+ASR_POOL_DEFAULT_SIZE = int(os.environ.get("ASR_POOL_DEFAULT_SIZE", 1))
+ASR_POOL_SIZES = {
+    name.strip(): int(size)
+    for name, size in (item.split("=", 1) for item in os.environ.get("ASR_POOL_SIZES", "").split(",") if "=" in item)
+}
+# 常驻语音合成服务：工作进程数与每个进程缓存模型的内存预算（MB）
+TTS_SERVICE_WORKERS = int(os.environ.get("TTS_SERVICE_WORKERS", 1))
+TTS_MEMORY_BUDGET_MB = int(os.environ.get("TTS_MEMORY_BUDGET_MB", 4096))
+# 任务调度：CPU 槽位与内存预算（MB，0 表示取物理内存的 80%），同时运行的语音克隆任务上限
+SCHEDULER_CPU_SLOTS = int(os.environ.get("SCHEDULER_CPU_SLOTS", os.cpu_count() or 1))
+SCHEDULER_MEMORY_MB = int(os.environ.get("SCHEDULER_MEMORY_MB", 0))
+CLONE_MAX_CONCURRENT = int(os.environ.get("CLONE_MAX_CONCURRENT", 2))
+# 常驻语音克隆工作进程（数量与同时运行的克隆任务上限相同）各自在内存中保留的参考音频提示特征数
+CLONE_PROMPT_MEMORY = int(os.environ.get("CLONE_PROMPT_MEMORY", 32))
+# 只留给交互式任务（语音合成、语音克隆）的 CPU 槽位与内存（MB），训练和测试任务不会占用
+SCHEDULER_INTERACTIVE_CPU = int(os.environ.get("SCHEDULER_INTERACTIVE_CPU", 2))
+SCHEDULER_INTERACTIVE_MEMORY_MB = int(os.environ.get("SCHEDULER_INTERACTIVE_MEMORY_MB", 2048))
+# 每个任务保留的日志行数
+LOG_BUFFER_LINES = int(os.environ.get("LOG_BUFFER_LINES", 5000))
+# 数据集去重：默认方式（report 只报告 / drop 删除完全相同的样本 / link 硬链接到已存副本 / off 不检查）
+# 与近似重复判定阈值（指纹集合 Jaccard 相似度）
+DATASET_DEDUP_MODE = os.environ.get("DATASET_DEDUP_MODE", "report")
+DEDUP_NEAR_THRESHOLD = float(os.environ.get("DEDUP_NEAR_THRESHOLD", 0.4))
+# 训练特征预计算的进程数
+FEATURE_WORKERS = int(os.environ.get("FEATURE_WORKERS", max((os.cpu_count() or 1) // 2, 1)))
+# 各类任务默认占用的资源：(CPU 槽位, 内存 MB)；语音合成的模型常驻在 TTS 服务进程中，只计 CPU
+TRAIN_CPU_SLOTS = max((os.cpu_count() or 1) // 2, 1)
+JOB_RESOURCES = {
+    'tts': (1, 0),
+    'clone': (2, 2048),
+    'vits_test': (1, 1024),
+    'asr_train': (TRAIN_CPU_SLOTS, 8192),
+    'vits_train': (TRAIN_CPU_SLOTS, 4096),
+    'preprocess': (FEATURE_WORKERS, 2048),
+    'model_publish': (1, 0),
+}
+# 数据集导入：并行解压与校验的线程数
+DATASET_INGEST_WORKERS = int(os.environ.get("DATASET_INGEST_WORKERS", min(os.cpu_count() or 1, 8)))
+# 长文本分段并行合成：超过该字数的非流式请求分段后并行合成；并行时每个进程的计算线程数按并行度均分 CPU，
+# 单句合成使用的常驻进程不限制线程数
+TTS_LONG_TEXT_MIN_CHARS = int(os.environ.get("TTS_LONG_TEXT_MIN_CHARS", 200))
+TTS_PARALLEL_WORKERS = int(os.environ.get("TTS_PARALLEL_WORKERS", max((os.cpu_count() or 1) // 2, 1)))
+TTS_THREADS_PER_WORKER = max((os.cpu_count() or 1) // TTS_PARALLEL_WORKERS, 1)
+# 批量识别：并行工作进程数上限与每批文件数
+ASR_BATCH_WORKERS = int(os.environ.get("ASR_BATCH_WORKERS", min(os.cpu_count() or 1, 4)))
+ASR_BATCH_SIZE = int(os.environ.get("ASR_BATCH_SIZE", 8))
+# 长音频分段识别：窗口长度与相邻窗口重叠（秒）
+LONG_AUDIO_WINDOW_SECONDS = float(os.environ.get("LONG_AUDIO_WINDOW_SECONDS", 30))
+LONG_AUDIO_OVERLAP_SECONDS = float(os.environ.get("LONG_AUDIO_OVERLAP_SECONDS", 1.5))
+
+# 实时识别语音活动检测：静音块不送入模型，hangover 为语音结束后继续转发的时长
+REALTIME_VAD_ENABLED = os.environ.get("REALTIME_VAD_ENABLED", "1") != "0"
+REALTIME_VAD_HANGOVER_MS = int(os.environ.get("REALTIME_VAD_HANGOVER_MS", 400))
+REALTIME_VAD_PREROLL_MS = int(os.environ.get("REALTIME_VAD_PREROLL_MS", 200))
+
 app = Flask(__name__, template_folder='templates')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['USE_X_SENDFILE'] = AUDIO_X_SENDFILE
 CORS(app, resources={r"/*": {"origins": "http://localhost:8080"}})  # 允许来自 localhost:8080 的请求
 socketio = SocketIO(app, cors_allowed_origins="http://localhost:8080")  # 更新 SocketIO 的 CORS 配置
 
-# 全局变量存储子进程
-recognition_process = None
-training_process = None
-tts_process = None
-tts_train_process = None
-tts_test_process = None
-log_queue = queue.Queue()
-process_lock = threading.Lock()
-
-vits_train_log_queue = queue.Queue()
-vits_test_log_queue = queue.Queue()
+# 训练、测试、克隆等子进程任务统一由 scheduler 调度
+tts_requests = {}  # sid -> 进行中的语音合成任务 ID
+
+from worker_pool import WorkerPool, WorkerError
+from model_registry import ModelRegistry
+from model_refs import ModelRefs
+from model_upload import (ModelUploadManager, UploadError, STAGING_DIR, valid_model_name, extract_zip,
+                          publish_directory)
+from tts_service import TTSService
+from text_split import segment_text
+from audio_join import join_wavs, pause_after
+from voice_references import VoiceReferenceStore
+from log_broadcast import LogBroadcaster
+from training_metrics import MetricsStore, FIELDS as METRIC_FIELDS
+from scheduler import Scheduler, QUEUED, RUNNING, PRIORITY_INTERACTIVE, PRIORITY_TEST, PRIORITY_TRAINING
+from batch_recognition import run_batch, extract_audio_members
+from long_audio import recognize_long, check_window
+from dataset_ingest import (save_stream, ingest_zip, load_summary, load_manifest, write_manifest, DatasetError,
+                            MANIFEST_NAME)
+from audio_fingerprint import FingerprintIndex, MODES as DEDUP_MODES, write_report, load_report
+from feature_cache import FEATURE_KINDS, available_features
+from audio_variants import AudioVariants, VariantError, FORMATS as AUDIO_FORMATS, file_etag
+from storage_janitor import StorageJanitor
+from result_cache import TranscriptionCache, SynthesisCache, audio_digest, directory_version
+
+transcription_cache = TranscriptionCache(os.path.join(CACHE_ROOT, 'transcriptions'), MODEL_ROOT,
+                                         TRANSCRIPTION_CACHE_MAX_BYTES)
+# 训练/测试日志：每个任务一个有界环形缓冲区，支持多订阅者和 Last-Event-ID 续传
+job_logs = LogBroadcaster(capacity=LOG_BUFFER_LINES)
+training_metrics = MetricsStore(METRICS_ROOT)
+scheduler = Scheduler(SCHEDULER_CPU_SLOTS, SCHEDULER_MEMORY_MB or None, kind_limits={'clone': CLONE_MAX_CONCURRENT},
+                      reserved_cpu=SCHEDULER_INTERACTIVE_CPU, reserved_memory_mb=SCHEDULER_INTERACTIVE_MEMORY_MB)
+voice_references = VoiceReferenceStore(os.path.join(CACHE_ROOT, 'voice_references'))
+model_refs = ModelRefs()
+model_registry = ModelRegistry([MODEL_ROOT, TRAIN_MODEL_ROOT, TTS_MODEL_ROOT, TTS_VOICE_MODEL_ROOT,
+                                SAVE_TTS_TRAIN_ROOT], MODEL_REGISTRY_POLL_SECONDS)
+model_registry.start()
+model_uploads = ModelUploadManager(MODEL_SECTION_DIRS, retire=model_refs.defer_delete,
+                                   max_extracted_bytes=MODEL_UPLOAD_MAX_EXTRACTED_MB * 1024 * 1024)
+audio_variants = AudioVariants()
+fingerprints = FingerprintIndex(os.path.join(CACHE_ROOT, 'fingerprints'), DEDUP_NEAR_THRESHOLD)
+synthesis_cache = SynthesisCache(os.path.join(SAVE_AUDIO_ROOT, SYNTHESIS_CACHE_DIR), TTS_MODEL_ROOT,
+                                 SYNTHESIS_CACHE_MAX_BYTES)
+
+def storage_pins():
+    # 仍被引用、不能清理的路径：排队中和运行中任务的数据集、参考音频和输出文件，
+    # 以及数据集清单中 duplicate_of 指向的其他数据集样本（引用它的数据集存在期间保留原样本）
+    for state in (QUEUED, RUNNING):
+        for info in scheduler.list_jobs(state=state):
+            for key in ('dataset_path', 'audio_path', 'reference_path'):
+                value = info['meta'].get(key)
+                if isinstance(value, str) and value:
+                    yield os.path.join(SAVE_AUDIO_ROOT, value)
+    for entry in os.scandir(app.config['UPLOAD_FOLDER']):
+        if not entry.is_dir() or not os.path.exists(os.path.join(entry.path, MANIFEST_NAME)):
+            continue
+        try:
+            samples = load_manifest(entry.path)
+        except (OSError, ValueError):
+            continue
+        for sample in samples:
+            original = sample.get('duplicate_of')
+            if original and not original.startswith(entry.path + os.sep):
+                yield original
+
+def on_storage_removed(path):
+    # 数据集目录被清理后移除其音频指纹
+    if os.path.exists(os.path.join(fingerprints.root, os.path.basename(path) + '.json')):
+        fingerprints.remove_dataset(path)
+
+# 合成结果缓存目录（包括其中文件的压缩副本）由 synthesis_cache 按自身容量淘汰，不参与配额清理
+storage_janitor = StorageJanitor({
+    UPLOAD_FOLDER: {'max_bytes': UPLOAD_QUOTA_MB * 1024 * 1024, 'max_age': UPLOAD_MAX_AGE_DAYS * 86400},
+    SAVE_AUDIO_ROOT: {'max_bytes': SAVE_AUDIO_QUOTA_MB * 1024 * 1024, 'max_age': SAVE_AUDIO_MAX_AGE_DAYS * 86400,
+                      'exclude': [SYNTHESIS_CACHE_DIR]},
+    voice_references.root: {'max_bytes': CLONE_REFERENCE_QUOTA_MB * 1024 * 1024,
+                            'max_age': CLONE_REFERENCE_MAX_AGE_DAYS * 86400},
+}, pins=storage_pins, on_removed=on_storage_removed, interval=STORAGE_GC_INTERVAL_SECONDS,
+    grace=STORAGE_GC_GRACE_SECONDS)
+storage_janitor.start()
+
+def submit_job(kind, fn, *args, priority=PRIORITY_INTERACTIVE, cpu=None, **kwargs):
+    default_cpu, memory_mb = JOB_RESOURCES[kind]
+    return scheduler.submit(kind, fn, *args, cpu=default_cpu if cpu is None else cpu, memory_mb=memory_mb,
+                            priority=priority, **kwargs)
+
+def cancel_jobs(kind, job_id=None):
+    # 取消指定任务，未指定时取消该类全部排队中和运行中的任务；返回取消的任务数
+    if job_id:
+        job = scheduler.get(job_id)
+        return 1 if job is not None and job.kind == kind and scheduler.cancel(job_id) else 0
+    return sum(1 for job in scheduler.active(kind) if scheduler.cancel(job.id))
+
+from output_pump import LatencyStats
+from realtime_sessions import RealtimeSessionManager, SessionError
+from vad_gate import VADCounters
+
+recognition_latency = LatencyStats()  # 识别结果从子进程生成到推送的延迟
+vad_counters = VADCounters()
+
+def build_asr_worker_cmd(model):
+    return f'. "{CONDA_ACTIVATE}" asr_infer_env && exec python asr_worker.py "{model}"'
+
+# 每个 ASR 工作进程存活期间持有其模型目录的引用，模型被替换或删除后等旧进程停止再删除旧文件
+asr_pool = WorkerPool(build_asr_worker_cmd, pool_sizes=ASR_POOL_SIZES, default_size=ASR_POOL_DEFAULT_SIZE,
+                      acquire=lambda model: model_refs.lease(os.path.join(MODEL_ROOT, model)))
+asr_pool.start_supervisor()
+
+def build_realtime_worker_cmd(model):
+    return f'. "{CONDA_ACTIVATE}" asr_infer_env && exec python realtime_asr_worker.py "{model}"'
+
+def build_tts_worker_cmd(threads=None):
+    limit = f'OMP_NUM_THREADS={threads} ' if threads else ''
+    return f'. "{CONDA_ACTIVATE}" tts_new_env && {limit}exec python tts_worker.py {TTS_MEMORY_BUDGET_MB}'
+
+tts_service = TTSService(build_tts_worker_cmd, workers=TTS_SERVICE_WORKERS, parallel_threads=TTS_THREADS_PER_WORKER)
+if os.path.exists(CONDA_ACTIVATE):
+    tts_service.start()
+
+# 常驻语音克隆工作进程：模型只加载一次，参考音频的提示特征按 (音频哈希, 模型版本) 缓存复用
+CLONE_POOL_KEY = 'clone'
+
+def build_clone_worker_cmd(_):
+    return f'. "{CONDA_ACTIVATE}" voice && exec python clone_worker.py {CLONE_PROMPT_MEMORY}'
+
+clone_pool = WorkerPool(build_clone_worker_cmd, default_size=CLONE_MAX_CONCURRENT, label='Clone')
+clone_pool.start_supervisor()
+
+# 实时识别会话：同一模型的会话共享一个批量解码的常驻子进程
+realtime_sessions = RealtimeSessionManager(
+    build_realtime_worker_cmd,
+    lambda sid, message: socketio.emit('recognition_result', message, to=sid),
+    latency_stats=recognition_latency,
+    vad_config={
+        'enabled': REALTIME_VAD_ENABLED,
+        'hangover_ms': REALTIME_VAD_HANGOVER_MS,
+        'preroll_ms': REALTIME_VAD_PREROLL_MS,
+    },
+    vad_counters=vad_counters,
+    acquire=lambda model: model_refs.lease(os.path.join(MODEL_ROOT, model))
+)
 
 # 导入语音识别API相关方法
-from recognition_seq2seq import get_available_models, load_local_model, start_ws_server
+from recognition_seq2seq import load_local_model, start_ws_server
 # 导入模型相关方法
 # 主页路由
 @app.route('/')
@@ -70,8 +298,7 @@ def index():
 # API：列出语音识别模型（替换为 app1.py 逻辑）
 @app.route('/models', methods=['GET'])
 def get_models():
-    models = get_available_models()
-    return jsonify(models)
+    return jsonify(model_registry.names(MODEL_ROOT))
 
 # API：加载语音识别模型（替换为 app1.py 逻辑）
 @app.route('/load_model', methods=['POST'])
@@ -81,6 +308,8 @@ def load_model():
     if not selected_model:
         return jsonify({"status": "error", "message": "未选择模型"})
     result = load_local_model(selected_model)
+    if os.path.exists(CONDA_ACTIVATE):
+        asr_pool.warm(selected_model)  # 预热离线识别工作进程
     return jsonify(result)
 
 # API：列出模型
@@ -88,24 +317,178 @@ def load_model():
 def list_models():
     section = request.args.get('section', 'asr')
     try:
-        if section == 'asr':
-            model_dir = MODEL_ROOT
-        elif section == 'asr-finetune':
-            model_dir = TRAIN_MODEL_ROOT
-        elif section == 'tts':
-            model_dir = TTS_MODEL_ROOT
-        elif section == 'vits':
-            model_dir = SAVE_TTS_TRAIN_ROOT
-        else:
+        model_dir = MODEL_SECTION_DIRS.get(section)
+        if model_dir is None:
             return jsonify({'error': '无效的 section 参数'}), 400
 
-        models = [d for d in os.listdir(model_dir) if os.path.isdir(os.path.join(model_dir, d))]
-        print(f"{section} 模型列表: {models}", file=sys.stderr)
-        return jsonify(models)
+        # detail=1 时一次返回全部模型的元数据
+        if request.args.get('detail') == '1':
+            return jsonify(model_registry.list(model_dir))
+        return jsonify(model_registry.names(model_dir))
     except Exception as e:
         print(f"获取 {section} 模型列表失败: {str(e)}", file=sys.stderr)
         return jsonify({'error': str(e)}), 500
 
+# API：查看模型注册表状态
+@app.route('/model_registry/stats', methods=['GET'])
+def model_registry_stats():
+    return jsonify(model_registry.stats())
+
+# API：查看模型目录的引用与延迟删除情况
+@app.route('/model_refs/stats', methods=['GET'])
+def model_refs_stats():
+    return jsonify(model_refs.stats())
+
+# API：上传模型文件
+@app.route('/upload_model_file', methods=['POST'])
+def upload_model_file():
+    section = request.args.get('section')
+    model_name = request.args.get('model_name')
+    if not section or not model_name:
+        return jsonify({'error': '缺少 section 或 model_name 参数'}), 400
+
+    if 'file' not in request.files:
+        return jsonify({'error': '未提供文件'}), 400
+
+    file = request.files['file']
+    if not file.filename.endswith('.zip'):
+        return jsonify({'error': '文件必须是 ZIP 压缩包'}), 400
+
+    target_dir = MODEL_SECTION_DIRS.get(section)
+    if target_dir is None:
+        return jsonify({'error': '无效的 section 参数'}), 400
+    if not valid_model_name(model_name):
+        return jsonify({'error': '无效的模型名称'}), 400
+
+    # 单请求上传：同样先解压到暂存目录，再整体替换模型目录
+    staging = os.path.join(target_dir, STAGING_DIR, uuid.uuid4().hex)
+    try:
+        os.makedirs(staging)
+        zip_path = os.path.join(staging, 'upload.zip')
+        save_stream(file.stream, zip_path)
+        extract_zip(zip_path, os.path.join(staging, 'model'))
+        publish_directory(os.path.join(staging, 'model'), os.path.join(target_dir, model_name),
+                          model_refs.defer_delete)
+        on_model_changed(section, model_name)
+        return jsonify({'status': 'success', 'message': '模型上传成功'})
+    except Exception as e:
+        return jsonify({'error': f'上传模型失败: {str(e)}'}), 500
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+# API：登记分块上传；相同模型、文件名和大小的未完成上传直接返回已接收的块，客户端只补传缺失部分
+@app.route('/model_upload/init', methods=['POST'])
+def model_upload_init():
+    data = request.get_json(silent=True) or {}
+    try:
+        session = model_uploads.init(data.get('section'), data.get('model_name'), data.get('filename', ''),
+                                     int(data.get('size', 0)), data.get('chunk_size'))
+    except (UploadError, ValueError, OSError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(session.status())
+
+# API：上传一块，请求体为原始字节，X-Chunk-Sha256 头为该块的 SHA-256
+@app.route('/model_upload/<upload_id>/chunk/<int:index>', methods=['PUT'])
+def model_upload_chunk(upload_id, index):
+    session = model_uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': '上传不存在'}), 404
+    try:
+        session.write_chunk(index, request.stream, request.headers.get('X-Chunk-Sha256'))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    except ClientDisconnected:
+        return jsonify({'error': '连接中断'}), 400
+    status = session.status()
+    status.pop('received')
+    return jsonify(status)
+
+# API：查询上传进度（含吞吐量与预计剩余时间）
+@app.route('/model_upload/<upload_id>', methods=['GET'])
+def model_upload_status(upload_id):
+    session = model_uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': '上传不存在'}), 404
+    return jsonify(session.status())
+
+# API：全部块上传完成后排队解压并发布
+@app.route('/model_upload/<upload_id>/complete', methods=['POST'])
+def model_upload_complete(upload_id):
+    session = model_uploads.get(upload_id)
+    if session is None:
+        return jsonify({'error': '上传不存在'}), 404
+    status = session.status()
+    if len(status['received']) < status['chunks']:
+        return jsonify({'error': f"还有 {status['chunks'] - len(status['received'])} 块未上传"}), 400
+    previous = scheduler.get(session.info.get('job_id') or '')
+    if previous is not None and previous in scheduler.active('model_publish'):
+        return jsonify({'status': 'success', 'job_id': previous.id, 'position': scheduler.position(previous.id)})
+    job, position = submit_job('model_publish', run_model_publish, session,
+                               meta={'section': session.info['section'], 'model_name': session.info['model_name']})
+    session.info['job_id'] = job.id
+    return jsonify({'status': 'success', 'job_id': job.id, 'position': position})
+
+def run_model_publish(job, session):
+    model_uploads.publish(job, session, on_published=on_model_changed)
+
+# API：放弃上传并删除已接收的数据
+@app.route('/model_upload/<upload_id>/abort', methods=['POST'])
+def model_upload_abort(upload_id):
+    if not model_uploads.abort(upload_id):
+        return jsonify({'error': '上传不存在'}), 404
+    return jsonify({'status': 'success'})
+
+# API：删除模型文件
+@app.route('/delete_model_file', methods=['POST'])
+def delete_model_file():
+    section = request.args.get('section')
+    model_name = request.args.get('model_name')
+    if not section or not model_name:
+        return jsonify({'error': '缺少 section 或 model_name 参数'}), 400
+
+    try:
+        # 根据 section 确定目标目录
+        target_dir = MODEL_SECTION_DIRS.get(section)
+        if target_dir is None:
+            return jsonify({'error': '无效的 section 参数'}), 400
+
+        # 构建模型目录路径
+        model_dir = os.path.join(target_dir, model_name)
+        if not os.path.exists(model_dir):
+            return jsonify({'error': '模型目录不存在'}), 404
+
+        # 先把模型目录移出模型根目录（新请求立即看不到该模型），仍被进行中的请求或常驻进程使用时延迟删除
+        trash_dir = os.path.join(target_dir, STAGING_DIR, f"{uuid.uuid4().hex}.deleted")
+        os.makedirs(os.path.dirname(trash_dir), exist_ok=True)
+        os.rename(model_dir, trash_dir)
+        model_refs.defer_delete(trash_dir)
+        on_model_changed(section, model_name)
+        return jsonify({'status': 'success', 'message': '模型删除成功'})
+    except Exception as e:
+        return jsonify({'error': f'删除模型失败: {str(e)}'}), 500
+
+# 模型文件变更后：清理该模型的结果缓存；常驻进程中的模型热切换到新版本（模型被删除时等请求完成后停止），
+# 切换完成前请求继续由旧版本处理
+def on_model_changed(section, model_name):
+    root = MODEL_SECTION_DIRS.get(section)
+    model_registry.refresh(root, model_name)
+    exists = os.path.isdir(os.path.join(root, model_name))
+    if root == MODEL_ROOT:
+        transcription_cache.invalidate(model_name)
+        if exists:
+            asr_pool.reload(model_name)
+        else:
+            asr_pool.retire(model_name)
+        realtime_sessions.shutdown_idle(model_name)
+    elif root == TTS_MODEL_ROOT:
+        synthesis_cache.invalidate(model_name)
+        model_path = os.path.join(TTS_MODEL_ROOT, model_name)
+        info = model_registry.get(TTS_MODEL_ROOT, model_name)
+        if exists and info is not None:
+            threading.Thread(target=tts_service.swap, args=(model_path, info['version']), daemon=True).start()
+        else:
+            tts_service.forget(model_path)
+
 # API：离线音频文件识别
 @app.route('/recognize', methods=['POST'])
 def recognize():
@@ -119,27 +502,139 @@ def recognize():
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
     file.save(file_path)
 
-    conda_env_name = "asr_infer_env"
-    conda_activate = "/home/believe/anaconda3/bin/activate"
-    if not os.path.exists(conda_activate):
-        return jsonify({'error': f'Anaconda 激活脚本未找到：{conda_activate}'})
-
-    cmd = f'. "{conda_activate}" {conda_env_name} && python recognize.py "{file_path}" "{model}"'
+    if not os.path.exists(CONDA_ACTIVATE):
+        return jsonify({'error': f'Anaconda 激活脚本未找到：{CONDA_ACTIVATE}'})
 
     try:
-        result = subprocess.run(
-            ["/bin/bash", "-c", cmd],
-            capture_output=True,
-            text=True,
-            encoding='utf-8'
-        )
-        output = result.stdout.strip()
-        error = result.stderr.strip()
-        if result.returncode != 0:
-            return jsonify({'error': f'子进程错误：{error}'})
+        digest = audio_digest(file_path)
+        cached = transcription_cache.get(model, digest)
+        if cached is not None:
+            return jsonify({'text': cached if cached else '无识别结果', 'cached': True})
+        output = asr_pool.transcribe(model, file_path)
+        transcription_cache.put(model, digest, output)
         return jsonify({'text': output if output else '无识别结果'})
+    except WorkerError as e:
+        return jsonify({'error': f'识别工作进程错误：{str(e)}'})
     except Exception as e:
-        return jsonify({'error': f'子进程调用失败：{str(e)}'})
+        return jsonify({'error': f'识别失败：{str(e)}'})
+
+# API：批量离线识别，上传多个音频文件或一个 ZIP，按 NDJSON 逐行返回每个文件的结果
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    model = request.form.get('model')
+    uploads = request.files.getlist('audio')
+    archive = request.files.get('archive')
+    if not model or (not uploads and not archive):
+        return jsonify({'error': '无效输入'}), 400
+    if not os.path.exists(CONDA_ACTIVATE):
+        return jsonify({'error': f'Anaconda 激活脚本未找到：{CONDA_ACTIVATE}'}), 400
+
+    batch_dir = os.path.join(app.config['UPLOAD_FOLDER'], f"batch_{uuid.uuid4().hex}")
+    os.makedirs(batch_dir, exist_ok=True)
+    try:
+        files = []
+        for index, upload in enumerate(uploads):
+            if not upload.filename:
+                continue
+            path = os.path.join(batch_dir, f"{index:05d}_{os.path.basename(upload.filename)}")
+            upload.save(path)
+            files.append((upload.filename, path))
+        if archive and archive.filename:
+            zip_path = os.path.join(batch_dir, 'upload.zip')
+            archive.save(zip_path)
+            files.extend(extract_audio_members(zip_path, batch_dir))
+            os.remove(zip_path)
+    except Exception as e:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'error': f'保存上传文件失败：{str(e)}'}), 400
+    if not files:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'error': '没有可识别的音频文件'}), 400
+
+    def stream():
+        started = time.time()
+        succeeded = 0
+        digests = {}
+        pending = []
+        try:
+            # 先返回缓存命中的文件，其余文件再分桶解码
+            for name, path in files:
+                digests[path] = audio_digest(path)
+                cached = transcription_cache.get(model, digests[path])
+                if cached is None:
+                    pending.append((name, path))
+                    continue
+                succeeded += 1
+                yield json.dumps({'file': name, 'text': cached or '无识别结果', 'cached': True},
+                                 ensure_ascii=False) + "\n"
+            on_text = lambda path, text: transcription_cache.put(model, digests[path], text)
+            # 本批次期间临时扩充工作进程，结束后回收到常驻数量
+            with asr_pool.expanded(model, ASR_BATCH_WORKERS) as workers:
+                for entry in run_batch(asr_pool, model, pending, workers, max_batch_size=ASR_BATCH_SIZE,
+                                       on_text=on_text):
+                    if 'text' in entry:
+                        succeeded += 1
+                    yield json.dumps(entry, ensure_ascii=False) + "\n"
+            yield json.dumps({'done': True, 'total': len(files), 'succeeded': succeeded,
+                              'elapsed': round(time.time() - started, 2)}, ensure_ascii=False) + "\n"
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+    return Response(stream(), mimetype='application/x-ndjson')
+
+# API：长音频分段识别，按 NDJSON 逐段返回带时间戳的结果，最后一行为完整文本
+@app.route('/recognize_long', methods=['POST'])
+def recognize_long_audio():
+    if 'audio' not in request.files:
+        return jsonify({'error': '无音频文件'}), 400
+    file = request.files['audio']
+    model = request.form.get('model')
+    if file.filename == '' or not model:
+        return jsonify({'error': '无效输入'}), 400
+    if not os.path.exists(CONDA_ACTIVATE):
+        return jsonify({'error': f'Anaconda 激活脚本未找到：{CONDA_ACTIVATE}'}), 400
+    try:
+        window_seconds = float(request.form.get('window_seconds', LONG_AUDIO_WINDOW_SECONDS))
+        overlap_seconds = float(request.form.get('overlap_seconds', LONG_AUDIO_OVERLAP_SECONDS))
+    except ValueError:
+        return jsonify({'error': '窗口长度和重叠时长必须是数字'}), 400
+    try:
+        check_window(window_seconds, overlap_seconds)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    work_dir = os.path.join(app.config['UPLOAD_FOLDER'], f"long_{uuid.uuid4().hex}")
+    os.makedirs(work_dir, exist_ok=True)
+    file_path = os.path.join(work_dir, os.path.basename(file.filename))
+    file.save(file_path)
+
+    def stream():
+        started = time.time()
+        texts = []
+        try:
+            with asr_pool.expanded(model, ASR_BATCH_WORKERS) as workers:
+                for segment in recognize_long(asr_pool, model, file_path, work_dir, workers,
+                                              window_seconds=window_seconds, overlap_seconds=overlap_seconds):
+                    if segment['text']:
+                        texts.append(segment['text'])
+                    yield json.dumps(segment, ensure_ascii=False) + "\n"
+            yield json.dumps({'done': True, 'text': ''.join(texts),
+                              'elapsed': round(time.time() - started, 2)}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"长音频识别失败: {str(e)}", file=sys.stderr)
+            yield json.dumps({'error': f'长音频识别失败：{str(e)}'}, ensure_ascii=False) + "\n"
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return Response(stream(), mimetype='application/x-ndjson')
+
+# API：识别结果缓存统计
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'transcription': transcription_cache.stats()})
+
+# API：查看常驻 ASR 工作进程池状态
+@app.route('/asr_pool/status', methods=['GET'])
+def asr_pool_status():
+    return jsonify(asr_pool.stats())
 
 # API：上传数据集
 @app.route('/upload_dataset', methods=['POST'])
@@ -154,52 +649,171 @@ def upload_dataset():
     dataset_path = os.path.join(app.config['UPLOAD_FOLDER'], dataset_id)
     os.makedirs(dataset_path, exist_ok=True)
 
-    zip_path = os.path.join(dataset_path, file.filename)
-    file.save(zip_path)
-
+    # 压缩包放在数据集目录之外，解压完成后删除
+    zip_path = dataset_path + '.zip'
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(dataset_path)
-        os.remove(zip_path)  # 解压后删除 ZIP 文件
-
-        # 检查是否有至少一个 .wav 和对应 .trn 文件
-        wav_files = []
-        trn_files = []
-        for root, _, files in os.walk(dataset_path):
-            for f in files:
-                if f.endswith('.wav'):
-                    wav_files.append(os.path.join(root, f))
-                elif f.endswith('.trn'):
-                    trn_files.append(os.path.join(root, f))
-        if not wav_files or not trn_files:
+        save_stream(file.stream, zip_path)
+        summary = ingest_zip(zip_path, dataset_path, workers=DATASET_INGEST_WORKERS)
+        if not summary['valid_samples']:
             shutil.rmtree(dataset_path, ignore_errors=True)
             return jsonify({"error": "数据集缺少 .wav 或 .trn 文件"}), 400
-
-        # 可选：统计有效样本数
-        valid_count = 0
-        for wav_file in wav_files:
-            trn_file = wav_file + ".trn"
-            if os.path.exists(trn_file):
-                with open(trn_file, "r", encoding="utf-8") as f:
-                    first_line = f.readline().strip()
-                    if first_line:
-                        valid_count += 1
-
-        return jsonify({"dataset_path": dataset_path, "valid_samples": valid_count})
+        # 与已上传的数据集（及本数据集内部）比对指纹，按 dedup 参数报告、删除或硬链接重复样本
+        mode = request.form.get('dedup', DATASET_DEDUP_MODE)
+        if mode in DEDUP_MODES:
+            entries = load_manifest(dataset_path, include_invalid=True)
+            report = fingerprints.add_dataset(dataset_path, entries, mode, workers=DATASET_INGEST_WORKERS)
+            write_report(dataset_path, report)
+            summary = dict(write_manifest(dataset_path, entries), elapsed=summary['elapsed'],
+                           dedup={k: v for k, v in report.items() if k != 'duplicates'})
+            if not summary['valid_samples']:
+                fingerprints.remove_dataset(dataset_path)
+                shutil.rmtree(dataset_path, ignore_errors=True)
+                return jsonify({"error": "数据集中的样本均与已上传的数据重复"}), 400
+        # 可选：导入后立即排队预计算训练特征
+        kinds = [k for k in request.form.get('features', '').split(',') if k in FEATURE_KINDS]
+        if kinds:
+            job, position = submit_feature_job(dataset_path, kinds)
+            summary.update(feature_job_id=job.id, feature_position=position)
+        return jsonify(summary)
+    except DatasetError as e:
+        shutil.rmtree(dataset_path, ignore_errors=True)
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         shutil.rmtree(dataset_path, ignore_errors=True)
         return jsonify({"error": f"解压 ZIP 文件失败：{str(e)}"}), 500
-
-# API：获取生成的音频
-@app.route('/audio/<filename>')
+    finally:
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+
+def is_uploaded_dataset(dataset_path):
+    return bool(dataset_path) and \
+        os.path.dirname(os.path.abspath(dataset_path)) == os.path.abspath(app.config['UPLOAD_FOLDER'])
+
+# API：查看数据集清单摘要，detail=1 时返回全部样本（含无效样本及原因）
+@app.route('/dataset_manifest', methods=['GET'])
+def dataset_manifest():
+    dataset_path = request.args.get('dataset_path', '')
+    if not is_uploaded_dataset(dataset_path):
+        return jsonify({"error": "数据集路径无效"}), 400
+    summary = load_summary(dataset_path)
+    if summary is None:
+        return jsonify({"error": "数据集清单不存在"}), 404
+    summary['features'] = sorted(available_features(dataset_path))
+    if request.args.get('detail') == '1':
+        summary['entries'] = load_manifest(dataset_path, include_invalid=True)
+    return jsonify(summary)
+
+# API：查看数据集的去重报告
+@app.route('/dedup_report', methods=['GET'])
+def dedup_report():
+    dataset_path = request.args.get('dataset_path', '')
+    if not is_uploaded_dataset(dataset_path):
+        return jsonify({"error": "数据集路径无效"}), 400
+    report = load_report(dataset_path)
+    if report is None:
+        return jsonify({"error": "数据集没有去重报告"}), 404
+    return jsonify(report)
+
+# API：查看音频指纹索引状态
+@app.route('/fingerprint_stats', methods=['GET'])
+def fingerprint_stats():
+    return jsonify(fingerprints.stats())
+
+# API：预计算数据集的训练特征（fbank 供 ASR 微调，spectrogram 供 VITS 训练）
+@app.route('/preprocess_dataset', methods=['POST'])
+def preprocess_dataset():
+    data = request.get_json(silent=True) or {}
+    dataset_path = data.get('dataset_path')
+    kinds = data.get('features') or list(FEATURE_KINDS)
+    if not is_uploaded_dataset(dataset_path) or load_summary(dataset_path) is None:
+        return jsonify({"error": "数据集路径无效"}), 400
+    unknown = [k for k in kinds if k not in FEATURE_KINDS]
+    if unknown:
+        return jsonify({"error": f"未知的特征类型: {', '.join(unknown)}"}), 400
+    job, position = submit_feature_job(dataset_path, kinds)
+    return jsonify({"status": "success", "job_id": job.id, "position": position})
+
+def submit_feature_job(dataset_path, kinds):
+    job, position = submit_job('preprocess', run_feature_job, dataset_path, kinds, priority=PRIORITY_TRAINING,
+                               meta={'dataset_path': dataset_path, 'features': kinds})
+    job_logs.channel('preprocess', job.id)
+    return job, position
+
+# 后台计算特征缓存，进度写入预处理日志流
+def run_feature_job(job, dataset_path, kinds):
+    # 每种特征一个独立的计算进程（内部再用 spawn 进程池并行），进度和结果逐行写入任务日志
+    log = job_logs.channel('preprocess', job.id)
+    try:
+        for kind in kinds:
+            log.publish(f"开始计算 {kind} 特征")
+            cmd = [sys.executable, 'feature_cache.py', dataset_path, kind, str(FEATURE_WORKERS)]
+            return_code = job.run_process(cmd, lambda line, is_err: log.publish(line))
+            job.check_cancelled()
+            if return_code != 0:
+                raise RuntimeError(f"{kind} 特征计算失败，退出码 {return_code}")
+    finally:
+        log.close("[预处理已取消]" if job.cancel_requested else "[预处理结束]")
+
+# API：流式获取特征预处理日志
+@app.route('/preprocess_log')
+def preprocess_log_endpoint():
+    return job_log_response('preprocess')
+
+# 训练子进程的环境变量：数据集有清单时通过 DATASET_MANIFEST 传给训练脚本，免去重新遍历目录；
+# 已预计算的特征通过 FEATURE_CACHE_<类型>（数据文件路径，索引为同名 .index.json）传入
+def dataset_env(dataset_path):
+    manifest = os.path.join(dataset_path or '', MANIFEST_NAME)
+    if not dataset_path or not os.path.exists(manifest):
+        return None
+    env = dict(os.environ, DATASET_MANIFEST=manifest)
+    for kind, data_path in available_features(dataset_path).items():
+        env[f"FEATURE_CACHE_{kind.upper()}"] = data_path
+    return env
+
+# API：获取生成的音频；支持 Range 请求和强 ETag（拖动进度、重复播放不再重新下载整个文件），
+# ?format=opus|mp3 返回转码后缓存的压缩副本，未安装 ffmpeg 或转码失败时返回原 WAV
+@app.route('/audio/<path:filename>')
 def serve_audio(filename):
-    audio_path = os.path.join(SAVE_AUDIO_ROOT, filename)
-    print(f"请求音频文件: {audio_path}", file=sys.stderr)
-    if not os.path.exists(audio_path):
+    audio_path = safe_join(SAVE_AUDIO_ROOT, filename)
+    if audio_path is None:
+        return {"error": "无效的音频路径"}, 400
+    if not os.path.isfile(audio_path):
         print(f"音频文件不存在: {audio_path}", file=sys.stderr)
         return {"error": f"音频文件不存在: {audio_path}"}, 404
-    print(f"找到音频文件: {audio_path}, 返回文件", file=sys.stderr)
-    return send_file(audio_path, mimetype='audio/wav')
+    fmt = request.args.get('format')
+    mimetype = 'audio/wav'
+    if fmt:
+        if fmt not in AUDIO_FORMATS:
+            return {"error": f"不支持的音频格式: {fmt}"}, 400
+        try:
+            audio_path = audio_variants.get(audio_path, fmt)
+            mimetype = AUDIO_FORMATS[fmt][1]
+            # 合成结果缓存文件的压缩副本与缓存条目一起计入 synthesis_cache 容量并按 LRU 淘汰
+            synthesis_cache.track(audio_path)
+        except VariantError as e:
+            print(f"音频转码失败，返回原文件: {audio_path}: {str(e)}", file=sys.stderr)
+    # conditional=True 时由 werkzeug 处理 If-None-Match、Range 和 If-Range；
+    # 文件经 wsgi.file_wrapper（服务器支持时为 sendfile）或 X-Sendfile 发送，不经 Python 拷贝
+    storage_janitor.touch(audio_path)
+    response = send_file(audio_path, mimetype=mimetype, conditional=True, etag=file_etag(audio_path),
+                         max_age=AUDIO_CACHE_MAX_AGE)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+# API：查看存储配额清理统计（累计释放字节数、最近一次清理报告）
+@app.route('/storage_gc/stats', methods=['GET'])
+def storage_gc_stats():
+    return jsonify(storage_janitor.stats())
+
+# API：立即执行一次存储清理，dry_run=1 时只返回将删除的条目
+@app.route('/storage_gc/run', methods=['POST'])
+def storage_gc_run():
+    return jsonify(storage_janitor.run(dry_run=request.args.get('dry_run') == '1'))
+
+# API：查看音频压缩副本的命中与转码统计
+@app.route('/audio_variant_stats', methods=['GET'])
+def audio_variant_stats():
+    return jsonify(audio_variants.stats())
 
 # API：上传复刻音色音频
 @app.route('/upload_voice_clone_audio', methods=['POST'])
@@ -223,41 +837,9 @@ def upload_voice_clone_audio():
             'error': f'文件保存失败: {str(e)}'
         }), 500
 
-    return jsonify({'status': 'success', 'file_path': file_path})
-
-    # 生成唯一输出文件名
-    output_filename = f"clone_{int(time.time())}.wav"
-    output_path = os.path.join(SAVE_AUDIO_ROOT, output_filename)
-
-    # 调用 voice.py 执行克隆
-    conda_env_name = "asr_infer_env"
-    conda_activate = "/home/believe/anaconda3/bin/activate"
-    cmd = (
-        f'. "{conda_activate}" {conda_env_name} && '
-        f'python voice.py "{model}" "{audio_path}" "{text}" "{lang_tip}" "{output_path}"'
-    )
-
-    with process_lock:
-        if tts_process and tts_process.poll() is None:
-            emit('voice_clone_result', {'error': '已有克隆任务在进行中'})
-            return
-
-        try:
-            tts_process = subprocess.Popen(
-                ["/bin/bash", "-c", cmd],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8'
-            )
-            emit('voice_clone_result', {'text': '克隆任务已启动'})
-        except Exception as e:
-            emit('voice_clone_result', {'error': f'启动克隆失败: {str(e)}'})
-
 # API：VITS模型训练
 @app.route('/vits_train', methods=['POST'])
 def vits_train():
-    global tts_train_process
     data = request.get_json()
     dataset_path = data.get("dataset_path")
     epochs = data.get("epochs", 20)
@@ -288,64 +870,42 @@ def vits_train():
         f'--lr {lr} --device {"cuda" if use_gpu else "cpu"} --model_dir "{model_dir}"'
     )
 
+    job, position = submit_job('vits_train', run_vits_train, cmd, priority=PRIORITY_TRAINING,
+                               meta={'model_dir': model_dir, 'dataset_path': dataset_path})
+    job_logs.channel('vits_train', job.id)
+    print(f"提交 VITS 训练: {cmd}", file=sys.stderr)
+    return jsonify({"status": "训练已启动" if job.state == 'running' else "训练已排队", "model_dir": model_dir,
+                    "job_id": job.id, "position": position})
+
+# 后台执行 VITS 训练，输出写入训练日志流
+def run_vits_train(job, cmd):
+    log = job_logs.channel('vits_train', job.id)
+    metrics = training_metrics.start(job.id, kind='vits_train', **job.meta)
+
+    def on_line(line, is_err):
+        print(f"VITS 训练{'错误' if is_err else '输出'}: {line}", file=sys.stderr)
+        log.publish(line)
+        training_metrics.record(metrics, line)
+
+    return_code = None
     try:
-        with process_lock:
-            if tts_train_process and tts_train_process.poll() is None:
-                return jsonify({"error": "已有训练进程在运行"}), 400
-            tts_train_process = subprocess.Popen(
-                ["/bin/bash", "-c", cmd],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8'
-            )
-        print(f"启动 VITS 训练: {cmd}", file=sys.stderr)
-        threading.Thread(target=read_vits_train_output, args=(tts_train_process, model_dir), daemon=True).start()
-        return jsonify({"status": "训练已启动", "model_dir": model_dir})
-    except Exception as e:
-        return jsonify({"error": f"启动训练失败：{str(e)}"}), 500
-
-# 添加 VITS 训练日志读取
-def read_vits_train_output(process, model_dir):
-    while process and process.poll() is None:
-        output = process.stdout.readline().strip()
-        error = process.stderr.readline().strip()
-        if output:
-            print(f"VITS 训练输出: {output}", file=sys.stderr)
-            vits_train_log_queue.put(output)
-        if error:
-            print(f"VITS 训练错误: {error}", file=sys.stderr)
-            vits_train_log_queue.put(error)
-    stdout, stderr = process.communicate()
-    if stdout:
-        for line in stdout.splitlines():
-            line = line.strip()
-            if line:
-                vits_train_log_queue.put(line)
-    if stderr:
-        for line in stderr.splitlines():
-            line = line.strip()
-            if line:
-                vits_train_log_queue.put(line)
-    vits_train_log_queue.put("[训练完成]")
-
-
-# API：停止VITS模型训练
+        return_code = job.run_process(["/bin/bash", "-c", cmd], on_line, env=dataset_env(job.meta.get('dataset_path')))
+    finally:
+        # 训练结束（包括失败或停止后留下的检查点）立即更新模型注册表，不等下一次轮询
+        model_registry.refresh(SAVE_TTS_TRAIN_ROOT, os.path.basename(job.meta['model_dir']))
+        log.close("[训练已停止]" if job.cancel_requested else "[训练完成]")
+        metrics.finish('cancelled' if job.cancel_requested else ('done' if return_code == 0 else 'failed'))
+
+# API：停止VITS模型训练（可指定 job_id，否则停止全部 VITS 训练任务）
 @app.route('/vits_stop_train', methods=['POST'])
 def vits_stop_train():
-    with process_lock:
-        global tts_train_process
-        if tts_train_process:
-            tts_train_process.terminate()
-            tts_train_process = None
-            return jsonify({"status": "训练已停止"})
-        else:
-            return jsonify({"error": "没有正在运行的训练进程"}), 400
+    if cancel_jobs('vits_train', (request.get_json(silent=True) or {}).get('job_id')):
+        return jsonify({"status": "训练已停止"})
+    return jsonify({"error": "没有正在运行的训练进程"}), 400
 
 # API：VITS模型测试
 @app.route('/vits_test', methods=['POST'])
 def vits_test():
-    global tts_test_process
     data = request.get_json()
     model_name = data.get("model_name")
     text = data.get("text")
@@ -374,125 +934,143 @@ def vits_test():
     output_filename = f"test_{uuid.uuid4().hex}.wav"
     output_path = os.path.join(SAVE_AUDIO_ROOT, output_filename)
 
-    conda_env_name = "voice"
-    conda_activate = "/home/believe/anaconda3/bin/activate"
-    if not os.path.exists(conda_activate):
-        return jsonify({"error": f"Anaconda 激活脚本未找到：{conda_activate}"}), 400
+    if not os.path.exists(CONDA_ACTIVATE):
+        return jsonify({"error": f"Anaconda 激活脚本未找到：{CONDA_ACTIVATE}"}), 400
+
+    segments = segment_text(text) if len(text) >= TTS_LONG_TEXT_MIN_CHARS else []
+    if len(segments) <= 1:
+        segments = [text]
+    workers = min(TTS_PARALLEL_WORKERS, len(segments))
+    job, position = submit_job('vits_test', run_vits_test, segments, model_path, tokenizer_path, speech_rate,
+                               volume, output_path, workers, priority=PRIORITY_TEST, cpu=workers,
+                               meta={'audio_path': output_filename, 'model_dir': model_dir})
+    job_logs.channel('vits_test', job.id)
+    return jsonify({"status": "测试已启动" if job.state == 'running' else "测试已排队", "audio_path": output_filename,
+                    "segments": len(segments), "job_id": job.id, "position": position})
+
+# 后台执行 VITS 测试；长文本分段后并行运行多个 tts_test.py，再按标点插入停顿、交叉淡化拼接
+def run_vits_test(job, segments, model_path, tokenizer_path, speech_rate, volume, output_path, workers):
+    log = job_logs.channel('vits_test', job.id)
+    work_dir = tempfile.mkdtemp(prefix='vits_test_')
+    started = time.time()
+    # 多段并行时按并行度均分计算线程，单段合成不限制
+    limit = f'OMP_NUM_THREADS={TTS_THREADS_PER_WORKER} ' if workers > 1 else ''
+
+    def synthesize(index, segment):
+        segment_path = output_path if len(segments) == 1 else os.path.join(work_dir, f"segment_{index:04d}.wav")
+        prefix = f"[段 {index + 1}/{len(segments)}] " if len(segments) > 1 else ''
+        cmd = (
+            f'. "{CONDA_ACTIVATE}" voice && {limit}python tts_test.py '
+            f'--model_path {shlex.quote(model_path)} --tokenizer_path {shlex.quote(tokenizer_path)} '
+            f'--text {shlex.quote(segment.strip())} --speech_rate {speech_rate} --volume {volume} '
+            f'--output_path {shlex.quote(segment_path)}'
+        )
 
-    cmd = (
-        f'. "{conda_activate}" {conda_env_name} && python tts_test.py '
-        f'--model_path "{model_path}" --tokenizer_path "{tokenizer_path}" '
-        f'--text "{text}" --speech_rate {speech_rate} --volume {volume} '
-        f'--output_path "{output_path}"'
-    )
+        def on_line(line, is_err):
+            print(f"VITS 测试{'错误' if is_err else '输出'}: {line}", file=sys.stderr)
+            log.publish(prefix + line)
+
+        return_code = job.run_process(["/bin/bash", "-c", cmd], on_line)
+        job.check_cancelled()
+        if return_code != 0 or not os.path.exists(segment_path):
+            raise RuntimeError(f"第 {index + 1} 段合成失败 (退出码: {return_code})")
+        return segment_path
+
+    def synthesize_all():
+        if len(segments) == 1:
+            synthesize(0, segments[0])
+            return output_path
+        log.publish(f"长文本分为 {len(segments)} 段，并行度 {workers}")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            paths = list(executor.map(synthesize, range(len(segments)), segments))
+        duration = join_wavs(paths, [pause_after(segment) for segment in segments], output_path)
+        message = f"拼接完成：音频 {duration:.1f} 秒，耗时 {time.time() - started:.1f} 秒"
+        print(f"VITS 长文本测试{message}", file=sys.stderr)
+        log.publish(message)
+        return output_path
 
     try:
-        with process_lock:
-            if tts_test_process and tts_test_process.poll() is None:
-                return jsonify({"error": "已有测试进程在运行"}), 400
-            tts_test_process = subprocess.Popen(
-                ["/bin/bash", "-c", cmd],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8'
-            )
-        print(f"启动 VITS 测试: {cmd}", file=sys.stderr)
-        threading.Thread(target=read_vits_test_output, args=(tts_test_process, output_filename), daemon=True).start()
-        return jsonify({"status": "测试已启动", "audio_path": output_filename})
+        # 测试期间持有模型目录的引用，模型在此期间被删除或替换时旧文件延迟删除
+        with model_refs.hold(job.meta['model_dir']):
+            return synthesize_all()
     except Exception as e:
-        return jsonify({"error": f"启动测试失败：{str(e)}"}), 500
-
-# 添加 VITS 测试日志读取
-def read_vits_test_output(process, output_filename):
-    print(f"开始读取 VITS 测试输出: {output_filename}", file=sys.stderr)
-    while process and process.poll() is None:
-        output = process.stdout.readline().strip()
-        error = process.stderr.readline().strip()
-        if output:
-            print(f"VITS 测试输出: {output}", file=sys.stderr)
-            vits_test_log_queue.put(output)
-        if error:
-            print(f"VITS 测试错误: {error}", file=sys.stderr)
-            vits_test_log_queue.put(error)
-    stdout, stderr = process.communicate()
-    if stdout:
-        for line in stdout.splitlines():
-            line = line.strip()
-            if line:
-                print(f"VITS 测试输出(剩余): {line}", file=sys.stderr)
-                vits_test_log_queue.put(line)
-    if stderr:
-        for line in stderr.splitlines():
-            line = line.strip()
-            if line:
-                print(f"VITS 测试错误(剩余): {line}", file=sys.stderr)
-                vits_test_log_queue.put(line)
-    vits_test_log_queue.put("[测试完成]")
-    print(f"VITS 测试日志流结束: {output_filename}", file=sys.stderr)
+        if not job.cancel_requested:
+            print(f"VITS 测试失败: {str(e)}", file=sys.stderr)
+            log.publish(f"测试失败：{str(e)}")
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        log.close("[测试完成]")
+
+# SSE 日志流：默认跟随该类最新任务，可用 ?job_id= 指定任务，断线重连按 Last-Event-ID 续传
+def job_log_response(kind, on_line=None):
+    stream = job_logs.sse(
+        kind,
+        job_id=request.args.get('job_id'),
+        last_event_id=request.headers.get('Last-Event-ID') or request.args.get('last_event_id'),
+        on_line=on_line
+    )
+    return Response(stream, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 # API：获取VITS模型训练日志
 @app.route('/vits_train_log', methods=['GET'])
 def vits_train_log_endpoint():
-    def stream():
-        while True:
-            log = vits_train_log_queue.get()
-            yield f"data: {log}\n\n"
-            if log in ("[训练完成]", "[训练已停止]"):
-                break
-    return Response(stream(), mimetype='text/event-stream')
+    return job_log_response('vits_train')
 
 # API：获取VITS模型测试日志
 @app.route('/vits_test_log', methods=['GET'])
 def vits_test_log_endpoint():
     print("客户端连接到 /vits_test_log", file=sys.stderr)
-    def stream():
-        try:
-            while True:
-                log = vits_test_log_queue.get()
-                print(f"发送测试日志: {log}", file=sys.stderr)
-                yield f"data: {log}\n\n"
-                if log == "[测试完成]":
-                    break
-        except GeneratorExit:
-            print("客户端断开 /vits_test_log 连接", file=sys.stderr)
-    return Response(stream(), mimetype='text/event-stream')
-
-# WebSocket：启动实时识别子进程
+    return job_log_response('vits_test', on_line=lambda log: print(f"发送测试日志: {log}", file=sys.stderr))
+
+# WebSocket：启动实时识别会话
 @socketio.on('start_recognition_process')
 def start_recognition_process(data):
-    global recognition_process
     model = data.get('model')
     if not model:
         emit('recognition_result', {'error': '未选择模型'})
         print('错误：未选择模型', file=sys.stderr)
         return
 
-    conda_env_name = "asr_infer_env"
-    conda_activate = "/home/believe/anaconda3/bin/activate"
-    if not os.path.exists(conda_activate):
-        emit('recognition_result', {'error': f'Anaconda 激活脚本未找到：{conda_activate}'})
-        print(f'错误：Anaconda 激活脚本未找到：{conda_activate}', file=sys.stderr)
+    if not os.path.exists(CONDA_ACTIVATE):
+        emit('recognition_result', {'error': f'Anaconda 激活脚本未找到：{CONDA_ACTIVATE}'})
+        print(f'错误：Anaconda 激活脚本未找到：{CONDA_ACTIVATE}', file=sys.stderr)
+        return
+
+    # 客户端可按会话覆盖 VAD 设置，例如 {"vad": {"enabled": false}} 或 {"vad": {"hangover_ms": 600}}
+    vad = data.get('vad') or {}
+    try:
+        sample_rate = int(data.get('sample_rate', 16000))
+        if not 8000 <= sample_rate <= 48000:
+            raise ValueError(f'采样率必须在 8000 到 48000 之间: {sample_rate}')
+        if not isinstance(vad, dict):
+            raise ValueError('VAD 设置必须是对象')
+        vad_options = {}
+        if 'enabled' in vad:
+            vad_options['enabled'] = bool(vad['enabled'])
+        for key in ('hangover_ms', 'preroll_ms'):
+            if key in vad:
+                value = int(vad[key])
+                if not 0 <= value <= 5000:
+                    raise ValueError(f'{key} 必须在 0 到 5000 毫秒之间: {value}')
+                vad_options[key] = value
+    except (TypeError, ValueError) as e:
+        emit('recognition_result', {'error': f'参数无效：{str(e)}'})
+        print(f'错误：实时识别参数无效：{str(e)}', file=sys.stderr)
         return
 
-    cmd = f'. "{conda_activate}" {conda_env_name} && python recognition_seq2seq.py "{model}"'
-    
     try:
-        if recognition_process and recognition_process.poll() is None:
-            emit('recognition_result', {'error': '已有正在运行的识别进程'})
-            print('错误：已有正在运行的识别进程', file=sys.stderr)
-            return
-        recognition_process = subprocess.Popen(
-            ["/bin/bash", "-c", cmd],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8'
+        session = realtime_sessions.start(
+            request.sid, model,
+            audio_format=data.get('format', 'float32'),
+            sample_rate=sample_rate,
+            vad_options=vad_options
         )
         emit('recognition_result', {'text': '实时识别子进程启动成功'})
-        print(f'实时识别子进程启动成功 (PID: {recognition_process.pid})', file=sys.stderr)
-        socketio.start_background_task(read_recognition_output)
+        print(f'实时识别会话已启动 (sid: {request.sid}, 模型: {model}, 流: {session.stream_id})', file=sys.stderr)
+    except SessionError as e:
+        emit('recognition_result', {'error': str(e)})
+        print(f'错误：{str(e)}', file=sys.stderr)
     except Exception as e:
         emit('recognition_result', {'error': f'子进程启动失败：{str(e)}'})
         print(f'子进程启动失败：{str(e)}', file=sys.stderr)
@@ -500,17 +1078,11 @@ def start_recognition_process(data):
 # WebSocket：处理麦克风音频数据
 @socketio.on('audio_data')
 def handle_audio_data(data):
-    global recognition_process
-    if not recognition_process or recognition_process.poll() is not None:
-        emit('recognition_result', {'error': '实时识别进程未运行'})
-        print('错误：实时识别进程未运行', file=sys.stderr)
-        return
     try:
-        # 假设前端发送的是逗号分隔的浮点数字符串
-        audio_str = ','.join(map(str, data))
-        recognition_process.stdin.write(audio_str + '\n')
-        recognition_process.stdin.flush()
-        print(f'发送音频块成功，长度: {len(data)}', file=sys.stderr)
+        realtime_sessions.feed(request.sid, data)
+    except SessionError as e:
+        emit('recognition_result', {'error': str(e)})
+        print(f'错误：{str(e)}', file=sys.stderr)
     except Exception as e:
         emit('recognition_result', {'error': f'音频处理失败：{str(e)}'})
         print(f'音频处理失败：{str(e)}', file=sys.stderr)
@@ -518,37 +1090,18 @@ def handle_audio_data(data):
 # WebSocket：停止实时识别
 @socketio.on('stop_recognition')
 def stop_recognition():
-    global recognition_process
-    if recognition_process and recognition_process.poll() is None:
-        try:
-            recognition_process.stdin.write("END\n")
-            recognition_process.stdin.flush()
-            recognition_process.stdin.close()
-            stdout, stderr = recognition_process.communicate(timeout=2)
-            if stdout:
-                print(f'识别子进程最终输出: {stdout}', file=sys.stderr)
-                socketio.emit('recognition_result', {'text': stdout.strip()})
-            if stderr:
-                print(f'识别子进程最终错误: {stderr}', file=sys.stderr)
-                socketio.emit('recognition_result', {'error': stderr.strip()})
-            emit('recognition_result', {'text': '实时识别已停止'})
-            print('实时识别已停止', file=sys.stderr)
-        except subprocess.TimeoutExpired:
-            recognition_process.kill()
-            emit('recognition_result', {'text': '实时识别强制终止'})
-            print('实时识别强制终止', file=sys.stderr)
-        except Exception as e:
-            emit('recognition_result', {'error': f'停止识别失败：{str(e)}'})
-            print(f'停止识别失败：{str(e)}', file=sys.stderr)
-        recognition_process = None
-    else:
+    if not realtime_sessions.stop(request.sid):
         emit('recognition_result', {'error': '无正在运行的识别进程'})
         print('错误：无正在运行的识别进程', file=sys.stderr)
 
+# WebSocket：客户端断开时结束其识别会话
+@socketio.on('disconnect')
+def handle_disconnect():
+    realtime_sessions.stop(request.sid)
+
 # API：启动训练
 @app.route('/start_training', methods=['POST'])
 def start_training():
-    global training_process
     data = request.json
     model_path = os.path.join(TRAIN_MODEL_ROOT, data.get('model'))
     dataset_path = data.get('dataset_path')
@@ -559,79 +1112,81 @@ def start_training():
     if not os.path.exists(dataset_path):
         return jsonify({"error": "无效的数据集路径"}), 400
     
-    with process_lock:
-        if training_process is not None and training_process.poll() is None:
-            return jsonify({"error": "训练已经在运行"}), 400
-        
-        cmd = [
-            "conda", "run", "-n", "asr_train_env", "--no-capture-output", "python", "train.py",
-            "--model_path", model_path,
-            "--dataset_path", dataset_path,
-            "--output_dir", SAVE_MODEL_ROOT,
-            "--per_device_train_batch_size", str(training_params.get('per_device_train_batch_size', 2)),
-            "--gradient_accumulation_steps", str(training_params.get('gradient_accumulation_steps', 1)),
-            "--num_train_epochs", str(training_params.get('num_train_epochs', 1)),
-            "--learning_rate", str(training_params.get('learning_rate', 1e-5)),
-            "--fp16", str(training_params.get('fp16', False)).lower()
-        ]
-        
-        def run_training():
-            global training_process
-            training_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=1,
-                text=True,
-                encoding="utf-8"
-            )
-            def read_stream(stream):
-                for line in iter(stream.readline, ''):
-                    log_queue.put(line.strip())
-                stream.close()
-            t1 = threading.Thread(target=read_stream, args=(training_process.stdout,))
-            t2 = threading.Thread(target=read_stream, args=(training_process.stderr,))
-            t1.start()
-            t2.start()
-            training_process.wait()
-            t1.join()
-            t2.join()
-            log_queue.put("[训练完成]")
-        
-        threading.Thread(target=run_training, daemon=True).start()
-        return jsonify({"status": "success", "message": "训练已开始"})
+    cmd = [
+        "conda", "run", "-n", "asr_train_env", "--no-capture-output", "python", "train.py",
+        "--model_path", model_path,
+        "--dataset_path", dataset_path,
+        "--output_dir", SAVE_MODEL_ROOT,
+        "--per_device_train_batch_size", str(training_params.get('per_device_train_batch_size', 2)),
+        "--gradient_accumulation_steps", str(training_params.get('gradient_accumulation_steps', 1)),
+        "--num_train_epochs", str(training_params.get('num_train_epochs', 1)),
+        "--learning_rate", str(training_params.get('learning_rate', 1e-5)),
+        "--fp16", str(training_params.get('fp16', False)).lower()
+    ]
+
+    job, position = submit_job('asr_train', run_training, cmd, priority=PRIORITY_TRAINING,
+                               meta={'model': data.get('model'), 'dataset_path': dataset_path})
+    job_logs.channel('asr_train', job.id)
+    return jsonify({"status": "success", "message": "训练已开始" if job.state == 'running' else "训练已排队",
+                    "job_id": job.id, "position": position})
+
+# 后台执行 ASR 训练，输出写入训练日志流
+def run_training(job, cmd):
+    log = job_logs.channel('asr_train', job.id)
+    metrics = training_metrics.start(job.id, kind='asr_train', **job.meta)
+
+    def on_line(line, is_err):
+        log.publish(line)
+        training_metrics.record(metrics, line)
+
+    return_code = None
+    try:
+        with model_refs.hold(os.path.join(TRAIN_MODEL_ROOT, job.meta['model'])):
+            return_code = job.run_process(cmd, on_line, env=dataset_env(job.meta.get('dataset_path')))
+    finally:
+        log.close("[训练已停止]" if job.cancel_requested else "[训练完成]")
+        metrics.finish('cancelled' if job.cancel_requested else ('done' if return_code == 0 else 'failed'))
 
 @app.route('/stop_training', methods=['POST'])
 def stop_training():
-    global training_process
-    with process_lock:
-        if training_process is None or training_process.poll() is not None:
-            return jsonify({"message": "没有正在运行的训练进程"})
-        try:
-            training_process.terminate()
-            training_process.wait(timeout=5)
-            log_queue.put("[训练已停止]")
-            return jsonify({"message": "训练已停止"})
-        except Exception as e:
-            return jsonify({"error": f"停止训练失败：{str(e)}"}), 500
-        finally:
-            training_process = None
-
-def stream_logs():
-    while True:
-        log = log_queue.get()
-        yield f"data: {log}\n\n"
-        if log in ("[训练完成]", "[训练已停止]"):
-            break
+    if not cancel_jobs('asr_train', (request.get_json(silent=True) or {}).get('job_id')):
+        return jsonify({"message": "没有正在运行的训练进程"})
+    return jsonify({"message": "训练已停止"})
 
 @app.route('/stream_logs', methods=['GET'])
 def stream_logs_endpoint():
-    return Response(stream_logs(), mimetype='text/event-stream')
+    return job_log_response('asr_train')
+
+# API：训练指标记录列表（按开始时间倒序）
+@app.route('/training_metrics', methods=['GET'])
+def list_training_metrics():
+    return jsonify(training_metrics.list_runs())
+
+# API：训练指标时序；fields 为逗号分隔的字段名，width 为图表像素宽度（按 min/max 抽稀）
+@app.route('/training_metrics/<run_id>', methods=['GET'])
+def get_training_metrics(run_id):
+    run = training_metrics.get(run_id)
+    if run is None:
+        return jsonify({'error': '训练指标不存在'}), 404
+    fields = [f for f in request.args.get('fields', 'loss').split(',') if f]
+    x_field = request.args.get('x', 'step')
+    invalid = [f for f in fields + [x_field] if f not in METRIC_FIELDS]
+    if invalid:
+        return jsonify({'error': f'未知字段：{", ".join(invalid)}'}), 400
+    width = max(1, min(int(request.args.get('width', 800)), 10000))
+    return jsonify({
+        'summary': run.summary(),
+        'series': {field: run.series(field, x_field, width) for field in fields},
+    })
+
+# API：各任务日志缓冲区状态
+@app.route('/log_stats', methods=['GET'])
+def log_stats():
+    return jsonify(job_logs.stats())
 
 # WebSocket：启动语音合成
 @socketio.on('start_tts')
 def start_tts(data):
-    global tts_process
     model = data.get('model')
     text = data.get('text')
     params = data.get('params', {})
@@ -643,161 +1198,113 @@ def start_tts(data):
     # 直接拼接模型路径
     model_path = os.path.join(TTS_MODEL_ROOT, model)
 
-    conda_env_name = "tts_new_env"
-    conda_activate = "/home/believe/anaconda3/bin/activate"
-    if not os.path.exists(conda_activate):
-        emit('tts_result', {'error': f'Anaconda 激活脚本未找到：{conda_activate}'})
-        print(f'错误：Anaconda 激活脚本未找到：{conda_activate}', file=sys.stderr)
+    if not os.path.exists(CONDA_ACTIVATE):
+        emit('tts_result', {'error': f'Anaconda 激活脚本未找到：{CONDA_ACTIVATE}'})
+        print(f'错误：Anaconda 激活脚本未找到：{CONDA_ACTIVATE}', file=sys.stderr)
         return
 
-    output_filename = f"output_{int(time.time())}.wav"
-    output_path = os.path.join(SAVE_AUDIO_ROOT, output_filename)
-    cmd = f'. "{conda_activate}" {conda_env_name} && python speech_synthesis.py "{model_path}" "{text}" {params.get("speech_rate", 1.0)} {params.get("volume", 1.0)} "{params.get("pitch", "normal")}" "{params.get("emotion_tone", "calm")}" "{params.get("voice", "zhiyan_emo")}" "{output_path}"'
+    stream = bool(data.get('stream', False))
+    sid = request.sid
+    previous = scheduler.get(tts_requests.get(sid))
+    if previous is not None and previous.state in ('queued', 'running'):
+        emit('tts_result', {'error': '已有正在运行的语音合成任务'})
+        print('错误：已有正在运行的语音合成任务', file=sys.stderr)
+        return
+
+    long_text = not stream and len(text) >= TTS_LONG_TEXT_MIN_CHARS
+    job, position = submit_job('tts', run_tts, sid, model, model_path, text, params, stream, long_text,
+                               cpu=TTS_PARALLEL_WORKERS if long_text else 1, owner=sid)
+    tts_requests[sid] = job.id
+    emit('tts_result', {'text': '开始语音合成' if position == 0 else f'语音合成已排队，前面还有 {position} 个任务',
+                        'job_id': job.id, 'position': position})
+    print('开始语音合成', file=sys.stderr)
+
+# 后台执行语音合成：相同模型、文本和参数的结果直接取自合成缓存，同时到达的相同请求只合成一次；
+# 流式模式下每句合成完成即以二进制 tts_chunk 事件推送 16bit PCM，最后仍返回完整文件
+def run_tts(job, sid, model, model_path, text, params, stream=False, long_text=False):
+    streamed = []
+
+    def on_chunk(index, total, sample_rate, pcm):
+        if job.cancel_requested:
+            return  # 客户端已停止该任务，剩余分块不再推送
+        streamed.append(index)
+        socketio.emit('tts_chunk', {
+            'index': index,
+            'total': total,
+            'sample_rate': sample_rate,
+            'format': 'int16',
+            'audio': pcm,
+        }, to=sid)
+
+    def synthesize(output_path):
+        with model_refs.hold(model_path):
+            if long_text:
+                tts_service.synthesize_long(model, model_path, text, params, output_path, TTS_PARALLEL_WORKERS)
+            else:
+                tts_service.synthesize(model, model_path, text, params, output_path, on_chunk if stream else None)
 
     try:
-        if tts_process and tts_process.poll() is None:
-            emit('tts_result', {'error': '已有正在运行的语音合成进程'})
-            print('错误：已有正在运行的语音合成进程', file=sys.stderr)
-            return
-        print(f"执行命令: {cmd}", file=sys.stderr)
-        tts_process = subprocess.Popen(
-            ["/bin/bash", "-c", cmd],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8'
-        )
-        emit('tts_result', {'text': '开始语音合成'})
-        print('开始语音合成', file=sys.stderr)
-        socketio.start_background_task(read_tts_output, output_filename)
+        cache_path = synthesis_cache.path_for(model, text, params)
+        output_path, cached = synthesis_cache.get_or_create(cache_path, synthesize)
+        if job.cancel_requested:
+            return  # 客户端已停止该任务
+        if cached:
+            print(f"语音合成缓存命中: {model} -> {output_path}", file=sys.stderr)
+        if stream and not streamed:
+            # 缓存命中或共享了其他请求的结果：整段音频作为一个分块推送
+            with wave.open(output_path, 'rb') as wav:
+                on_chunk(0, 1, wav.getframerate(), wav.readframes(wav.getnframes()))
+        output_filename = os.path.relpath(output_path, SAVE_AUDIO_ROOT)
+        socketio.emit('tts_result', {'text': f'音频已保存到 {output_path}', 'audio': output_filename,
+                                     'cached': cached}, to=sid)
     except Exception as e:
-        error_msg = f'语音合成子进程启动失败：{str(e)}'
-        emit('tts_result', {'error': error_msg})
+        error_msg = f'语音合成失败：{str(e)}'
         print(error_msg, file=sys.stderr)
+        if not job.cancel_requested:
+            socketio.emit('tts_result', {'error': error_msg}, to=sid)
+        raise
+    finally:
+        if tts_requests.get(sid) == job.id:
+            tts_requests.pop(sid, None)
 
 # WebSocket：停止语音合成
 @socketio.on('stop_tts')
 def stop_tts():
-    global tts_process
-    if tts_process and tts_process.poll() is None:
-        tts_process.terminate()
-        try:
-            tts_process.wait(timeout=2)
-            emit('tts_result', {'text': '语音合成已停止'})
-            print('语音合成已停止', file=sys.stderr)
-        except subprocess.TimeoutExpired:
-            tts_process.kill()
-            emit('tts_result', {'text': '语音合成强制终止'})
-            print('语音合成强制终止', file=sys.stderr)
-        tts_process = None
+    job_id = tts_requests.pop(request.sid, None)
+    if job_id and scheduler.cancel(job_id):
+        # 排队中的任务直接移除；常驻服务中的合成无法中断，结果到达后直接丢弃
+        emit('tts_result', {'text': '语音合成已停止'})
+        print('语音合成已停止', file=sys.stderr)
     else:
         emit('tts_result', {'error': '无正在运行的语音合成进程'})
         print('错误：无正在运行的语音合成进程', file=sys.stderr)
 
-# 异步读取实时识别输出
-def read_recognition_output():
-    global recognition_process
-    print(f"开始监控实时识别子进程 (recognition_seq2seq.py) 状态 (PID: {recognition_process.pid})", file=sys.stderr)
-    while recognition_process and recognition_process.poll() is None:
-        try:
-            output = recognition_process.stdout.readline().strip()
-            error = recognition_process.stderr.readline().strip()
-            if output:
-                print(f"实时识别子进程输出: {output}", file=sys.stderr)
-                socketio.emit('recognition_result', {'text': output})
-            if error:
-                print(f"实时识别子进程错误: {error}", file=sys.stderr)
-                socketio.emit('recognition_result', {'error': error})
-        except Exception as e:
-            print(f"读取实时识别子进程输出失败: {str(e)}", file=sys.stderr)
-            socketio.emit('recognition_result', {'error': f'读取识别输出失败：{str(e)}'})
-        time.sleep(0.1)
-    
-    if recognition_process:
-        return_code = recognition_process.poll()
-        print(f"实时识别子进程已终止 (PID: {recognition_process.pid}, 退出码: {return_code})", file=sys.stderr)
-        try:
-            stdout, stderr = recognition_process.communicate(timeout=2)
-            if stdout:
-                print(f"实时识别子进程最终输出: {stdout.strip()}", file=sys.stderr)
-                socketio.emit('recognition_result', {'text': stdout.strip()})
-            if stderr:
-                print(f"实时识别子进程最终错误: {stderr.strip()}", file=sys.stderr)
-                socketio.emit('recognition_result', {'error': stderr.strip()})
-        except subprocess.TimeoutExpired:
-            print("实时识别子进程通信超时，已强制终止", file=sys.stderr)
-            recognition_process.kill()
-            socketio.emit('recognition_result', {'text': '实时识别子进程通信超时，已强制终止'})
-        except Exception as e:
-            print(f"实时识别子进程通信失败: {str(e)}", file=sys.stderr)
-            socketio.emit('recognition_result', {'error': f'通信失败：{str(e)}'})
-        recognition_process = None
-
-
-
-# 异步读取语音合成输出
-def read_tts_output(output_filename):
-    global tts_process
-    # 忽略的非错误消息关键词
-    ignore_messages = [
-        "modelscope - INFO",
-        "modelscope - WARNING",
-        "FutureWarning",
-        "torch.load",
-        "weight_norm",
-        "WeightNorm.apply"  # 添加 WeightNorm.apply
-    ]
-    while tts_process and tts_process.poll() is None:
-        try:
-            output = tts_process.stdout.readline().strip()
-            error = tts_process.stderr.readline().strip()
-            if output:
-                print(f'语音合成输出: {output}', file=sys.stderr)
-                socketio.emit('tts_result', {'text': output, 'audio': output_filename})
-            if error and not any(msg in error for msg in ignore_messages):
-                print(f'语音合成错误: {error}', file=sys.stderr)
-                socketio.emit('tts_result', {'error': error})
-            elif error:
-                print(f'语音合成调试信息: {error}', file=sys.stderr)  # 仅记录调试信息
-        except Exception as e:
-            error_msg = f'读取语音合成输出失败：{str(e)}'
-            print(error_msg, file=sys.stderr)
-            socketio.emit('tts_result', {'error': error_msg})
-        time.sleep(0.01)
+# API：常驻语音合成服务状态与各模型冷/热请求耗时
+@app.route('/tts_stats', methods=['GET'])
+def tts_stats():
+    return jsonify(dict(tts_service.stats(), cache=synthesis_cache.stats()))
 
-    try:
-        stdout, stderr = tts_process.communicate(timeout=2)
-        return_code = tts_process.returncode
-        print(f'语音合成子进程结束，退出码: {return_code}', file=sys.stderr)
-        stdout_lines = [line.strip() for line in stdout.splitlines() if line.strip()]
-        stderr_lines = [line.strip() for line in stderr.splitlines() if line.strip()]
-        for line in stdout_lines:
-            print(f'语音合成最终输出: {line}', file=sys.stderr)
-            socketio.emit('tts_result', {'text': line, 'audio': output_filename})
-        for line in stderr_lines:
-            if not any(msg in line for msg in ignore_messages):
-                print(f'语音合成最终错误: {line}', file=sys.stderr)
-                socketio.emit('tts_result', {'error': line})
-            else:
-                print(f'语音合成最终调试信息: {line}', file=sys.stderr)
-        if return_code != 0:
-            error_msg = f'语音合成子进程失败，退出码: {return_code}'
-            print(error_msg, file=sys.stderr)
-            socketio.emit('tts_result', {'error': error_msg})
-    except Exception as e:
-        error_msg = f'读取语音合成最终输出失败：{str(e)}'
-        print(error_msg, file=sys.stderr)
-        socketio.emit('tts_result', {'error': error_msg})
-    finally:
-        tts_process = None
+# API：实时识别结果推送延迟统计
+@app.route('/realtime_stats', methods=['GET'])
+def realtime_stats():
+    stats = realtime_sessions.stats()
+    stats['emit_latency'] = recognition_latency.snapshot()
+    return jsonify(stats)
+
+
+
+# API：克隆参考音频与提示特征统计，以及常驻克隆工作进程状态
+@app.route('/voice_reference_stats', methods=['GET'])
+def voice_reference_stats():
+    return jsonify(dict(voice_references.stats(), workers=clone_pool.stats().get(CLONE_POOL_KEY, {})))
 
 @app.route('/list_voice_models', methods=['GET'])
 def list_voice_models():
     model_dir = TTS_VOICE_MODEL_ROOT  # 使用语音克隆模型路径
     try:
-        models = [d for d in os.listdir(model_dir) if os.path.isdir(os.path.join(model_dir, d))]
-        print(f"语音克隆模型列表: {models}", file=sys.stderr)
-        return jsonify(models)
+        if request.args.get('detail') == '1':
+            return jsonify(model_registry.list(model_dir))
+        return jsonify(model_registry.names(model_dir))
     except Exception as e:
         print(f"获取语音克隆模型列表失败: {str(e)}", file=sys.stderr)
         return jsonify({'error': str(e)}), 500
@@ -821,8 +1328,10 @@ def upload_clone_audio():
     
     try:
         file.save(file_path)
-        print(f"音频上传成功: {file_path}", file=sys.stderr)
-        return jsonify({"message": "音频上传成功", "path": file_path})
+        # 相同内容的参考音频只保留一份，之后的克隆请求可只传 voice_id
+        voice_id, file_path, existed = voice_references.add_reference(file_path)
+        print(f"音频上传成功: {file_path} (voice_id: {voice_id}, {'已存在' if existed else '新音色'})", file=sys.stderr)
+        return jsonify({"message": "音频上传成功", "path": file_path, "voice_id": voice_id})
     except Exception as e:
         print(f"上传失败: {str(e)}", file=sys.stderr)
         return jsonify({"error": f"上传失败：{str(e)}"}), 500
@@ -830,11 +1339,12 @@ def upload_clone_audio():
 # 新添加：启动语音克隆的 WebSocket 处理器
 @socketio.on('start_clone')
 def handle_start_clone(data):
-    global tts_process
     model_path = data.get('model_path')
     audio_path = data.get('audio_path')
     synth_text = data.get('synth_text')
     lang_tip = data.get('lang_tip', 'zh')
+    if data.get('voice_id'):
+        audio_path = voice_references.reference_path(data['voice_id']) or audio_path
 
     # 拼接完整模型路径
     model_full_path = os.path.join(TTS_VOICE_MODEL_ROOT, model_path)
@@ -849,50 +1359,101 @@ def handle_start_clone(data):
         emit('clone_result', {'error': f'音频路径 {audio_path} 不存在'})
         return
 
-    print(f"开始语音克隆: 模型={model_full_path}, 音频={audio_path}, 文本={synth_text}, 语言={lang_tip}", file=sys.stderr)
-
-    conda_env_name = "voice"
-    conda_activate = "/home/believe/anaconda3/bin/activate"
-    if not os.path.exists(conda_activate):
-        print(f"错误: Anaconda 激活脚本未找到: {conda_activate}", file=sys.stderr)
-        emit('clone_result', {'error': f'Anaconda 激活脚本未找到：{conda_activate}'})
+    if not os.path.exists(CONDA_ACTIVATE):
+        print(f"错误: Anaconda 激活脚本未找到: {CONDA_ACTIVATE}", file=sys.stderr)
+        emit('clone_result', {'error': f'Anaconda 激活脚本未找到：{CONDA_ACTIVATE}'})
         return
 
+    # 克隆任务交给后台队列执行，处理器立即返回任务 ID，进度和结果由工作线程推送给该会话
+    job, position = submit_job('clone', run_clone_job, request.sid, model_path, model_full_path, audio_path,
+                               synth_text, lang_tip, owner=request.sid, meta={'reference_path': audio_path})
+    print(f"语音克隆任务已排队: {job.id} (位置: {position})", file=sys.stderr)
+    emit('clone_result', {'text': f'语音克隆任务已排队，前面还有 {position} 个任务' if position else '语音克隆任务已提交',
+                          'job_id': job.id, 'position': position})
+
+# 后台执行语音克隆：交给常驻克隆工作进程，同一参考音频和模型版本的提示特征只编码一次
+def run_clone_job(job, sid, model_path, model_full_path, audio_path, synth_text, lang_tip):
+    def push(message):
+        socketio.emit('clone_result', dict(message, job_id=job.id), to=sid)
+
+    print(f"开始语音克隆: 模型={model_full_path}, 音频={audio_path}, 文本={synth_text}, 语言={lang_tip}", file=sys.stderr)
     output_filename = f"tts_output_{uuid.uuid4().hex}.wav"
     output_path = os.path.join(SAVE_AUDIO_ROOT, output_filename)
-    cmd = f'. "{conda_activate}" {conda_env_name} && python voice.py "{model_full_path}" "{audio_path}" "{synth_text}" "{lang_tip}" "{output_path}"'
-
-    try:
-        print(f"执行命令: {cmd}", file=sys.stderr)
-        tts_process = subprocess.Popen(
-            ["/bin/bash", "-c", cmd],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8'
-        )
-        emit('clone_result', {'text': '语音克隆任务已启动'})
-        while True:
-            output = tts_process.stdout.readline()
-            if output == '' and tts_process.poll() is not None:
-                break
-            if output:
-                print(f"克隆输出: {output.strip()}", file=sys.stderr)
-                emit('clone_result', {'text': output.strip()})
-
-        stderr_output = tts_process.stderr.read()
-        if tts_process.returncode != 0:
-            print(f"克隆失败: {stderr_output}", file=sys.stderr)
-            emit('clone_result', {'error': f'克隆失败：{stderr_output}'})
-            return
+    storage_janitor.touch(audio_path)
+    push({'text': '语音克隆任务已启动'})
+
+    with model_refs.hold(model_full_path):
+        info = model_registry.get(TTS_VOICE_MODEL_ROOT, model_path)
+        version = info['version'] if info is not None else directory_version(model_full_path)
+        digest = voice_references.digest_for(audio_path)
+        payload = {
+            'model_path': model_full_path,
+            'model_version': version,
+            'reference_path': audio_path,
+            'prompt_path': voice_references.prompt_path(digest, version),
+            'text': synth_text or '',
+            'instruct': lang_tip or '',
+            'output_path': output_path,
+        }
+        try:
+            result = clone_pool.submit(CLONE_POOL_KEY, payload)
+        except WorkerError as e:
+            result = {'error': str(e)}
 
+    # 常驻进程中的合成无法中途打断，取消时丢弃结果
+    if job.cancel_requested:
         if os.path.exists(output_path):
-            emit('clone_result', {'text': '语音克隆完成', 'audio_path': output_filename})
-        else:
-            emit('clone_result', {'error': '输出音频文件未生成'})
-    except Exception as e:
-        print(f"克隆异常: {str(e)}", file=sys.stderr)
-        emit('clone_result', {'error': f'克隆异常：{str(e)}'})
+            os.remove(output_path)
+        push({'text': '语音克隆已取消'})
+        return None
+    if 'error' in result:
+        print(f"克隆失败: {result['error']}", file=sys.stderr)
+        push({'error': f"克隆失败：{result['error']}"})
+        raise RuntimeError(result['error'])
+    if not os.path.exists(output_path):
+        push({'error': '输出音频文件未生成'})
+        raise RuntimeError('输出音频文件未生成')
+    print(f"语音克隆完成: {output_filename} (提示特征: {result.get('prompt_source')}, "
+          f"编码 {result.get('encode_seconds')} 秒, 合成 {result.get('synth_seconds')} 秒)", file=sys.stderr)
+    push({'text': '语音克隆完成', 'audio_path': output_filename, 'prompt_source': result.get('prompt_source')})
+    return output_filename
+
+# WebSocket：取消语音克隆任务（排队中或运行中）
+@socketio.on('cancel_clone')
+def handle_cancel_clone(data):
+    job_id = (data or {}).get('job_id')
+    job = scheduler.get(job_id)
+    if job is None or job.kind != 'clone' or job.owner != request.sid or not scheduler.cancel(job_id):
+        emit('clone_result', {'error': '无可取消的语音克隆任务', 'job_id': job_id})
+        return
+    if job.state == 'cancelled':
+        emit('clone_result', {'text': '语音克隆已取消', 'job_id': job_id})
+    print(f"语音克隆任务已取消: {job_id}", file=sys.stderr)
+
+# API：任务列表（可按 kind、state 过滤），包含排队位置和调度器剩余资源
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({
+        'scheduler': scheduler.stats(),
+        'jobs': scheduler.list_jobs(request.args.get('kind'), request.args.get('state')),
+    })
+
+# API：查询单个任务
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    info = job.info()
+    info['position'] = scheduler.position(job_id)
+    return jsonify(info)
+
+# API：取消排队中或运行中的任务
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not scheduler.cancel(job_id):
+        return jsonify({'error': '任务不存在或已结束'}), 400
+    return jsonify({'status': '任务已取消', 'job_id': job_id})
 
 if __name__ == '__main__':
     socketio.run(app, debug=True)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import os
+os.environ["PYTHONUNBUFFERED"] = "1"
+import sys
+import json
+import warnings
+
+# 常驻语音识别工作进程：启动时加载一次模型，之后通过 stdin/stdout 逐行 JSON 接收任务
+# 用法：python asr_worker.py <模型名>
+# 请求：{"id": "...", "audio_path": "..."}
+#       {"id": "...", "audio_paths": [...]}  批量请求，同一批在一次前向中解码
+# 响应：{"id": "...", "text": "..."} 或 {"id": "...", "error": "..."}
+#       {"id": "...", "results": [{"text": "..."} 或 {"error": "..."}, ...]}
+
+warnings.filterwarnings("ignore")
+
+MODEL_ROOT = "/home/believe/AI_Voice_Platform/models/ASR_models"
+
+# stdout 只用于协议消息，模型库的打印统一转到 stderr
+_protocol_out = sys.stdout
+sys.stdout = sys.stderr
+
+
+def send(message):
+    _protocol_out.write(json.dumps(message, ensure_ascii=False) + "\n")
+    _protocol_out.flush()
+
+
+def load_asr_pipeline(model):
+    from modelscope.pipelines import pipeline
+    from modelscope.utils.constant import Tasks
+
+    model_path = model if os.path.isabs(model) else os.path.join(MODEL_ROOT, model)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"模型目录不存在: {model_path}")
+    return pipeline(task=Tasks.auto_speech_recognition, model=model_path)
+
+
+def extract_text(result):
+    # 不同版本的 pipeline 返回 dict 或 [dict]
+    if isinstance(result, list):
+        return " ".join(extract_text(r) for r in result).strip()
+    if isinstance(result, dict):
+        return str(result.get("text", "")).strip()
+    return str(result).strip()
+
+
+def transcribe(asr, audio):
+    return extract_text(asr(input=audio))
+
+
+def transcribe_batch(asr, audios):
+    # 多段音频合并为一次前向；pipeline 不支持批量输入时逐条解码
+    if len(audios) == 1:
+        return [transcribe(asr, audios[0])]
+    try:
+        results = asr(input=list(audios))
+        if isinstance(results, list) and len(results) == len(audios):
+            return [extract_text(r) for r in results]
+    except Exception as e:
+        print(f"批量解码失败，改为逐条解码: {str(e)}", file=sys.stderr)
+    return [transcribe(asr, audio) for audio in audios]
+
+
+def transcribe_files(asr, paths):
+    # 批量请求：整批失败时逐条重试，单个文件的错误不影响其他文件
+    try:
+        return [{"text": text} for text in transcribe_batch(asr, paths)]
+    except Exception as e:
+        print(f"批量解码失败，逐条重试: {str(e)}", file=sys.stderr)
+    results = []
+    for path in paths:
+        try:
+            results.append({"text": transcribe(asr, path)})
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+
+def main():
+    if len(sys.argv) < 2:
+        send({"ready": False, "error": "缺少模型参数"})
+        sys.exit(1)
+    model = sys.argv[1]
+
+    try:
+        asr = load_asr_pipeline(model)
+    except Exception as e:
+        send({"ready": False, "error": f"模型加载失败: {str(e)}"})
+        sys.exit(1)
+    send({"ready": True, "model": model, "pid": os.getpid()})
+    print(f"ASR 工作进程就绪: {model} (PID: {os.getpid()})", file=sys.stderr)
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            send({"error": f"无效请求: {str(e)}"})
+            continue
+        job_id = job.get("id")
+        try:
+            if "audio_paths" in job:
+                send({"id": job_id, "results": transcribe_files(asr, job["audio_paths"])})
+            else:
+                send({"id": job_id, "text": transcribe(asr, job["audio_path"])})
+        except Exception as e:
+            send({"id": job_id, "error": str(e)})
+
+
+if __name__ == "__main__":
+    main()
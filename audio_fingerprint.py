@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dataset_ingest import transcript_path
+from feature_cache import read_samples
+from result_cache import audio_digest
+
+# 上传数据集的音频指纹去重：每条音频重采样到 8kHz 后取频谱峰值，
+# 相邻峰值两两组成 (f1, f2, Δt) 哈希，音频的指纹为哈希集合；
+# 完全相同的 PCM 按内容哈希判定，近似重复（重新编码、音量变化、轻微噪声）按指纹集合的 Jaccard 相似度判定
+# 倒排索引 哈希 -> 样本 在内存中维护，每个数据集的指纹另存一份到磁盘，重启后重新加载
+# 目录结构：<root>/<数据集 ID>.json（样本列表）
+#           <root>/<数据集 ID>.npy（全部样本的哈希首尾相接，长度见样本列表中的 hashes）
+
+SAMPLE_RATE = 8000
+N_FFT = 512
+HOP = 256
+BANDS = ((8, 16), (16, 32), (32, 64), (64, 128), (128, 257))
+FAN_OUT = 5
+MAX_DT = 63
+STOP_POSTING = 2000  # 出现在过多样本中的哈希不参与候选投票
+
+MODES = ('report', 'drop', 'link')
+REPORT_NAME = 'dedup_report.json'
+
+
+def fingerprint(path):
+    # 返回去重后的 uint32 哈希数组（已排序）
+    samples, sample_rate = read_samples(path)
+    if sample_rate != SAMPLE_RATE and len(samples):
+        positions = np.arange(0, len(samples), sample_rate / SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    if len(samples) < N_FFT:
+        samples = np.pad(samples, (0, N_FFT - len(samples)))
+    count = 1 + (len(samples) - N_FFT) // HOP
+    index = np.arange(N_FFT)[None, :] + HOP * np.arange(count)[:, None]
+    spectrum = np.log1p(np.abs(np.fft.rfft(samples[index] * np.hanning(N_FFT), axis=1)))
+
+    # 每帧每个频带取最大的频点，强于该帧各频带峰值均值的作为峰值
+    peak_bins = np.stack([low + spectrum[:, low:high].argmax(axis=1) for low, high in BANDS], axis=1)
+    peak_values = np.take_along_axis(spectrum, peak_bins, axis=1)
+    keep = (peak_values > peak_values.mean(axis=1, keepdims=True)) & (peak_values > 0.01)
+    times, band = np.nonzero(keep)
+    freqs = peak_bins[times, band]
+    if len(times) < 2:
+        return np.zeros(0, dtype=np.uint32)
+
+    hashes = []
+    for k in range(1, FAN_OUT + 1):
+        dt = times[k:] - times[:-k]
+        valid = (dt > 0) & (dt <= MAX_DT)
+        f1 = freqs[:-k][valid].astype(np.uint32)
+        f2 = freqs[k:][valid].astype(np.uint32)
+        hashes.append((f1 << 15) | (f2 << 6) | dt[valid].astype(np.uint32))
+    return np.unique(np.concatenate(hashes))
+
+
+class FingerprintIndex:
+    def __init__(self, root, near_threshold=0.4):
+        self.root = root
+        self.near_threshold = near_threshold
+        self.lock = threading.Lock()
+        self.samples = []     # 样本序号 -> {'dataset', 'path', 'digest', 'hashes'}，所属数据集删除后置为 None
+        self.by_digest = {}   # PCM 内容哈希 -> 样本序号
+        self.postings = {}    # 指纹哈希 -> [样本序号]
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith('.json'):
+                continue
+            dataset_id = name[:-5]
+            try:
+                with open(os.path.join(self.root, name), 'r', encoding='utf-8') as f:
+                    samples = json.load(f)
+                hashes = np.load(os.path.join(self.root, dataset_id + '.npy'))
+            except (OSError, ValueError):
+                continue
+            offset = 0
+            for sample in samples:
+                count = sample['hashes']
+                self._insert(sample, hashes[offset:offset + count])
+                offset += count
+
+    def _insert(self, sample, hashes):
+        # 调用方持有 self.lock（加载时除外）
+        number = len(self.samples)
+        self.samples.append(sample)
+        self.by_digest.setdefault(sample['digest'], number)
+        for value in hashes.tolist():
+            self.postings.setdefault(value, []).append(number)
+
+    def _sample_path(self, sample):
+        return os.path.join(sample['dataset'], sample['path'])
+
+    def _match(self, digest, hashes):
+        # 返回 (样本, 类型, 相似度)；已被删除的样本不作为匹配对象
+        number = self.by_digest.get(digest)
+        if number is not None and os.path.exists(self._sample_path(self.samples[number])):
+            return self.samples[number], 'exact', 1.0
+        if not len(hashes):
+            return None, None, 0.0
+        votes = Counter()
+        for value in hashes.tolist():
+            posting = self.postings.get(value)
+            if posting and len(posting) <= STOP_POSTING:
+                votes.update(posting)
+        for number, shared in votes.most_common(5):
+            sample = self.samples[number]
+            if sample is None:
+                continue
+            similarity = shared / float(len(hashes) + sample['hashes'] - shared)
+            if similarity < self.near_threshold:
+                break
+            if os.path.exists(self._sample_path(sample)):
+                return sample, 'near', round(similarity, 4)
+        return None, None, 0.0
+
+    def add_dataset(self, dataset_path, entries, mode='report', workers=4):
+        # 对清单中的有效样本计算指纹并与已有样本（含本数据集中排在前面的样本）比对；
+        # mode: report 只报告，drop 删除完全相同的样本，link 把完全相同的样本替换为指向已存副本的硬链接
+        # 直接修改 entries（重复样本加 duplicate_of，被删除的样本加 error），返回去重报告
+        if mode not in MODES:
+            raise ValueError(f"未知的去重方式: {mode}")
+        dataset_id = os.path.basename(os.path.normpath(dataset_path))
+        candidates = [e for e in entries if 'error' not in e]
+
+        def compute(entry):
+            path = os.path.join(dataset_path, entry['path'])
+            return audio_digest(path), fingerprint(path)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            prints = list(executor.map(compute, candidates))
+
+        report = {'dataset_path': dataset_path, 'mode': mode, 'checked': len(candidates),
+                  'exact': 0, 'near': 0, 'dropped': 0, 'linked': 0, 'duplicates': []}
+        stored = []
+        stored_hashes = []
+        with self.lock:
+            for entry, (digest, hashes) in zip(candidates, prints):
+                original, kind, similarity = self._match(digest, hashes)
+                if original is None:
+                    sample = {'dataset': dataset_path, 'path': entry['path'], 'digest': digest,
+                              'hashes': len(hashes)}
+                    self._insert(sample, hashes)
+                    stored.append(sample)
+                    stored_hashes.append(hashes)
+                    continue
+                report[kind] += 1
+                original_path = self._sample_path(original)
+                entry['duplicate_of'] = original_path
+                record = {'path': entry['path'], 'duplicate_of': original_path, 'kind': kind,
+                          'similarity': similarity, 'action': 'none'}
+                path = os.path.join(dataset_path, entry['path'])
+                # 近似重复可能是同一句话的不同录音，只报告不删除
+                if mode == 'drop' and kind == 'exact':
+                    self._drop(path)
+                    entry['error'] = '重复样本'
+                    record['action'] = 'dropped'
+                    report['dropped'] += 1
+                elif mode == 'link' and kind == 'exact' and self._link(original_path, path):
+                    record['action'] = 'linked'
+                    report['linked'] += 1
+                report['duplicates'].append(record)
+            self._save(dataset_id, stored, stored_hashes)
+        print(f"数据集去重: {dataset_path} 检查 {report['checked']} 条, 完全重复 {report['exact']} 条, "
+              f"近似重复 {report['near']} 条 (删除 {report['dropped']}, 硬链接 {report['linked']})",
+              file=sys.stderr)
+        return report
+
+    def _drop(self, path):
+        transcript = transcript_path(path)
+        os.remove(path)
+        if transcript is not None:
+            os.remove(transcript)
+
+    def _link(self, source, path):
+        # 同一文件系统内替换为硬链接；失败（跨设备等）时保留原文件
+        tmp_path = path + '.link'
+        try:
+            os.link(source, tmp_path)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"硬链接失败，保留原文件 {path}: {str(e)}", file=sys.stderr)
+            return False
+
+    def _save(self, dataset_id, samples, hashes):
+        if not samples:
+            return
+        np.save(os.path.join(self.root, dataset_id + '.npy'), np.concatenate(hashes).astype(np.uint32))
+        with open(os.path.join(self.root, dataset_id + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(samples, f, ensure_ascii=False)
+
+    def remove_dataset(self, dataset_path):
+        # 数据集删除后移除其指纹，内存索引中只去掉该数据集的样本
+        dataset_id = os.path.basename(os.path.normpath(dataset_path))
+        for suffix in ('.json', '.npy'):
+            path = os.path.join(self.root, dataset_id + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        with self.lock:
+            removed = set()
+            for number, sample in enumerate(self.samples):
+                if sample is not None and os.path.normpath(sample['dataset']) == os.path.normpath(dataset_path):
+                    removed.add(number)
+                    self.samples[number] = None
+            if not removed:
+                return
+            for value in list(self.postings):
+                posting = [number for number in self.postings[value] if number not in removed]
+                if posting:
+                    self.postings[value] = posting
+                else:
+                    del self.postings[value]
+            # 被删除样本的内容哈希改由其他数据集中最早的同内容样本接替
+            self.by_digest = {}
+            for number, sample in enumerate(self.samples):
+                if sample is not None:
+                    self.by_digest.setdefault(sample['digest'], number)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'samples': sum(1 for s in self.samples if s is not None),
+                'datasets': len({s['dataset'] for s in self.samples if s is not None}),
+                'hashes': len(self.postings),
+                'near_threshold': self.near_threshold,
+            }
+
+
+def write_report(dataset_path, report):
+    with open(os.path.join(dataset_path, REPORT_NAME), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False)
+
+
+def load_report(dataset_path):
+    try:
+        with open(os.path.join(dataset_path, REPORT_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
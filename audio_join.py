@@ -0,0 +1,75 @@
+import os
+import wave
+
+import numpy as np
+
+# 分段合成结果拼接：段间按结尾标点插入停顿，停顿两侧做短淡入淡出；
+# 停顿为 0（长句被硬切开）时两段首尾交叉淡化重叠，避免接缝处的爆音
+
+SENTENCE_PAUSE_MS = 300
+CLAUSE_PAUSE_MS = 150
+PARAGRAPH_PAUSE_MS = 600
+CROSSFADE_MS = 20
+
+
+def pause_after(segment):
+    # 根据片段结尾的标点决定其后的停顿时长（毫秒）
+    stripped = segment.rstrip(' "”’）)')
+    if segment.endswith('\n'):
+        return PARAGRAPH_PAUSE_MS
+    if stripped.endswith(('。', '！', '？', '；', '!', '?', ';', '…', '.')):
+        return SENTENCE_PAUSE_MS
+    if stripped.endswith(('，', ',', '、', '：', ':')):
+        return CLAUSE_PAUSE_MS
+    return 0
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f'仅支持 16bit 单声道 WAV：{path}')
+        sample_rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2').astype(np.float32)
+    return samples, sample_rate
+
+
+def join_wavs(paths, pauses_ms, output_path, crossfade_ms=CROSSFADE_MS):
+    # pauses_ms[i] 为第 i 段之后的停顿；返回输出时长（秒）
+    result = None
+    sample_rate = None
+    for index, path in enumerate(paths):
+        samples, rate = read_wav(path)
+        if sample_rate is None:
+            sample_rate = rate
+        elif rate != sample_rate:
+            raise ValueError(f'分段采样率不一致：{rate} != {sample_rate}')
+        fade = min(int(sample_rate * crossfade_ms / 1000), len(samples) // 2)
+        if result is None:
+            result = samples
+            continue
+        pause = pauses_ms[index - 1] if index - 1 < len(pauses_ms) else 0
+        fade = min(fade, len(result) // 2)
+        if fade == 0:
+            result = np.concatenate([result, samples])
+        elif pause > 0:
+            ramp = np.linspace(1.0, 0.0, fade, dtype=np.float32)
+            result[-fade:] *= ramp
+            samples = samples.copy()
+            samples[:fade] *= ramp[::-1]
+            silence = np.zeros(int(sample_rate * pause / 1000), dtype=np.float32)
+            result = np.concatenate([result, silence, samples])
+        else:
+            ramp = np.linspace(1.0, 0.0, fade, dtype=np.float32)
+            overlap = result[-fade:] * ramp + samples[:fade] * ramp[::-1]
+            result = np.concatenate([result[:-fade], overlap, samples[fade:]])
+
+    if result is None:
+        raise ValueError('没有可拼接的音频')
+    tmp_path = output_path + '.tmp'
+    with wave.open(tmp_path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.clip(result, -32768, 32767).astype('<i2').tobytes())
+    os.replace(tmp_path, output_path)
+    return len(result) / float(sample_rate)
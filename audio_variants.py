@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import threading
+import subprocess
+
+from result_cache import SingleFlight
+
+# 音频压缩副本：浏览器播放时可请求 opus/mp3 格式，首次请求用 ffmpeg 转码一次，
+# 结果存放在原文件旁（<原文件名>.<格式>），之后的请求直接复用，由原文件所在目录的配额或缓存容量一起清理；原文件被重新生成（修改时间更新）后副本随之重建
+# 同一文件同一格式的并发请求只转码一次
+
+# 格式 -> (扩展名, MIME 类型, ffmpeg 编码参数)；语音内容下 opus 32kbps / mp3 64kbps 约为 16bit WAV 的 1/10
+FORMATS = {
+    'opus': ('.opus', 'audio/ogg', ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip']),
+    'mp3': ('.mp3', 'audio/mpeg', ['-c:a', 'libmp3lame', '-b:a', '64k']),
+}
+
+
+class VariantError(Exception):
+    pass
+
+
+def file_etag(path):
+    # 文件都是整体写入临时文件后 rename 生成的，(大小, 修改时间) 相同即内容相同，可作为强 ETag
+    stat = os.stat(path)
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+class AudioVariants:
+    def __init__(self, ffmpeg='ffmpeg', timeout=300):
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+        self.flight = SingleFlight()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.transcodes = 0
+        self.failures = 0
+
+    def available(self):
+        return shutil.which(self.ffmpeg) is not None
+
+    def variant_path(self, source, fmt):
+        return source + FORMATS[fmt][0]
+
+    def get(self, source, fmt):
+        # 返回压缩副本路径，不存在或已过期时转码生成
+        path = self.variant_path(source, fmt)
+        if self._fresh(source, path):
+            with self.lock:
+                self.hits += 1
+            return path
+        if not self.available():
+            raise VariantError('未安装 ffmpeg，无法转码')
+        result, _ = self.flight.do(path, lambda: self._transcode(source, path, fmt))
+        return result
+
+    def _fresh(self, source, path):
+        try:
+            return os.stat(path).st_mtime_ns >= os.stat(source).st_mtime_ns
+        except OSError:
+            return False
+
+    def _transcode(self, source, path, fmt):
+        if self._fresh(source, path):
+            return path
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        cmd = [self.ffmpeg, '-y', '-loglevel', 'error', '-i', source, *FORMATS[fmt][2], '-f', self._muxer(fmt),
+               tmp_path]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            result = None
+        if result is None or result.returncode != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self.lock:
+                self.failures += 1
+            raise VariantError(f"转码失败：{result.stderr.strip() if result else '超时'}")
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.transcodes += 1
+        print(f"音频已转码: {source} -> {fmt} ({os.path.getsize(source)} -> {os.path.getsize(path)} 字节)",
+              file=sys.stderr)
+        return path
+
+    def _muxer(self, fmt):
+        return 'ogg' if fmt == 'opus' else fmt
+
+    def stats(self):
+        with self.lock:
+            return {
+                'ffmpeg': self.available(),
+                'hits': self.hits,
+                'transcodes': self.transcodes,
+                'failures': self.failures,
+                'shared': self.flight.shared,
+            }
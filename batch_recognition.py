@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import wave
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 批量离线识别：按音频时长分桶，相近时长的文件组成一批交给同一个常驻工作进程，
+# 多个批次在多个工作进程上并行解码，结果按完成顺序逐个返回
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.ogg')
+BYTES_PER_SECOND_GUESS = 32000  # 非 WAV 文件按 16kHz/16bit 单声道估算时长
+
+
+def probe_duration(path):
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except Exception:
+        return os.path.getsize(path) / float(BYTES_PER_SECOND_GUESS)
+
+
+def extract_audio_members(zip_path, target_dir):
+    # 只解压音频文件，成员名扁平化以避免路径穿越
+    paths = []
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for index, member in enumerate(zip_ref.infolist()):
+            name = os.path.basename(member.filename)
+            if member.is_dir() or not name.lower().endswith(AUDIO_EXTENSIONS):
+                continue
+            target = os.path.join(target_dir, f"{index:05d}_{name}")
+            with zip_ref.open(member) as src, open(target, 'wb') as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            paths.append((member.filename, target))
+    return paths
+
+
+def bucket_by_length(items, max_batch_size=8, max_batch_seconds=120.0, max_ratio=1.5):
+    # items: [(名称, 路径, 时长)]；按时长降序切分，批内最长/最短不超过 max_ratio
+    ordered = sorted(items, key=lambda item: item[2], reverse=True)
+    batches = []
+    current = []
+    total = 0.0
+    for item in ordered:
+        duration = item[2]
+        if current and (
+            len(current) >= max_batch_size
+            or total + duration > max_batch_seconds
+            or current[0][2] > max(duration, 0.1) * max_ratio
+        ):
+            batches.append(current)
+            current = []
+            total = 0.0
+        current.append(item)
+        total += duration
+    if current:
+        batches.append(current)
+    return batches
+
+
+def run_batch(pool, model, files, workers, max_batch_size=8, max_batch_seconds=120.0, on_text=None):
+    # files: [(名称, 路径)]；生成每个文件的识别结果字典，成功识别时回调 on_text(路径, 文本)
+    items = [(name, path, probe_duration(path)) for name, path in files]
+    batches = bucket_by_length(items, max_batch_size, max_batch_seconds)
+    print(f"批量识别: {len(items)} 个文件分为 {len(batches)} 批, 并行度 {workers}", file=sys.stderr)
+
+    def decode(batch):
+        started = time.time()
+        results = pool.transcribe_many(model, [path for _, path, _ in batch])
+        return batch, results, time.time() - started
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(decode, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                batch, results, elapsed = future.result()
+            except Exception as e:
+                for name, _, duration in batch:
+                    yield {'file': name, 'duration': round(duration, 2), 'error': str(e)}
+                continue
+            results = list(results) + [{'error': '工作进程未返回结果'}] * (len(batch) - len(results))
+            for (name, path, duration), result in zip(batch, results):
+                entry = {'file': name, 'duration': round(duration, 2), 'batch_size': len(batch),
+                         'batch_seconds': round(elapsed, 2)}
+                if 'error' in result:
+                    entry['error'] = result['error']
+                else:
+                    entry['text'] = result.get('text', '') or '无识别结果'
+                    if on_text is not None:
+                        on_text(path, result.get('text', ''))
+                yield entry
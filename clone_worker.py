@@ -0,0 +1,167 @@
+import os
+os.environ["PYTHONUNBUFFERED"] = "1"
+import sys
+import json
+import time
+import wave
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+# 常驻语音克隆工作进程：加载 CosyVoice2 克隆模型后常驻，通过 stdin/stdout 逐行 JSON 接收克隆任务
+# 参考音频只编码一次：说话人嵌入、语音 token 和声学特征（提示特征）按 (参考音频哈希, 模型版本) 缓存，
+# 进程内按 LRU 保留最近使用的若干个，同时落盘到 prompt_path，进程重启或换到其他工作进程后直接加载
+# 用法：python clone_worker.py [内存中保留的提示特征数]
+# 请求：{"id", "model_path", "model_version", "reference_path", "prompt_path", "text", "instruct", "output_path"}
+#       instruct 为自然语言指令（例如“用粤语说这句话”），为空时按跨语种方式只用参考音频的音色
+# 响应：{"id", "output_path", "prompt_source", "encode_seconds", "synth_seconds", "cold"} 或 {"id", "error"}
+#       prompt_source：memory（进程内命中）/ disk（从 prompt_path 加载）/ encoded（本次编码并写入 prompt_path）
+
+warnings.filterwarnings("ignore")
+
+# 与参考音频有关、与合成文本无关的模型输入；instruct 和跨语种方式都不使用 LLM 的语音提示 token
+PROMPT_KEYS = ('flow_prompt_speech_token', 'flow_prompt_speech_token_len', 'prompt_speech_feat',
+               'prompt_speech_feat_len', 'llm_embedding', 'flow_embedding')
+INSTRUCT_SUFFIX = '<|endofprompt|>'
+
+# stdout 只用于协议消息，模型库的打印统一转到 stderr
+_protocol_out = sys.stdout
+sys.stdout = sys.stderr
+
+
+def send(message):
+    _protocol_out.write(json.dumps(message, ensure_ascii=False) + "\n")
+    _protocol_out.flush()
+
+
+class CloneModel:
+    # 同一时间只保留一个克隆模型；模型路径或版本变化时卸载旧模型并清空提示特征
+    def __init__(self, max_prompts=32):
+        self.key = None
+        self.model = None
+        self.max_prompts = max_prompts
+        self.prompts = OrderedDict()  # prompt_path -> 提示特征
+
+    def get(self, model_path, version=''):
+        # 返回 (模型, 是否冷启动)
+        if self.key == (model_path, version):
+            return self.model, False
+        from cosyvoice.cli.cosyvoice import CosyVoice2
+
+        self.model = None
+        self.prompts.clear()
+        self.model = CosyVoice2(model_path, load_jit=False, load_trt=False, fp16=False)
+        self.key = (model_path, version)
+        return self.model, True
+
+    def prompt(self, reference_path, prompt_path):
+        # 返回 (提示特征, 来源)
+        import torch
+
+        if prompt_path in self.prompts:
+            self.prompts.move_to_end(prompt_path)
+            return self.prompts[prompt_path], 'memory'
+        frontend = self.model.frontend
+        if os.path.exists(prompt_path):
+            try:
+                features = torch.load(prompt_path, map_location=frontend.device)
+                source = 'disk'
+            except Exception as e:
+                print(f"提示特征文件损坏，重新编码: {prompt_path}: {str(e)}", file=sys.stderr)
+                features = None
+        else:
+            features = None
+        if features is None:
+            from cosyvoice.utils.file_utils import load_wav
+
+            speech = load_wav(reference_path, 16000)
+            model_input = frontend.frontend_zero_shot('', '', speech, self.model.sample_rate, '')
+            features = {key: model_input[key] for key in PROMPT_KEYS}
+            self._save(prompt_path, features)
+            source = 'encoded'
+        self.prompts[prompt_path] = features
+        while len(self.prompts) > self.max_prompts:
+            self.prompts.popitem(last=False)
+        return features, source
+
+    def _save(self, prompt_path, features):
+        import torch
+
+        os.makedirs(os.path.dirname(prompt_path), exist_ok=True)
+        tmp_path = f"{prompt_path}.{os.getpid()}.tmp"
+        torch.save({key: value.cpu() for key, value in features.items()}, tmp_path)
+        os.replace(tmp_path, prompt_path)
+        # 同一参考音频在旧模型版本下的提示特征不再使用
+        directory = os.path.dirname(prompt_path)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith('prompt-') and name.endswith('.pt') and path != prompt_path:
+                os.remove(path)
+
+    def synthesize(self, features, text, instruct):
+        # 返回 float32 采样
+        frontend = self.model.frontend
+        extra = {}
+        if instruct:
+            prompt_text, prompt_text_len = frontend._extract_text_token(instruct + INSTRUCT_SUFFIX)
+            extra = {'prompt_text': prompt_text, 'prompt_text_len': prompt_text_len}
+        pieces = []
+        for segment in frontend.text_normalize(text, split=True, text_frontend=True):
+            text_token, text_token_len = frontend._extract_text_token(segment)
+            model_input = dict(features, text=text_token, text_len=text_token_len, **extra)
+            for output in self.model.model.tts(**model_input, stream=False, speed=1.0):
+                pieces.append(output['tts_speech'].squeeze(0).cpu().numpy())
+        if not pieces:
+            raise ValueError("文本为空")
+        return np.concatenate(pieces).astype(np.float32)
+
+
+def write_wav(path, samples, sample_rate):
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype('<i2')
+    tmp_path = path + '.tmp'
+    with wave.open(tmp_path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    os.replace(tmp_path, path)
+
+
+def main():
+    max_prompts = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    clone = CloneModel(max_prompts)
+    send({"ready": True, "pid": os.getpid()})
+    print(f"语音克隆工作进程就绪 (PID: {os.getpid()})", file=sys.stderr)
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            send({"error": f"无效请求: {str(e)}"})
+            continue
+        job_id = job.get("id")
+        try:
+            model, cold = clone.get(job["model_path"], job.get("model_version", ""))
+            started = time.time()
+            features, source = clone.prompt(job["reference_path"], job["prompt_path"])
+            encoded = time.time()
+            samples = clone.synthesize(features, job["text"], job.get("instruct", ""))
+            write_wav(job["output_path"], samples, model.sample_rate)
+            send({
+                "id": job_id,
+                "output_path": job["output_path"],
+                "cold": cold,
+                "prompt_source": source,
+                "encode_seconds": round(encoded - started, 3),
+                "synth_seconds": round(time.time() - encoded, 3),
+            })
+        except Exception as e:
+            send({"id": job_id, "error": str(e)})
+
+
+if __name__ == "__main__":
+    main()
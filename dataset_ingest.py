@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 数据集导入：上传的 ZIP 分块写入磁盘后，多个线程各自打开压缩包并行解压成员，
+# 每个 .wav 解压完成后立即在同一线程里校验 WAV 头和对应的 .trn 转写，
+# 结果写入数据集目录下的 manifest.jsonl（每行一个样本），训练和后续查询直接读取清单，不再遍历目录
+
+MANIFEST_NAME = 'manifest.jsonl'
+SUMMARY_NAME = 'manifest.summary.json'
+CHUNK_SIZE = 1024 * 1024
+
+
+class DatasetError(Exception):
+    pass
+
+
+def save_stream(stream, path, chunk_size=CHUNK_SIZE):
+    # 把上传流按块写入文件，返回写入字节数
+    written = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def safe_member_path(root, name):
+    # 压缩包成员的目标路径；绝对路径或包含 .. 的成员返回 None
+    name = name.replace('\\', '/')
+    if name.startswith('/') or os.path.isabs(name):
+        return None
+    target = os.path.normpath(os.path.join(root, name))
+    if os.path.commonpath([os.path.abspath(root), os.path.abspath(target)]) != os.path.abspath(root):
+        return None
+    return target
+
+
+def transcript_path(wav_path):
+    # 转写文件约定为 <音频>.wav.trn，兼容 <音频>.trn
+    for candidate in (wav_path + '.trn', os.path.splitext(wav_path)[0] + '.trn'):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def probe_wav(path):
+    with wave.open(path, 'rb') as wav:
+        sample_rate = wav.getframerate()
+        frames = wav.getnframes()
+        return {
+            'sample_rate': sample_rate,
+            'channels': wav.getnchannels(),
+            'sample_width': wav.getsampwidth(),
+            'duration': round(frames / float(sample_rate), 3) if sample_rate else 0.0,
+        }
+
+
+def validate_sample(root, wav_path):
+    # 返回清单条目；WAV 头损坏或缺少转写时 entry['error'] 给出原因
+    entry = {'path': os.path.relpath(wav_path, root)}
+    try:
+        entry.update(probe_wav(wav_path))
+    except (wave.Error, EOFError, OSError) as e:
+        entry['error'] = f"WAV 文件无效: {str(e)}"
+        return entry
+    trn = transcript_path(wav_path)
+    if trn is None:
+        entry['error'] = '缺少 .trn 转写文件'
+        return entry
+    try:
+        with open(trn, 'r', encoding='utf-8') as f:
+            text = f.readline().strip()
+    except (OSError, UnicodeDecodeError) as e:
+        entry['error'] = f"转写文件无法读取: {str(e)}"
+        return entry
+    if not text:
+        entry['error'] = '转写为空'
+        return entry
+    entry['transcript'] = text
+    return entry
+
+
+def ingest_zip(zip_path, dataset_path, workers=4):
+    # 并行解压并校验，解压完成后删除压缩包；返回清单摘要
+    started = time.time()
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = [m for m in zip_ref.infolist() if not m.is_dir()]
+    total_size = sum(m.file_size for m in members)
+    free = shutil.disk_usage(dataset_path).free
+    if total_size > free:
+        raise DatasetError(f"磁盘空间不足：解压需要 {total_size // (1024 * 1024)} MB，"
+                           f"可用 {free // (1024 * 1024)} MB")
+
+    # 转写文件必须先于音频校验落盘：先解压非音频成员，再并行解压并校验音频
+    wav_members = [m for m in members if m.filename.lower().endswith('.wav')]
+    other_members = [m for m in members if not m.filename.lower().endswith('.wav')]
+    local = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+
+    def archive():
+        if not hasattr(local, 'zip'):
+            local.zip = zipfile.ZipFile(zip_path, 'r')
+            with opened_lock:
+                opened.append(local.zip)
+        return local.zip
+
+    def extract(member):
+        target = safe_member_path(dataset_path, member.filename)
+        if target is None:
+            print(f"跳过不安全的压缩包成员: {member.filename}", file=sys.stderr)
+            return None
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with archive().open(member) as src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        return target
+
+    def extract_and_validate(member):
+        target = extract(member)
+        return validate_sample(dataset_path, target) if target else None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(extract, other_members))
+            entries = [e for e in executor.map(extract_and_validate, wav_members) if e is not None]
+    finally:
+        for handle in opened:
+            handle.close()
+    os.remove(zip_path)
+
+    entries.sort(key=lambda e: e['path'])
+    summary = write_manifest(dataset_path, entries)
+    summary['elapsed'] = round(time.time() - started, 3)
+    print(f"数据集导入完成: {dataset_path} ({summary['valid_samples']}/{len(entries)} 个有效样本, "
+          f"{summary['total_duration']:.1f} 秒音频, 耗时 {summary['elapsed']:.1f} 秒)", file=sys.stderr)
+    return summary
+
+
+def write_manifest(dataset_path, entries):
+    valid = [e for e in entries if 'error' not in e]
+    summary = {
+        'dataset_path': dataset_path,
+        'manifest': os.path.join(dataset_path, MANIFEST_NAME),
+        'samples': len(entries),
+        'valid_samples': len(valid),
+        'invalid_samples': len(entries) - len(valid),
+        'total_duration': round(sum(e['duration'] for e in valid), 3),
+        'sample_rates': sorted({e['sample_rate'] for e in valid}),
+        'channels': sorted({e['channels'] for e in valid}),
+        'created_at': time.time(),
+    }
+    tmp_path = summary['manifest'] + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, summary['manifest'])
+    with open(os.path.join(dataset_path, SUMMARY_NAME), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    return summary
+
+
+def load_summary(dataset_path):
+    try:
+        with open(os.path.join(dataset_path, SUMMARY_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_manifest(dataset_path, include_invalid=False):
+    entries = []
+    with open(os.path.join(dataset_path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if include_invalid or 'error' not in entry:
+                entries.append(entry)
+    return entries
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import wave
+import signal
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 训练特征预计算：数据集导入后用进程池一次性计算全部样本的声学特征，
+# 每种特征一个 float32 数据文件，样本按清单顺序首尾相接，另有索引记录每个样本的 (偏移, 帧数)；
+# 训练脚本用 np.memmap 打开数据文件按偏移切片读取，不再逐轮解码 WAV 和重算特征
+# 服务进程中有大量线程，不在其中 fork 进程池：预处理任务以独立进程运行本文件（见 main），
+# 进程池再用 spawn 方式启动计算进程
+# 用法：python feature_cache.py <数据集目录> <特征类型> <进程数>
+# 目录结构：<数据集>/features/<特征>.f32
+#           <数据集>/features/<特征>.index.json
+
+FEATURE_DIR = 'features'
+
+# fbank：ASR 微调用的 80 维 log-mel，25ms 窗 10ms 帧移；spectrogram：VITS 用的线性幅度谱
+FEATURE_KINDS = {
+    'fbank': {'n_mels': 80, 'win_ms': 25.0, 'hop_ms': 10.0},
+    'spectrogram': {'n_fft': 1024, 'hop_length': 256, 'win_length': 1024},
+}
+
+
+def read_samples(path):
+    # 读取 WAV 为 [-1, 1] 的 float32 单声道
+    with wave.open(path, 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"不支持的采样位宽: {width * 8} bit")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+
+def frame_signal(samples, win_length, hop_length, n_fft):
+    if len(samples) < win_length:
+        samples = np.pad(samples, (0, win_length - len(samples)))
+    count = 1 + (len(samples) - win_length) // hop_length
+    index = np.arange(win_length)[None, :] + hop_length * np.arange(count)[:, None]
+    frames = samples[index] * np.hanning(win_length).astype(np.float32)
+    return np.abs(np.fft.rfft(frames, n=n_fft, axis=1)).astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def mel_filterbank(sample_rate, n_fft, n_mels):
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    points = mel_to_hz(np.linspace(hz_to_mel(0.0), hz_to_mel(sample_rate / 2.0), n_mels + 2))
+    bins = np.floor((n_fft + 1) * points / sample_rate).astype(int)
+    bank = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        for k in range(left, center):
+            bank[m - 1, k] = (k - left) / max(center - left, 1)
+        for k in range(center, right):
+            bank[m - 1, k] = (right - k) / max(right - center, 1)
+    return bank
+
+
+def compute_features(path, kind):
+    # 返回 [帧数, 维度] 的 float32 特征和采样率
+    samples, sample_rate = read_samples(path)
+    config = FEATURE_KINDS[kind]
+    if kind == 'fbank':
+        win_length = int(sample_rate * config['win_ms'] / 1000)
+        hop_length = int(sample_rate * config['hop_ms'] / 1000)
+        n_fft = 1 << (win_length - 1).bit_length()
+        power = frame_signal(samples, win_length, hop_length, n_fft) ** 2
+        mel = power @ mel_filterbank(sample_rate, n_fft, config['n_mels']).T
+        return np.log(np.maximum(mel, 1e-10)).astype(np.float32), sample_rate
+    return frame_signal(samples, config['win_length'], config['hop_length'], config['n_fft']), sample_rate
+
+
+def _featurize(args):
+    path, kind = args
+    try:
+        features, sample_rate = compute_features(path, kind)
+        return features, sample_rate, None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def feature_paths(dataset_path, kind):
+    directory = os.path.join(dataset_path, FEATURE_DIR)
+    return os.path.join(directory, f"{kind}.f32"), os.path.join(directory, f"{kind}.index.json")
+
+
+def build_features(dataset_path, entries, kind, workers=4, check_cancelled=None, on_progress=None):
+    # entries 为清单中的有效样本；按清单顺序写入数据文件，完成后原子替换，返回索引
+    if kind not in FEATURE_KINDS:
+        raise ValueError(f"未知的特征类型: {kind}")
+    data_path, index_path = feature_paths(dataset_path, kind)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    started = time.time()
+    samples = {}
+    offset = 0
+    dims = None
+    failed = 0
+    tasks = [(os.path.join(dataset_path, entry['path']), kind) for entry in entries]
+    executor = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context('spawn'))
+    try:
+        with open(data_path + '.tmp', 'wb') as f:
+            for done, (entry, (features, sample_rate, error)) in enumerate(
+                    zip(entries, executor.map(_featurize, tasks, chunksize=8)), 1):
+                if check_cancelled is not None:
+                    check_cancelled()
+                if error is not None:
+                    failed += 1
+                    print(f"特征计算失败 {entry['path']}: {error}", file=sys.stderr)
+                    continue
+                dims = features.shape[1]
+                f.write(np.ascontiguousarray(features, dtype='<f4').tobytes())
+                samples[entry['path']] = [offset, features.shape[0]]
+                offset += features.shape[0]
+                if on_progress is not None:
+                    on_progress(done, len(tasks))
+    except BaseException:
+        # 取消或出错时丢弃尚未开始的样本，不等全部算完
+        executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(data_path + '.tmp'):
+            os.remove(data_path + '.tmp')
+        raise
+    executor.shutdown()
+    index = {
+        'kind': kind,
+        'config': FEATURE_KINDS[kind],
+        'dtype': 'float32',
+        'dims': dims,
+        'frames': offset,
+        'failed': failed,
+        'samples': samples,
+        'created_at': time.time(),
+    }
+    os.replace(data_path + '.tmp', data_path)
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(index_path + '.tmp', index_path)
+    print(f"特征缓存已生成: {data_path} ({len(samples)} 个样本, {offset} 帧, "
+          f"耗时 {time.time() - started:.1f} 秒)", file=sys.stderr)
+    return index
+
+
+def available_features(dataset_path):
+    # 已生成的特征类型 -> 数据文件路径
+    result = {}
+    for kind in FEATURE_KINDS:
+        data_path, index_path = feature_paths(dataset_path, kind)
+        if os.path.exists(data_path) and os.path.exists(index_path):
+            result[kind] = data_path
+    return result
+
+
+def main():
+    from dataset_ingest import load_manifest
+
+    if len(sys.argv) < 4:
+        print("用法: python feature_cache.py <数据集目录> <特征类型> <进程数>", file=sys.stderr)
+        sys.exit(2)
+    dataset_path, kind, workers = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    # 任务取消时服务端发送 SIGTERM：转为 SystemExit，由 build_features 丢弃未完成的样本和临时文件
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    entries = load_manifest(dataset_path)
+    step = max(len(entries) // 20, 1)
+
+    def on_progress(done, total):
+        if done % step == 0 or done == total:
+            print(f"{kind}: {done}/{total}", flush=True)
+
+    index = build_features(dataset_path, entries, kind, workers=workers, on_progress=on_progress)
+    print(f"{kind} 特征完成: {len(index['samples'])} 个样本, {index['frames']} 帧, 失败 {index['failed']} 个",
+          flush=True)
+
+
+if __name__ == "__main__":
+    main()
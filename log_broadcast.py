@@ -0,0 +1,133 @@
+import time
+import threading
+from collections import deque, OrderedDict
+
+# 日志广播：每个任务一个有界环形缓冲区，任意数量的 SSE 订阅者各自按序号读取，互不抢占；
+# 事件 ID 为 "<任务 ID>:<序号>"，断线重连时浏览器带上 Last-Event-ID 即可从断点继续
+# 缓冲区满时丢弃最旧的行，没有订阅者时内存占用同样有上限
+
+
+class LogChannel:
+    def __init__(self, kind, job_id, capacity):
+        self.kind = kind
+        self.job_id = job_id
+        self.lines = deque(maxlen=capacity)  # (序号, 行)
+        self.next_seq = 1
+        self.closed = False
+        self.created_at = time.time()
+        self.cond = threading.Condition()
+
+    def publish(self, line):
+        with self.cond:
+            self.lines.append((self.next_seq, line))
+            self.next_seq += 1
+            self.cond.notify_all()
+
+    def close(self, final_line=None):
+        with self.cond:
+            if final_line is not None:
+                self.lines.append((self.next_seq, final_line))
+                self.next_seq += 1
+            self.closed = True
+            self.cond.notify_all()
+
+    def read(self, after_seq, timeout):
+        # 返回 (序号大于 after_seq 的行, 是否已结束)；没有新行时最多等待 timeout 秒
+        with self.cond:
+            if not self.closed and (not self.lines or self.lines[-1][0] <= after_seq):
+                self.cond.wait(timeout)
+            entries = [(seq, line) for seq, line in self.lines if seq > after_seq]
+            return entries, self.closed
+
+
+class LogBroadcaster:
+    def __init__(self, capacity=5000, keep_per_kind=20):
+        self.capacity = capacity
+        self.keep_per_kind = keep_per_kind
+        self.channels = OrderedDict()  # 任务 ID -> LogChannel，按创建顺序
+        self.cond = threading.Condition()
+
+    def channel(self, kind, job_id):
+        # 获取或创建任务的日志通道；每类只保留最近 keep_per_kind 个任务的日志
+        with self.cond:
+            channel = self.channels.get(job_id)
+            if channel is None:
+                channel = LogChannel(kind, job_id, self.capacity)
+                self.channels[job_id] = channel
+                same_kind = [c for c in self.channels.values() if c.kind == kind]
+                for old in same_kind[:-self.keep_per_kind]:
+                    if old.closed:
+                        del self.channels[old.job_id]
+                self.cond.notify_all()
+            return channel
+
+    def latest(self, kind):
+        with self.cond:
+            for channel in reversed(self.channels.values()):
+                if channel.kind == kind:
+                    return channel
+        return None
+
+    def wait_latest(self, kind, timeout):
+        with self.cond:
+            channel = self.latest(kind)
+            if channel is None:
+                self.cond.wait(timeout)
+                channel = self.latest(kind)
+            return channel
+
+    def resolve(self, kind, job_id=None, last_event_id=None):
+        # 返回 (通道, 起始序号)；Last-Event-ID 优先，其次 job_id，最后取该类最新任务
+        after_seq = 0
+        if last_event_id and ':' in last_event_id:
+            event_job, _, seq = last_event_id.rpartition(':')
+            with self.cond:
+                channel = self.channels.get(event_job)
+            if channel is not None and channel.kind == kind:
+                try:
+                    after_seq = int(seq)
+                except ValueError:
+                    after_seq = 0
+                return channel, after_seq
+        if job_id:
+            with self.cond:
+                channel = self.channels.get(job_id)
+            return (channel if channel is not None and channel.kind == kind else None), 0
+        return self.latest(kind), 0
+
+    def sse(self, kind, job_id=None, last_event_id=None, keepalive=15.0, on_line=None):
+        # SSE 生成器：补发断点之后的缓冲内容，再实时推送新行，任务结束后关闭连接
+        channel, after_seq = self.resolve(kind, job_id, last_event_id)
+        while channel is None:
+            if job_id:
+                yield "data: 任务日志不存在\n\n"
+                return
+            yield ": keepalive\n\n"
+            channel = self.wait_latest(kind, keepalive)
+        while True:
+            entries, closed = channel.read(after_seq, keepalive)
+            if entries and entries[0][0] > after_seq + 1:
+                yield f"data: [已跳过 {entries[0][0] - after_seq - 1} 行较早的日志]\n\n"
+            for seq, line in entries:
+                if on_line is not None:
+                    on_line(line)
+                yield f"id: {channel.job_id}:{seq}\ndata: {line}\n\n"
+                after_seq = seq
+            if closed and not channel.read(after_seq, 0)[0]:
+                return
+            if not entries:
+                yield ": keepalive\n\n"
+
+    def stats(self):
+        with self.cond:
+            return [
+                {
+                    'kind': c.kind,
+                    'job_id': c.job_id,
+                    'lines': len(c.lines),
+                    'last_seq': c.next_seq - 1,
+                    'closed': c.closed,
+                    'created_at': c.created_at,
+                }
+                for c in self.channels.values()
+            ]
@@ -0,0 +1,152 @@
+import os
+import sys
+import wave
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# 长音频分段识别：按固定窗口切分（切点尽量落在窗口末尾附近能量最低处），
+# 相邻窗口保留少量重叠，多个窗口并行交给常驻工作进程解码，
+# 再按顺序去掉重叠部分的重复文本并逐段返回；任意时刻只保留有限个窗口，内存占用与音频总长无关
+
+TARGET_SAMPLE_RATE = 16000
+# 窗口长度范围；重叠时长不超过窗口的一半。过短的窗口会让一次上传产生大量窗口文件和解码调用
+MIN_WINDOW_SECONDS = 5.0
+MAX_WINDOW_SECONDS = 120.0
+
+
+def check_window(window_seconds, overlap_seconds):
+    # 参数不合法时抛出 ValueError
+    if not MIN_WINDOW_SECONDS <= window_seconds <= MAX_WINDOW_SECONDS:
+        raise ValueError(f"窗口长度必须在 {MIN_WINDOW_SECONDS:g} 到 {MAX_WINDOW_SECONDS:g} 秒之间")
+    if not 0 <= overlap_seconds <= window_seconds / 2:
+        raise ValueError("重叠时长必须不小于 0 且不超过窗口长度的一半")
+
+
+class LongAudioError(Exception):
+    pass
+
+
+def normalize_audio(path, work_dir):
+    # 统一为 16kHz 单声道 16bit WAV；已满足条件的 WAV 直接使用原文件
+    try:
+        with wave.open(path, 'rb') as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (TARGET_SAMPLE_RATE, 1, 2):
+                return path
+    except (wave.Error, EOFError):
+        pass
+    if not shutil.which('ffmpeg'):
+        raise LongAudioError('长音频识别需要 16kHz 单声道 16bit WAV，或安装 ffmpeg 以自动转换')
+    target = os.path.join(work_dir, 'normalized.wav')
+    result = subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-i', path, '-ac', '1', '-ar', str(TARGET_SAMPLE_RATE),
+         '-sample_fmt', 's16', target],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise LongAudioError(f'音频转换失败：{result.stderr.strip()}')
+    return target
+
+
+def read_samples(wav, start, count):
+    wav.setpos(start)
+    return np.frombuffer(wav.readframes(count), dtype='<i2')
+
+
+def quietest_point(samples, offset, sample_rate, frame_ms=50):
+    # 返回 samples 中能量最低的短帧中心位置（绝对采样点）
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    usable = len(samples) // frame * frame
+    if usable == 0:
+        return offset + len(samples)
+    energy = (samples[:usable].astype(np.float64) ** 2).reshape(-1, frame).mean(axis=1)
+    return offset + int(np.argmin(energy)) * frame + frame // 2
+
+
+def iter_windows(path, window_seconds=30.0, overlap_seconds=1.5, search_seconds=5.0):
+    # 生成 (序号, 起点采样, 切点采样, 窗口起点采样, int16 数组)
+    check_window(window_seconds, overlap_seconds)
+    with wave.open(path, 'rb') as wav:
+        sample_rate = wav.getframerate()
+        total = wav.getnframes()
+        window = int(window_seconds * sample_rate)
+        overlap = int(overlap_seconds * sample_rate)
+        # 切点只在窗口后半段内搜索，每段至少前进半个窗口
+        search = min(max(int(search_seconds * sample_rate), 0), window // 2)
+        segment_start = 0
+        index = 0
+        while segment_start < total:
+            window_start = max(segment_start - overlap, 0)
+            nominal_end = segment_start + window
+            if nominal_end >= total:
+                cut = total
+            else:
+                region_start = nominal_end - search
+                cut = quietest_point(read_samples(wav, region_start, search), region_start, sample_rate)
+            yield index, segment_start, cut, window_start, read_samples(wav, window_start, cut - window_start)
+            segment_start = cut
+            index += 1
+
+
+def write_window(path, samples, sample_rate=TARGET_SAMPLE_RATE):
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype('<i2').tobytes())
+
+
+def stitch(previous, current, max_overlap=40, min_match=2):
+    # 去掉 current 开头与 previous 结尾重复的部分（重叠区域被解码了两次）
+    if not previous or not current:
+        return current
+    for size in range(min(len(previous), len(current), max_overlap), min_match - 1, -1):
+        if previous.endswith(current[:size]):
+            return current[size:].lstrip()
+    return current
+
+
+def recognize_long(pool, model, path, work_dir, workers, window_seconds=30.0, overlap_seconds=1.5):
+    # 按顺序生成每段结果 {"index", "start", "end", "text"}
+    audio_path = normalize_audio(path, work_dir)
+    with wave.open(audio_path, 'rb') as wav:
+        sample_rate = wav.getframerate()
+
+    def decode(window):
+        index, start, end, window_start, samples = window
+        window_path = os.path.join(work_dir, f"window_{index:06d}.wav")
+        write_window(window_path, samples, sample_rate)
+        try:
+            return index, start, end, pool.transcribe(model, window_path)
+        finally:
+            os.remove(window_path)
+
+    max_in_flight = max(workers, 1) * 2
+    previous_text = ''
+    in_flight = deque()
+
+    def emit(future):
+        nonlocal previous_text
+        index, start, end, text = future.result()
+        text = text.strip()
+        merged = stitch(previous_text, text)
+        previous_text = text or previous_text
+        return {
+            'index': index,
+            'start': round(start / float(sample_rate), 2),
+            'end': round(end / float(sample_rate), 2),
+            'text': merged,
+        }
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for window in iter_windows(audio_path, window_seconds, overlap_seconds):
+            in_flight.append(executor.submit(decode, window))
+            # 最早提交的窗口完成后立即按顺序输出，同时限制在途窗口数
+            while in_flight and (len(in_flight) >= max_in_flight or in_flight[0].done()):
+                yield emit(in_flight.popleft())
+        while in_flight:
+            yield emit(in_flight.popleft())
+    print(f"长音频识别完成: {path}", file=sys.stderr)
@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import threading
+from contextlib import contextmanager
+
+# 模型目录引用计数：常驻工作进程在存活期间、合成/克隆/测试任务在运行期间持有所用模型目录的引用，
+# 删除或被新版本替换的模型目录在引用全部释放后才真正删除，进行中的请求不会读到被删掉的文件
+# 按目录的 (设备号, inode) 计数，目录被 rename 到别处（例如发布新版本时移开旧版本）后引用仍然有效
+
+
+class ModelUnavailable(Exception):
+    pass
+
+
+class ModelRefs:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refs = {}     # (设备号, inode) -> 引用数
+        self.paths = {}    # (设备号, inode) -> 持有时的路径（仅用于展示）
+        self.pending = {}  # (设备号, inode) -> 等待删除的路径
+        self.deleted = 0
+        self.deferred = 0
+
+    def _key(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def acquire(self, path):
+        key = self._key(path)
+        if key is None:
+            raise ModelUnavailable(f"模型不存在: {path}")
+        with self.lock:
+            if key in self.pending:
+                raise ModelUnavailable(f"模型正在删除: {path}")
+            self.refs[key] = self.refs.get(key, 0) + 1
+            self.paths.setdefault(key, path)
+        return key
+
+    def release(self, key):
+        with self.lock:
+            count = self.refs.get(key, 0) - 1
+            if count > 0:
+                self.refs[key] = count
+                return
+            self.refs.pop(key, None)
+            self.paths.pop(key, None)
+            path = self.pending.pop(key, None)
+        if path is not None:
+            self._remove(key, path)
+
+    @contextmanager
+    def hold(self, path):
+        key = self.acquire(path)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def lease(self, path):
+        # 返回释放函数，供生命周期不在一个代码块内的持有者（常驻工作进程）使用
+        key = self.acquire(path)
+        return lambda: self.release(key)
+
+    def defer_delete(self, path):
+        # 没有引用时立即删除并返回 True；否则登记，最后一个引用释放时删除
+        key = self._key(path)
+        if key is None:
+            return True
+        with self.lock:
+            if self.refs.get(key):
+                self.pending[key] = path
+                self.deferred += 1
+                print(f"模型仍在使用，延迟删除: {path} ({self.refs[key]} 个引用)", file=sys.stderr)
+                return False
+        self._remove(key, path)
+        return True
+
+    def _remove(self, key, path):
+        # 登记后目录可能已被移走并在原路径放入了新版本：只删除 inode 仍然一致的目录
+        if self._key(path) != key:
+            return
+        shutil.rmtree(path, ignore_errors=True)
+        with self.lock:
+            self.deleted += 1
+        print(f"模型目录已删除: {path}", file=sys.stderr)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'held': [{'path': self.paths.get(key), 'refs': count} for key, count in self.refs.items()],
+                'pending_delete': list(self.pending.values()),
+                'deferred': self.deferred,
+                'deleted': self.deleted,
+            }
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import threading
+
+from result_cache import directory_version
+
+# 模型注册表：各模型根目录下的模型及其元数据（大小、文件数、权重/配置文件、框架、最后修改时间）常驻内存，
+# 列表请求直接返回内存中的结果，不再每次 listdir + isdir；
+# 后台线程定期检查根目录和各模型目录的版本指纹，有变化时只重新扫描变化的模型，
+# 上传、删除等接口修改模型后调用 refresh 立即更新
+
+WEIGHT_EXTENSIONS = ('.bin', '.safetensors', '.pt', '.pth', '.ckpt', '.onnx', '.pb', '.h5', '.model')
+CONFIG_NAMES = ('config.json', 'configuration.json', 'config.yaml', 'tokenizer.json', 'vocab.txt',
+                'tokenizer_config.json', 'preprocessor_config.json')
+MAX_ARTIFACTS = 50
+
+
+def detect_framework(names):
+    # names: 模型目录内全部文件的相对路径
+    basenames = {os.path.basename(name) for name in names}
+    extensions = {os.path.splitext(name)[1].lower() for name in names}
+    if 'configuration.json' in basenames:
+        return 'modelscope'
+    if 'config.json' in basenames and ({'.safetensors', '.bin'} & extensions):
+        return 'transformers'
+    if '.onnx' in extensions:
+        return 'onnx'
+    if {'.pt', '.pth', '.ckpt'} & extensions:
+        return 'pytorch'
+    if {'.pb', '.h5'} & extensions or 'saved_model.pb' in basenames:
+        return 'tensorflow'
+    return 'unknown'
+
+
+def scan_model(path):
+    size = 0
+    modified = 0.0
+    names = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            full_path = os.path.join(root, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            size += stat.st_size
+            modified = max(modified, stat.st_mtime)
+            names.append(os.path.relpath(full_path, path))
+    artifacts = sorted(name for name in names
+                       if name.lower().endswith(WEIGHT_EXTENSIONS) or os.path.basename(name) in CONFIG_NAMES)
+    return {
+        'name': os.path.basename(path),
+        'path': path,
+        'size_bytes': size,
+        'file_count': len(names),
+        'artifacts': artifacts[:MAX_ARTIFACTS],
+        'framework': detect_framework(names),
+        'modified': modified or os.path.getmtime(path),
+        'version': directory_version(path),
+    }
+
+
+class ModelRegistry:
+    def __init__(self, roots, poll_interval=30.0):
+        self.roots = list(dict.fromkeys(roots))
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.models = {root: {} for root in self.roots}  # 根目录 -> {模型名: 元数据}
+        self.root_mtimes = {}
+        self.scanned_at = {}
+        self.scans = 0
+        self.thread = None
+
+    def start(self):
+        # 首次扫描也放在后台线程中，避免网络挂载的模型目录拖慢服务启动
+        self.thread = threading.Thread(target=self._poll, daemon=True)
+        self.thread.start()
+
+    def _poll(self):
+        for root in self.roots:
+            if root not in self.scanned_at:
+                self.refresh(root)
+        while True:
+            time.sleep(self.poll_interval)
+            for root in self.roots:
+                try:
+                    self._check(root)
+                except Exception as e:
+                    print(f"模型注册表检查失败 {root}: {str(e)}", file=sys.stderr)
+
+    def _check(self, root):
+        # 根目录修改时间变化说明有模型增删；各模型目录的版本指纹变化说明模型文件被替换
+        try:
+            mtime = os.stat(root).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self.root_mtimes.get(root):
+            self.refresh(root)
+            return
+        with self.lock:
+            known = dict(self.models[root])
+        for name, info in known.items():
+            if directory_version(info['path']) != info['version']:
+                self.refresh(root, name)
+
+    def refresh(self, root, name=None):
+        # 重新扫描整个根目录，或只扫描其中一个模型（模型已删除时从注册表移除）
+        if root not in self.models:
+            return
+        if name is not None:
+            path = os.path.join(root, name)
+            info = scan_model(path) if os.path.isdir(path) else None
+            with self.lock:
+                if info is None:
+                    self.models[root].pop(name, None)
+                else:
+                    self.models[root][name] = info
+                self.scans += 1
+            return
+        try:
+            mtime = os.stat(root).st_mtime
+            names = [entry.name for entry in os.scandir(root) if entry.is_dir() and not entry.name.startswith('.')]
+        except OSError:
+            mtime, names = None, []
+        with self.lock:
+            known = dict(self.models[root])
+        models = {}
+        for model in names:
+            path = os.path.join(root, model)
+            info = known.get(model)
+            if info is None or directory_version(path) != info['version']:
+                info = scan_model(path)
+            models[model] = info
+        with self.lock:
+            self.models[root] = models
+            self.root_mtimes[root] = mtime
+            self.scanned_at[root] = time.time()
+            self.scans += 1
+
+    def list(self, root):
+        # 尚未扫描过的根目录（例如 start 之前）同步扫描一次
+        if root not in self.scanned_at:
+            self.refresh(root)
+        with self.lock:
+            return [dict(info) for _, info in sorted(self.models.get(root, {}).items())]
+
+    def names(self, root):
+        return [info['name'] for info in self.list(root)]
+
+    def get(self, root, name):
+        with self.lock:
+            info = self.models.get(root, {}).get(name)
+            return dict(info) if info is not None else None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'roots': {root: {'models': len(self.models[root]), 'scanned_at': self.scanned_at.get(root)}
+                          for root in self.roots},
+                'scans': self.scans,
+                'poll_interval': self.poll_interval,
+            }
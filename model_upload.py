@@ -0,0 +1,349 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import zipfile
+import threading
+from collections import deque
+
+from dataset_ingest import safe_member_path
+
+# 可断点续传的分块模型上传：客户端先登记上传（文件名、大小），再按序号逐块 PUT，每块带 SHA-256 校验值，
+# 校验通过的块写入暂存文件对应偏移并记录到会话文件；连接中断后查询会话即可只补传缺失的块
+# 全部块到齐后，压缩包逐成员流式解压到模型根目录下的暂存目录，完成后整体 rename 到模型目录，
+# 读取方不会看到解压到一半的模型
+# 目录结构：<模型根目录>/.staging/<上传 ID>/session.json
+#           <模型根目录>/.staging/<上传 ID>/upload.zip
+#           <模型根目录>/.staging/<上传 ID>/model/（解压暂存，发布时 rename 为 <模型根目录>/<模型名>）
+
+STAGING_DIR = '.staging'
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+RATE_WINDOW_SECONDS = 10.0
+
+UPLOADING = 'uploading'
+EXTRACTING = 'extracting'
+PUBLISHED = 'published'
+FAILED = 'failed'
+
+
+class UploadError(Exception):
+    pass
+
+
+def valid_model_name(name):
+    return bool(name) and name == os.path.basename(name) and not name.startswith('.') and name not in ('..',)
+
+
+class RateMeter:
+    # 最近 RATE_WINDOW_SECONDS 秒内的平均速率（字节/秒）
+    def __init__(self):
+        self.samples = deque()
+
+    def add(self, size):
+        now = time.time()
+        self.samples.append((now, size))
+        while self.samples and now - self.samples[0][0] > RATE_WINDOW_SECONDS:
+            self.samples.popleft()
+
+    def rate(self):
+        if not self.samples:
+            return 0.0
+        elapsed = max(time.time() - self.samples[0][0], 1.0)
+        return sum(size for _, size in self.samples) / elapsed
+
+
+class UploadSession:
+    def __init__(self, directory, info):
+        self.directory = directory
+        self.info = info
+        self.received = set(info.get('received', []))
+        self.lock = threading.Lock()
+        self.meter = RateMeter()
+        self.extracted_bytes = 0
+
+    @property
+    def id(self):
+        return self.info['id']
+
+    @property
+    def data_path(self):
+        return os.path.join(self.directory, 'upload.zip')
+
+    @property
+    def chunks(self):
+        size, chunk_size = self.info['size'], self.info['chunk_size']
+        return max((size + chunk_size - 1) // chunk_size, 1)
+
+    def chunk_length(self, index):
+        return min(self.info['chunk_size'], self.info['size'] - index * self.info['chunk_size'])
+
+    def save(self):
+        # 调用方持有 self.lock
+        self.info['received'] = sorted(self.received)
+        tmp_path = os.path.join(self.directory, 'session.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.info, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.directory, 'session.json'))
+
+    def write_chunk(self, index, stream, checksum):
+        # 边读请求体边写入并计算哈希；每块必须带 SHA-256，校验失败的块不计入已接收，重传时直接覆盖
+        if self.info['state'] != UPLOADING:
+            raise UploadError('上传已结束')
+        if not checksum:
+            raise UploadError(f"块 {index} 缺少 SHA-256 校验值")
+        if not 0 <= index < self.chunks:
+            raise UploadError(f"块序号超出范围: {index}")
+        expected = self.chunk_length(index)
+        digest = hashlib.sha256()
+        written = 0
+        with open(self.data_path, 'r+b') as f:
+            f.seek(index * self.info['chunk_size'])
+            while written < expected:
+                data = stream.read(min(1024 * 1024, expected - written))
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+                written += len(data)
+        if written != expected:
+            raise UploadError(f"块 {index} 长度不符：收到 {written} 字节，应为 {expected} 字节")
+        if digest.hexdigest() != checksum.strip().lower():
+            raise UploadError(f"块 {index} 校验失败")
+        with self.lock:
+            self.received.add(index)
+            self.meter.add(written)
+            self.save()
+
+    def status(self):
+        with self.lock:
+            received_bytes = sum(self.chunk_length(i) for i in self.received)
+            state = self.info['state']
+            rate = self.meter.rate()
+            if state == EXTRACTING:
+                remaining = self.info['size'] - self.extracted_bytes
+            else:
+                remaining = self.info['size'] - received_bytes
+            return {
+                'upload_id': self.id,
+                'section': self.info['section'],
+                'model_name': self.info['model_name'],
+                'filename': self.info['filename'],
+                'state': state,
+                'error': self.info.get('error'),
+                'size': self.info['size'],
+                'chunk_size': self.info['chunk_size'],
+                'chunks': self.chunks,
+                'received': sorted(self.received),
+                'received_bytes': received_bytes,
+                'extracted_bytes': self.extracted_bytes,
+                'throughput': round(rate, 1),
+                'eta_seconds': round(remaining / rate, 1) if rate and state in (UPLOADING, EXTRACTING) else None,
+                'job_id': self.info.get('job_id'),
+            }
+
+
+def extract_zip(zip_path, target_dir, on_progress=None, check_cancelled=None, max_bytes=0):
+    # 逐成员流式解压，跳过路径不安全的成员；on_progress(已解压字节数)
+    # 解压前按成员声明的大小检查可用空间和 max_bytes 上限（0 表示不限制），解压中实际字节数超出声明时中止
+    extracted = 0
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = zip_ref.infolist()
+        total_size = sum(m.file_size for m in members if not m.is_dir())
+        if max_bytes and total_size > max_bytes:
+            raise UploadError(f"解压后大小 {total_size // (1024 * 1024)} MB 超过上限 "
+                              f"{max_bytes // (1024 * 1024)} MB")
+        os.makedirs(target_dir, exist_ok=True)
+        free = shutil.disk_usage(target_dir).free
+        if total_size > free:
+            raise UploadError(f"磁盘空间不足：解压需要 {total_size // (1024 * 1024)} MB，"
+                              f"可用 {free // (1024 * 1024)} MB")
+        for member in members:
+            if check_cancelled is not None:
+                check_cancelled()
+            target = safe_member_path(target_dir, member.filename)
+            if target is None:
+                print(f"跳过不安全的压缩包成员: {member.filename}", file=sys.stderr)
+                continue
+            if member.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zip_ref.open(member) as src, open(target, 'wb') as dst:
+                while True:
+                    data = src.read(1024 * 1024)
+                    if not data:
+                        break
+                    dst.write(data)
+                    extracted += len(data)
+                    if extracted > total_size:
+                        raise UploadError(f"压缩包成员实际大小超出声明: {member.filename}")
+                    if on_progress is not None:
+                        on_progress(extracted)
+    return extracted
+
+
+def publish_directory(staged, target, retire=None):
+    # 暂存目录与模型目录位于同一文件系统；旧版本先移开再 rename 新版本，
+    # 最后交给 retire(旧版本路径) 处理（例如等引用释放后再删除），未指定时直接删除
+    backup = None
+    if os.path.exists(target):
+        backup = f"{os.path.join(os.path.dirname(target), STAGING_DIR)}/{uuid.uuid4().hex}.old"
+        os.rename(target, backup)
+    try:
+        os.rename(staged, target)
+    except OSError:
+        if backup is not None:
+            os.rename(backup, target)
+        raise
+    if backup is not None:
+        if retire is not None:
+            retire(backup)
+        else:
+            shutil.rmtree(backup, ignore_errors=True)
+
+
+class ModelUploadManager:
+    def __init__(self, section_dirs, max_age=24 * 3600, retire=None, max_extracted_bytes=0):
+        self.section_dirs = section_dirs
+        self.max_age = max_age
+        self.max_extracted_bytes = max_extracted_bytes  # 单个模型压缩包解压后的大小上限，0 表示不限制
+        self.retire = retire
+        self.lock = threading.Lock()
+        self.sessions = {}
+        for root in set(section_dirs.values()):
+            self._load(root)
+
+    def _staging_root(self, root):
+        return os.path.join(root, STAGING_DIR)
+
+    def _load(self, root):
+        staging = self._staging_root(root)
+        if not os.path.isdir(staging):
+            return
+        for name in os.listdir(staging):
+            if name.endswith(('.old', '.deleted')):
+                # 上次运行留下的待删除旧版本：重启后已无进程持有
+                shutil.rmtree(os.path.join(staging, name), ignore_errors=True)
+                continue
+            path = os.path.join(staging, name, 'session.json')
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if info.get('state') == EXTRACTING:
+                # 服务重启时正在解压的上传回到待完成状态，由客户端重新提交 complete
+                info['state'] = UPLOADING
+            self.sessions[info['id']] = UploadSession(os.path.dirname(path), info)
+
+    def init(self, section, model_name, filename, size, chunk_size=None):
+        # 相同 (section, 模型名, 文件名, 大小) 的未完成上传直接返回，客户端据此续传
+        root = self.section_dirs.get(section)
+        if root is None:
+            raise UploadError('无效的 section 参数')
+        if not valid_model_name(model_name):
+            raise UploadError('无效的模型名称')
+        if not filename.endswith('.zip'):
+            raise UploadError('文件必须是 ZIP 压缩包')
+        if size <= 0:
+            raise UploadError('文件大小无效')
+        self.sweep()
+        with self.lock:
+            for session in self.sessions.values():
+                info = session.info
+                if (info['state'] == UPLOADING and info['section'] == section and
+                        info['model_name'] == model_name and info['filename'] == filename and info['size'] == size):
+                    return session
+            chunk_size = min(max(int(chunk_size or DEFAULT_CHUNK_SIZE), 1024 * 1024), MAX_CHUNK_SIZE)
+            upload_id = uuid.uuid4().hex
+            directory = os.path.join(self._staging_root(root), upload_id)
+            os.makedirs(directory)
+            free = shutil.disk_usage(directory).free
+            if size * 2 > free:
+                shutil.rmtree(directory, ignore_errors=True)
+                raise UploadError(f"磁盘空间不足：需要约 {size * 2 // (1024 * 1024)} MB，"
+                                  f"可用 {free // (1024 * 1024)} MB")
+            with open(os.path.join(directory, 'upload.zip'), 'wb') as f:
+                f.truncate(size)
+            session = UploadSession(directory, {
+                'id': upload_id, 'section': section, 'model_name': model_name, 'filename': filename,
+                'size': size, 'chunk_size': chunk_size, 'state': UPLOADING, 'created_at': time.time(),
+            })
+            with session.lock:
+                session.save()
+            self.sessions[upload_id] = session
+        print(f"模型上传已登记: {section}/{model_name} ({size} 字节, {session.chunks} 块)", file=sys.stderr)
+        return session
+
+    def get(self, upload_id):
+        with self.lock:
+            return self.sessions.get(upload_id)
+
+    def publish(self, job, session, on_published=None):
+        # 在调度器任务中执行：解压到暂存目录并发布
+        if session.info['state'] not in (UPLOADING, FAILED):
+            raise UploadError('上传已在发布中或已发布')
+        if len(session.received) < session.chunks:
+            raise UploadError(f"还有 {session.chunks - len(session.received)} 块未上传")
+        root = self.section_dirs[session.info['section']]
+        staged = os.path.join(session.directory, 'model')
+        with session.lock:
+            session.info['state'] = EXTRACTING
+            session.meter = RateMeter()
+            session.save()
+        try:
+            shutil.rmtree(staged, ignore_errors=True)
+            last = [0]
+
+            def on_progress(extracted):
+                with session.lock:
+                    session.meter.add(extracted - last[0])
+                    session.extracted_bytes = extracted
+                last[0] = extracted
+
+            extract_zip(session.data_path, staged, on_progress, job.check_cancelled if job else None,
+                        self.max_extracted_bytes)
+            publish_directory(staged, os.path.join(root, session.info['model_name']), self.retire)
+        except BaseException as e:
+            with session.lock:
+                session.info.update(state=FAILED, error=str(e) or '已取消', finished_at=time.time())
+                session.save()
+            raise
+        with session.lock:
+            session.info.update(state=PUBLISHED, finished_at=time.time())
+            session.save()
+        shutil.rmtree(session.directory, ignore_errors=True)
+        print(f"模型已发布: {session.info['section']}/{session.info['model_name']}", file=sys.stderr)
+        if on_published is not None:
+            on_published(session.info['section'], session.info['model_name'])
+
+    def abort(self, upload_id):
+        with self.lock:
+            session = self.sessions.pop(upload_id, None)
+        if session is None:
+            return False
+        shutil.rmtree(session.directory, ignore_errors=True)
+        return True
+
+    def sweep(self):
+        # 清理超过 max_age 没有新数据的上传；已结束的会话保留 1 小时供客户端查询结果
+        now = time.time()
+        with self.lock:
+            for session in list(self.sessions.values()):
+                state = session.info['state']
+                if state == EXTRACTING:
+                    continue
+                if state in (PUBLISHED, FAILED):
+                    expired = now - session.info.get('finished_at', now) > 3600
+                else:
+                    try:
+                        expired = now - os.path.getmtime(os.path.join(session.directory, 'session.json')) > self.max_age
+                    except OSError:
+                        expired = True
+                if expired:
+                    del self.sessions[session.id]
+                    shutil.rmtree(session.directory, ignore_errors=True)
@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+import selectors
+from collections import deque
+
+# 事件驱动的子进程输出泵：用 selectors 同时监听 stdout 和 stderr，
+# 任一管道有完整行即立即回调，不再轮流阻塞 readline 并固定休眠
+
+
+class LatencyStats:
+    # 记录最近若干次的延迟（毫秒），用于观察结果推送耗时
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms):
+        with self.lock:
+            self.samples.append(latency_ms)
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            values = sorted(self.samples)
+            count = self.count
+        if not values:
+            return {"count": count, "window": 0}
+
+        def percentile(p):
+            return round(values[min(int(len(values) * p), len(values) - 1)], 2)
+        return {
+            "count": count,
+            "window": len(values),
+            "mean_ms": round(sum(values) / len(values), 2),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(values[-1], 2),
+        }
+
+
+def pump_process_output(process, on_stdout, on_stderr):
+    # 阻塞直到两个管道都关闭；回调参数为去掉换行的 str 行
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for stream, callback in ((process.stdout, on_stdout), (process.stderr, on_stderr)):
+        if stream is None:
+            continue
+        fd = stream.fileno()
+        os.set_blocking(fd, False)
+        selector.register(fd, selectors.EVENT_READ, callback)
+        buffers[fd] = b''
+
+    try:
+        while buffers:
+            for key, _ in selector.select():
+                fd, callback = key.fd, key.data
+                try:
+                    chunk = os.read(fd, 65536)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    selector.unregister(fd)
+                    rest = buffers.pop(fd)
+                    if rest.strip():
+                        callback(rest.decode('utf-8', 'replace').strip())
+                    continue
+                data = buffers[fd] + chunk
+                *lines, buffers[fd] = data.split(b'\n')
+                for line in lines:
+                    line = line.decode('utf-8', 'replace').strip()
+                    if line:
+                        callback(line)
+    finally:
+        selector.close()
+
+
+def emit_latency_ms(message, now=None):
+    # 子进程在结果中写入生成时间戳 ts（秒），返回从生成到推送的毫秒数
+    ts = message.get("ts") if isinstance(message, dict) else None
+    if ts is None:
+        return None
+    return max(((now or time.time()) - float(ts)) * 1000.0, 0.0)
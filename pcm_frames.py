@@ -0,0 +1,59 @@
+import json
+import struct
+
+# 实时识别二进制帧协议：Flask 进程与识别子进程之间通过 stdin 传输长度前缀帧，
+# 音频以原始 PCM 字节转发，不再做逗号分隔浮点数的格式化和解析
+#
+# 帧结构：<uint32 负载长度><uint8 帧类型><uint32 流编号><负载>
+# 同一识别子进程可承载多个会话，流编号用于区分各客户端的音频
+
+HEADER = struct.Struct('<IBI')
+
+FRAME_FLOAT32 = 0  # 负载为小端 float32 PCM
+FRAME_INT16 = 1    # 负载为小端 int16 PCM
+FRAME_CONFIG = 2   # 打开流，负载为 UTF-8 JSON，例如 {"sample_rate": 48000}
+FRAME_END = 3      # 该流结束
+FRAME_UTTERANCE_END = 4  # 语句边界：VAD 判定一句话结束，解码器应立即输出该段
+
+PCM_FORMATS = {
+    'float32': FRAME_FLOAT32,
+    'int16': FRAME_INT16,
+}
+
+
+def encode_frame(kind, payload=b'', stream=0):
+    return HEADER.pack(len(payload), kind, stream) + payload
+
+
+def encode_config(stream=0, **config):
+    return encode_frame(FRAME_CONFIG, json.dumps(config).encode('utf-8'), stream)
+
+
+def read_exact(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_frame(stream):
+    # 返回 (帧类型, 流编号, 负载)；输入结束时返回 (None, None, None)
+    header = read_exact(stream, HEADER.size)
+    if header is None:
+        return None, None, None
+    length, kind, stream_id = HEADER.unpack(header)
+    payload = read_exact(stream, length) if length else b''
+    if payload is None:
+        return None, None, None
+    return kind, stream_id, payload
+
+
+def decode_pcm(kind, payload):
+    # 将音频帧负载转换为 [-1, 1] 范围的 float32 数组
+    import numpy as np
+    if kind == FRAME_INT16:
+        return np.frombuffer(payload, dtype='<i2').astype(np.float32) / 32768.0
+    return np.frombuffer(payload, dtype='<f4').astype(np.float32)
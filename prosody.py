@@ -0,0 +1,71 @@
+import numpy as np
+
+# 合成结果的韵律后处理：语速用 WSOLA 时间伸缩（不改变音高），音调用伸缩 + 重采样变调（不改变时长）；
+# 音色和情感语气由模型本身的参数决定，不在这里处理
+
+FRAME_MS = 40
+SEARCH_MS = 10
+
+# 音调选项 -> 半音数；也接受数字形式的半音数
+PITCH_SEMITONES = {'normal': 0.0, 'high': 3.0, 'low': -3.0}
+
+
+def pitch_semitones(pitch):
+    if pitch in PITCH_SEMITONES:
+        return PITCH_SEMITONES[pitch]
+    try:
+        return float(pitch)
+    except (TypeError, ValueError):
+        raise ValueError(f"不支持的音调: {pitch}")
+
+
+def resample_length(samples, length):
+    if length == len(samples) or len(samples) == 0:
+        return samples
+    positions = np.linspace(0, len(samples) - 1, max(length, 1))
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def time_stretch(samples, rate, sample_rate):
+    # WSOLA：按 rate 倍速播放，音高不变；每帧在名义位置附近搜索与上一帧自然延续最相似的位置再叠加
+    if abs(rate - 1.0) < 1e-3 or len(samples) == 0:
+        return samples
+    frame = max(int(sample_rate * FRAME_MS / 1000), 16)
+    hop_out = frame // 2
+    hop_in = hop_out * rate
+    search = int(sample_rate * SEARCH_MS / 1000)
+    padded = np.pad(samples.astype(np.float32), (search, frame + search))
+    window = np.hanning(frame).astype(np.float32)
+    count = max(int(len(samples) / hop_in) + 1, 1)
+    output = np.zeros(count * hop_out + frame, dtype=np.float32)
+    weight = np.zeros_like(output)
+    previous = None
+    for k in range(count):
+        nominal = search + int(k * hop_in)
+        if previous is None:
+            position = nominal
+        else:
+            target = padded[previous + hop_out:previous + hop_out + frame]
+            low = max(nominal - search, 0)
+            region = padded[low:nominal + search + frame]
+            if len(target) < frame or len(region) < frame:
+                position = min(nominal, len(padded) - frame)
+            else:
+                position = low + int(np.argmax(np.correlate(region, target, mode='valid')))
+        output[k * hop_out:k * hop_out + frame] += padded[position:position + frame] * window
+        weight[k * hop_out:k * hop_out + frame] += window
+        previous = position
+    output = output / np.maximum(weight, 1e-3)
+    return output[:max(int(round(len(samples) / rate)), 1)]
+
+
+def apply_prosody(samples, sample_rate, speech_rate=1.0, volume=1.0, pitch='normal'):
+    # 返回处理后的 float32 采样；时长变为原来的 1/语速，音高按半音数移动
+    if speech_rate <= 0:
+        raise ValueError(f"语速必须大于 0: {speech_rate}")
+    factor = 2.0 ** (pitch_semitones(pitch) / 12.0)
+    # 变调：先伸缩到 factor 倍时长，再重采样压回，音高乘以 factor；与语速合并为一次伸缩
+    stretched = time_stretch(samples, speech_rate / factor, sample_rate)
+    if abs(factor - 1.0) >= 1e-3:
+        stretched = resample_length(stretched, int(round(len(stretched) / factor)))
+    return stretched * float(volume)
@@ -0,0 +1,213 @@
+import os
+os.environ["PYTHONUNBUFFERED"] = "1"
+import sys
+import json
+import time
+import queue
+import threading
+import numpy as np
+
+# 实时语音识别常驻子进程：同一模型的所有会话共享一个进程，
+# 从 stdin 读取带流编号的 pcm_frames 二进制帧，把各流待解码的音频合并成一批做前向；
+# 当前语句每新增 PARTIAL_SECONDS 音频即整体重新解码一次并输出中间结果，
+# 收到语句边界帧、结束帧或语句累积到 MAX_SEGMENT_SECONDS 时输出最终结果并开始新语句；
+# 因达到时长上限而强制切分时，新语句带上前一语句末尾 CONTEXT_SECONDS 的音频作为上下文，重复的文字在输出前去掉
+# 用法：python realtime_asr_worker.py <模型名>
+# 输出：{"stream": 编号, "text": "...", "partial": true, "ts": 生成时间戳}  当前语句的中间结果（后一条覆盖前一条）
+#       {"stream": 编号, "text": "...", "ts": 生成时间戳}  语句的最终结果
+#       {"stream": 编号, "event": "closed"}  流结束且已输出全部结果
+#       {"error": "..."}
+
+from asr_worker import load_asr_pipeline, transcribe_batch, send
+from long_audio import stitch
+from pcm_frames import (read_frame, decode_pcm, FRAME_FLOAT32, FRAME_INT16,
+                        FRAME_CONFIG, FRAME_END, FRAME_UTTERANCE_END)
+
+TARGET_SAMPLE_RATE = 16000
+PARTIAL_SECONDS = float(os.environ.get("REALTIME_PARTIAL_SECONDS", 0.8))  # 中间结果的解码间隔（按音频时长）
+MAX_SEGMENT_SECONDS = 6.0  # 语句累积到该时长即输出最终结果
+CONTEXT_SECONDS = 1.0      # 强制切分时带入下一语句的上下文音频
+BATCH_INTERVAL = 0.05      # 收集帧的最长等待时间（秒）
+MAX_BATCH_SIZE = 32        # 单次前向最多包含的流数
+
+
+def resample(audio, source_rate, target_rate=TARGET_SAMPLE_RATE):
+    if source_rate == target_rate or len(audio) == 0:
+        return audio
+    duration = len(audio) / float(source_rate)
+    target_length = max(int(round(duration * target_rate)), 1)
+    source_times = np.arange(len(audio)) / float(source_rate)
+    target_times = np.arange(target_length) / float(target_rate)
+    return np.interp(target_times, source_times, audio).astype(np.float32)
+
+
+class StreamState:
+    def __init__(self, sample_rate=TARGET_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.chunks = []
+        self.samples = 0         # 当前语句的采样数
+        self.undecoded = 0       # 上次解码后新增的采样数
+        self.context = np.zeros(0, dtype=np.float32)  # 前一语句末尾的上下文音频
+        self.context_text = ''   # 前一语句的最终结果，用于去掉上下文部分重复的文字
+        self.partial_sent = False  # 当前语句已输出过中间结果
+        self.ended = False
+        self.boundary = False
+
+    def add(self, audio):
+        audio = resample(audio, self.sample_rate)
+        self.chunks.append(audio)
+        self.samples += len(audio)
+        self.undecoded += len(audio)
+
+    def audio(self):
+        if len(self.chunks) > 1:
+            self.chunks = [np.concatenate(self.chunks)]
+        current = self.chunks[0] if self.chunks else np.zeros(0, dtype=np.float32)
+        return np.concatenate([self.context, current]) if len(self.context) else current
+
+    def final(self):
+        return self.ended or self.boundary or self.samples >= MAX_SEGMENT_SECONDS * TARGET_SAMPLE_RATE
+
+    def ready(self):
+        return self.final() or self.undecoded >= PARTIAL_SECONDS * TARGET_SAMPLE_RATE
+
+    def take(self, final):
+        # 返回 (待解码音频, 是否带上下文)；最终结果时开始新语句
+        audio = self.audio() if self.samples else np.zeros(0, dtype=np.float32)
+        with_context = len(self.context) > 0
+        self.undecoded = 0
+        if final:
+            forced = not (self.ended or self.boundary)
+            self.context = audio[-int(CONTEXT_SECONDS * TARGET_SAMPLE_RATE):].copy() if forced else \
+                np.zeros(0, dtype=np.float32)
+            self.chunks = []
+            self.samples = 0
+            self.boundary = False
+        return audio, with_context
+
+    def text(self, text, with_context, final):
+        text = stitch(self.context_text, text) if with_context else text
+        if final:
+            self.context_text = text if len(self.context) else ''
+        return text
+
+
+def read_frames(frames):
+    # 读线程：尽快把管道中的帧搬到内存队列，模型加载期间也不阻塞 Flask 端写入
+    stdin = sys.stdin.buffer
+    while True:
+        kind, stream_id, payload = read_frame(stdin)
+        frames.put((kind, stream_id, payload))
+        if kind is None:
+            return
+
+
+class BatchDecoder:
+    def __init__(self, asr):
+        self.asr = asr
+        self.streams = {}
+
+    def apply(self, kind, stream_id, payload):
+        if kind == FRAME_CONFIG:
+            config = json.loads(payload.decode('utf-8'))
+            self.streams[stream_id] = StreamState(int(config.get("sample_rate", TARGET_SAMPLE_RATE)))
+            return
+        state = self.streams.get(stream_id)
+        if state is None:
+            return
+        if kind == FRAME_END:
+            state.ended = True
+        elif kind == FRAME_UTTERANCE_END:
+            state.boundary = True
+        elif kind in (FRAME_FLOAT32, FRAME_INT16):
+            state.add(decode_pcm(kind, payload))
+
+    def ready_streams(self):
+        # 需要输出最终结果的流优先
+        ready = [(sid, s) for sid, s in self.streams.items() if s.ready()]
+        ready.sort(key=lambda item: not item[1].final())
+        return ready[:MAX_BATCH_SIZE]
+
+    def decode_ready(self):
+        batch = self.ready_streams()
+        if not batch:
+            return
+        audios = []
+        decoded = []
+        for stream_id, state in batch:
+            final = state.final()
+            audio, with_context = state.take(final)
+            if len(audio):
+                audios.append(audio)
+                decoded.append((stream_id, state, with_context, final))
+        if audios:
+            try:
+                texts = transcribe_batch(self.asr, audios)
+            except Exception as e:
+                texts = [None] * len(audios)
+                send({"error": f"音频解码失败: {str(e)}"})
+            now = time.time()
+            for (stream_id, state, with_context, final), text in zip(decoded, texts):
+                text = state.text(text or '', with_context, final)
+                if final:
+                    # 输出过中间结果的语句即使最终为空也发送一次，通知客户端清除中间结果
+                    if text or state.partial_sent:
+                        send({"stream": stream_id, "text": text, "ts": now})
+                    state.partial_sent = False
+                elif text:
+                    send({"stream": stream_id, "text": text, "partial": True, "ts": now})
+                    state.partial_sent = True
+        for stream_id, state in batch:
+            if state.ended:
+                del self.streams[stream_id]
+                send({"stream": stream_id, "event": "closed"})
+
+    def close_all(self):
+        for state in self.streams.values():
+            state.ended = True
+        while self.streams:
+            self.decode_ready()
+
+
+def main():
+    if len(sys.argv) < 2:
+        send({"error": "缺少模型参数"})
+        sys.exit(1)
+
+    frames = queue.Queue()
+    threading.Thread(target=read_frames, args=(frames,), daemon=True).start()
+
+    try:
+        decoder = BatchDecoder(load_asr_pipeline(sys.argv[1]))
+    except Exception as e:
+        send({"error": f"模型加载失败: {str(e)}"})
+        sys.exit(1)
+    send({"ready": True, "model": sys.argv[1], "pid": os.getpid()})
+    print(f"实时识别工作进程就绪: {sys.argv[1]} (PID: {os.getpid()})", file=sys.stderr)
+
+    finished = False
+    while not finished:
+        # 先阻塞等待一帧，再把已到达的帧全部取出，随后对所有就绪的流做一次批量解码
+        try:
+            items = [frames.get(timeout=BATCH_INTERVAL)]
+        except queue.Empty:
+            items = []
+        while True:
+            try:
+                items.append(frames.get_nowait())
+            except queue.Empty:
+                break
+        for kind, stream_id, payload in items:
+            if kind is None:
+                finished = True
+                break
+            try:
+                decoder.apply(kind, stream_id, payload)
+            except Exception as e:
+                send({"stream": stream_id, "error": f"音频帧处理失败: {str(e)}"})
+        decoder.decode_ready()
+    decoder.close_all()
+
+
+if __name__ == "__main__":
+    main()
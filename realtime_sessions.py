@@ -0,0 +1,265 @@
+import sys
+import json
+import time
+import threading
+import subprocess
+
+from pcm_frames import (encode_frame, encode_config, decode_pcm, PCM_FORMATS, FRAME_FLOAT32,
+                        FRAME_END, FRAME_UTTERANCE_END)
+from output_pump import pump_process_output, emit_latency_ms
+from vad_gate import StreamingVAD
+
+# 多会话实时识别：按 Socket.IO 会话 (sid) 管理识别流，
+# 同一模型的所有会话共用一个常驻 realtime_asr_worker.py 子进程，由其批量解码
+
+
+class SessionError(Exception):
+    pass
+
+
+class SharedRecognizer:
+    # 一个模型对应的常驻识别子进程；acquire(模型) 返回释放函数，进程存活期间持有模型目录的引用
+    def __init__(self, model, cmd, on_message, on_exit, acquire=None):
+        self.model = model
+        self.release = None
+        if acquire is not None:
+            try:
+                self.release = acquire(model)
+            except Exception as e:
+                raise SessionError(str(e))
+        try:
+            self.process = subprocess.Popen(
+                ["/bin/bash", "-c", cmd],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except Exception:
+            self._release()
+            raise
+        self.write_lock = threading.Lock()
+        self.started_at = time.time()
+        self.ready = False
+        self.on_message = on_message
+        self.on_exit = on_exit
+        threading.Thread(target=self._pump, daemon=True).start()
+        print(f"实时识别共享子进程已启动: {model} (PID: {self.process.pid})", file=sys.stderr)
+
+    def _pump(self):
+        def on_stdout(line):
+            if not line.startswith('{'):
+                print(f"实时识别子进程[{self.model}]: {line}", file=sys.stderr)
+                return
+            try:
+                message = json.loads(line)
+            except ValueError:
+                print(f"实时识别子进程[{self.model}] 输出无法解析: {line}", file=sys.stderr)
+                return
+            if message.get("ready"):
+                self.ready = True
+                return
+            self.on_message(self, message)
+
+        def on_stderr(line):
+            print(f"实时识别子进程[{self.model}]: {line}", file=sys.stderr)
+
+        try:
+            pump_process_output(self.process, on_stdout, on_stderr)
+        except Exception as e:
+            print(f"读取实时识别子进程输出失败 ({self.model}): {str(e)}", file=sys.stderr)
+        return_code = self.process.wait()
+        print(f"实时识别共享子进程已退出: {self.model} (PID: {self.process.pid}, 退出码: {return_code})", file=sys.stderr)
+        self._release()
+        self.on_exit(self)
+
+    def _release(self):
+        if self.release is not None:
+            self.release()
+            self.release = None
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        with self.write_lock:
+            self.process.stdin.write(frame)
+            self.process.stdin.flush()
+
+    def close(self):
+        with self.write_lock:
+            try:
+                self.process.stdin.close()
+            except Exception:
+                pass
+
+
+class Session:
+    def __init__(self, sid, model, recognizer, stream_id, audio_format, sample_rate, vad=None):
+        self.sid = sid
+        self.model = model
+        self.recognizer = recognizer  # 会话的流所在的子进程
+        self.stream_id = stream_id
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.vad = vad
+        self.started_at = time.time()
+        self.frames = 0
+        self.bytes = 0
+        self.stopping = False
+
+
+class RealtimeSessionManager:
+    def __init__(self, build_cmd, emit, latency_stats=None, vad_config=None, vad_counters=None, acquire=None):
+        self.build_cmd = build_cmd  # model -> shell 命令
+        self.acquire = acquire      # 传给 SharedRecognizer，子进程存活期间持有模型目录的引用
+        self.emit = emit            # (sid, message) -> None
+        self.latency_stats = latency_stats
+        self.vad_config = vad_config  # StreamingVAD 参数；为 None 时不做语音活动检测
+        self.vad_counters = vad_counters
+        self.recognizers = {}       # model -> SharedRecognizer
+        self.sessions = {}          # sid -> Session
+        self.streams = {}           # (model, stream_id) -> sid
+        self.next_stream_id = 1
+        self.lock = threading.Lock()
+
+    def _recognizer(self, model):
+        recognizer = self.recognizers.get(model)
+        if recognizer is None or not recognizer.alive():
+            recognizer = SharedRecognizer(model, self.build_cmd(model), self._on_message, self._on_exit,
+                                          acquire=self.acquire)
+            self.recognizers[model] = recognizer
+        return recognizer
+
+    def start(self, sid, model, audio_format='float32', sample_rate=16000, vad_options=None):
+        if audio_format not in PCM_FORMATS:
+            raise SessionError(f'不支持的音频格式：{audio_format}')
+        vad = None
+        if self.vad_config is not None:
+            config = dict(self.vad_config, **(vad_options or {}))
+            if config.pop('enabled', True):
+                vad = StreamingVAD(sample_rate, counters=self.vad_counters, **config)
+        with self.lock:
+            if sid in self.sessions:
+                raise SessionError('当前会话已有正在运行的识别')
+            recognizer = self._recognizer(model)
+            stream_id = self.next_stream_id
+            self.next_stream_id = self.next_stream_id % 0xFFFFFFFF + 1
+            session = Session(sid, model, recognizer, stream_id, audio_format, sample_rate, vad)
+            self.sessions[sid] = session
+            self.streams[(model, stream_id)] = sid
+        try:
+            recognizer.write(encode_config(stream=stream_id, sample_rate=int(sample_rate)))
+        except Exception:
+            self._drop(sid)
+            raise
+        return session
+
+    def feed(self, sid, data):
+        session = self.sessions.get(sid)
+        if session is None or session.stopping:
+            raise SessionError('实时识别进程未运行')
+        recognizer = session.recognizer
+        if not recognizer.alive():
+            self._drop(sid)
+            raise SessionError('实时识别进程未运行')
+        if isinstance(data, (bytes, bytearray)):
+            # 新客户端：Socket.IO 二进制附件，原样转发 PCM 字节
+            kind, payload = PCM_FORMATS[session.audio_format], bytes(data)
+        else:
+            # 旧客户端：JSON 浮点数组，直接转换为 float32 帧
+            import numpy as np
+            kind, payload = FRAME_FLOAT32, np.asarray(data, dtype='<f4').tobytes()
+
+        if session.vad is None:
+            payloads, boundary = [payload], False
+        else:
+            payloads, boundary = session.vad.process(payload, decode_pcm(kind, payload))
+        frames = [encode_frame(kind, p, session.stream_id) for p in payloads]
+        if boundary:
+            frames.append(encode_frame(FRAME_UTTERANCE_END, stream=session.stream_id))
+        if frames:
+            data = b''.join(frames)
+            recognizer.write(data)
+            session.frames += len(payloads)
+            session.bytes += len(data)
+
+    def stop(self, sid):
+        # 发送流结束帧；子进程解码完剩余音频后返回 closed 事件，再通知客户端
+        session = self.sessions.get(sid)
+        if session is None:
+            return False
+        session.stopping = True
+        if session.vad is not None:
+            session.vad.finish()
+        recognizer = session.recognizer
+        if not recognizer.alive():
+            self._drop(sid)
+            self.emit(sid, {'text': '实时识别已停止'})
+            return True
+        try:
+            recognizer.write(encode_frame(FRAME_END, stream=session.stream_id))
+        except Exception:
+            self._drop(sid)
+            self.emit(sid, {'text': '实时识别已停止'})
+        return True
+
+    def _drop(self, sid):
+        with self.lock:
+            session = self.sessions.pop(sid, None)
+            if session:
+                self.streams.pop((session.model, session.stream_id), None)
+        return session
+
+    def _on_message(self, recognizer, message):
+        stream_id = message.pop('stream', None)
+        if stream_id is None:
+            print(f"实时识别子进程[{recognizer.model}]: {message}", file=sys.stderr)
+            return
+        sid = self.streams.get((recognizer.model, stream_id))
+        session = self.sessions.get(sid)
+        if session is None or session.recognizer is not recognizer:
+            return
+        if message.get('event') == 'closed':
+            self._drop(sid)
+            self.emit(sid, {'text': '实时识别已停止'})
+            return
+        latency = emit_latency_ms(message)
+        message.pop('ts', None)
+        self.emit(sid, message)
+        if latency is not None and self.latency_stats is not None:
+            self.latency_stats.record(latency)
+
+    def _on_exit(self, recognizer):
+        with self.lock:
+            if self.recognizers.get(recognizer.model) is recognizer:
+                del self.recognizers[recognizer.model]
+            # 只结束流在该进程上的会话；同一模型已改由新进程处理的会话不受影响
+            affected = [sid for sid, session in self.sessions.items() if session.recognizer is recognizer]
+        for sid in affected:
+            self._drop(sid)
+            self.emit(sid, {'error': '实时识别子进程已退出'})
+
+    def shutdown_idle(self, model=None):
+        # 关闭没有活动会话的常驻子进程
+        with self.lock:
+            busy = {s.model for s in self.sessions.values()}
+            idle = [r for m, r in self.recognizers.items() if m not in busy and (model is None or m == model)]
+        for recognizer in idle:
+            recognizer.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'recognizers': {
+                    model: {
+                        'pid': r.process.pid,
+                        'alive': r.alive(),
+                        'ready': r.ready,
+                        'uptime': round(time.time() - r.started_at, 1),
+                        'sessions': sum(1 for s in self.sessions.values() if s.model == model),
+                    }
+                    for model, r in self.recognizers.items()
+                },
+                'sessions': len(self.sessions),
+                'vad': self.vad_counters.snapshot() if self.vad_counters is not None else None,
+            }
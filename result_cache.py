@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import wave
+import time
+import shutil
+import hashlib
+import threading
+
+# 磁盘结果缓存：按内容哈希存放，按总大小做 LRU 淘汰（以最后访问时间排序），
+# 每个命名空间（例如模型名）一个子目录，可整体失效；
+# 另含合并并发相同请求的 SingleFlight
+
+
+def safe_name(name):
+    # 命名空间目录名：保留可读前缀并附加哈希，避免特殊字符和路径穿越
+    readable = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)[:60]
+    return f"{readable}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+
+
+class DiskLRUCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = {}  # 路径 -> [大小, 最后访问时间]
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(('.tmp', '.part')):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self.entries[path] = [stat.st_size, stat.st_mtime]
+                self.total_bytes += stat.st_size
+
+    def path_for(self, namespace, key, suffix=''):
+        return os.path.join(self.root, safe_name(namespace), key[:2], key + suffix)
+
+    def lookup(self, path):
+        # 命中时更新访问时间并返回路径，否则返回 None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or not os.path.exists(path):
+                if entry is not None:
+                    self._forget(path)
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            entry[1] = now
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return path
+
+    def store(self, path, data=None, source=None):
+        # 写入 bytes 或移动已有文件；先写临时文件再原子替换
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        if source is not None:
+            shutil.move(source, tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            if path in self.entries:
+                self.total_bytes -= self.entries[path][0]
+            self.entries[path] = [size, time.time()]
+            self.total_bytes += size
+            self._evict()
+        return path
+
+    def track(self, path):
+        # 把缓存目录下由其他组件生成的文件（例如合成结果的 opus/mp3 压缩副本）计入容量并更新访问时间，
+        # 之后与缓存条目一起按 LRU 淘汰；不在缓存目录下时返回 False
+        if not os.path.abspath(path).startswith(os.path.abspath(self.root) + os.sep):
+            return False
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        with self.lock:
+            if path in self.entries:
+                self.total_bytes -= self.entries[path][0]
+            self.entries[path] = [size, time.time()]
+            self.total_bytes += size
+            self._evict()
+        return True
+
+    def _forget(self, path):
+        entry = self.entries.pop(path, None)
+        if entry:
+            self.total_bytes -= entry[0]
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for path, _ in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._forget(path)
+            self.evictions += 1
+
+    def invalidate(self, namespace):
+        # 删除整个命名空间，返回删除的条目数
+        directory = os.path.join(self.root, safe_name(namespace))
+        with self.lock:
+            prefix = directory + os.sep
+            removed = [path for path in self.entries if path.startswith(prefix)]
+            for path in removed:
+                self._forget(path)
+        shutil.rmtree(directory, ignore_errors=True)
+        return len(removed)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+def audio_digest(path, chunk_size=1024 * 1024):
+    # WAV 按采样参数和 PCM 数据计算哈希（忽略文件头中的元数据差异），其他格式按文件内容
+    digest = hashlib.sha256()
+    try:
+        with wave.open(path, 'rb') as wav:
+            digest.update(f"pcm:{wav.getnchannels()}:{wav.getsampwidth()}:{wav.getframerate()}".encode('ascii'))
+            frames_per_chunk = max(chunk_size // max(wav.getsampwidth() * wav.getnchannels(), 1), 1)
+            while True:
+                frames = wav.readframes(frames_per_chunk)
+                if not frames:
+                    break
+                digest.update(frames)
+        return digest.hexdigest()
+    except (wave.Error, EOFError):
+        digest = hashlib.sha256(b"file:")
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def directory_version(path):
+    # 模型版本指纹：顶层条目的名称、大小和修改时间
+    digest = hashlib.sha1()
+    try:
+        for entry in sorted(os.scandir(path), key=lambda e: e.name):
+            stat = entry.stat()
+            digest.update(f"{entry.name}:{stat.st_size}:{int(stat.st_mtime)}".encode('utf-8'))
+    except OSError:
+        return 'missing'
+    return digest.hexdigest()[:16]
+
+
+class TranscriptionCache:
+    # 识别结果缓存：键为 音频哈希 + 模型名 + 模型版本
+    def __init__(self, root, model_root, max_bytes):
+        self.store = DiskLRUCache(root, max_bytes)
+        self.model_root = model_root
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def model_version(self, model):
+        with self.lock:
+            version = self.versions.get(model)
+            if version is None:
+                version = directory_version(os.path.join(self.model_root, model))
+                self.versions[model] = version
+            return version
+
+    def _path(self, model, digest):
+        key = hashlib.sha256(f"{digest}:{model}:{self.model_version(model)}".encode('utf-8')).hexdigest()
+        return self.store.path_for(model, key, '.json')
+
+    def get(self, model, digest):
+        path = self.store.lookup(self._path(model, digest))
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('text')
+        except (OSError, ValueError):
+            return None
+
+    def put(self, model, digest, text):
+        payload = json.dumps({'model': model, 'text': text, 'created': time.time()}, ensure_ascii=False)
+        try:
+            self.store.store(self._path(model, digest), payload.encode('utf-8'))
+        except OSError as e:
+            print(f"写入识别缓存失败: {str(e)}", file=sys.stderr)
+
+    def invalidate(self, model):
+        with self.lock:
+            self.versions.pop(model, None)
+        removed = self.store.invalidate(model)
+        print(f"识别缓存已失效: {model} ({removed} 条)", file=sys.stderr)
+        return removed
+
+    def stats(self):
+        return self.store.stats()
+
+
+class SingleFlight:
+    # 相同键的并发调用只执行一次，其余调用等待并共享结果（或异常）
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # 键 -> [Event, 结果, 异常]
+        self.shared = 0
+
+    def do(self, key, fn):
+        # 返回 (结果, 是否由本次调用执行)
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = [threading.Event(), None, None]
+                self.calls[key] = call
+            else:
+                self.shared += 1
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1], False
+        try:
+            call[1] = fn()
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call[0].set()
+        return call[1], True
+
+
+class SynthesisCache:
+    # 语音合成结果缓存：键为 模型名 + 模型版本 + 文本 + 音色/情感/音调/语速/音量，
+    # 值为 WAV 文件本身，存放在音频输出目录下以便直接通过 /audio 访问
+    PARAM_KEYS = ('voice', 'emotion_tone', 'pitch', 'speech_rate', 'volume')
+
+    def __init__(self, root, model_root, max_bytes):
+        self.store = DiskLRUCache(root, max_bytes)
+        self.model_root = model_root
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+
+    def model_version(self, model):
+        with self.lock:
+            version = self.versions.get(model)
+            if version is None:
+                version = directory_version(os.path.join(self.model_root, model))
+                self.versions[model] = version
+            return version
+
+    def path_for(self, model, text, params):
+        fields = {key: params.get(key) for key in self.PARAM_KEYS}
+        fields.update(model=model, version=self.model_version(model), text=text.strip())
+        key = hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return self.store.path_for(model, key, '.wav')
+
+    def get_or_create(self, path, synthesize):
+        # synthesize(临时输出路径) 负责写出 WAV；返回 (缓存文件路径, 是否命中或共享了其他请求的结果)
+        def produce():
+            hit = self.store.lookup(path)
+            if hit is not None:
+                return hit, True
+            tmp_path = f"{path}.{threading.get_ident()}.wav.part"
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                synthesize(tmp_path)
+                return self.store.store(path, source=tmp_path), False
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        (result, cached), leader = self.flights.do(path, produce)
+        return result, cached or not leader
+
+    def track(self, path):
+        return self.store.track(path)
+
+    def invalidate(self, model):
+        with self.lock:
+            self.versions.pop(model, None)
+        removed = self.store.invalidate(model)
+        print(f"语音合成缓存已失效: {model} ({removed} 条)", file=sys.stderr)
+        return removed
+
+    def stats(self):
+        return dict(self.store.stats(), single_flight_shared=self.flights.shared)
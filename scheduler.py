@@ -0,0 +1,278 @@
+import os
+import sys
+import time
+import uuid
+import threading
+import subprocess
+
+# 统一任务调度：推理、测试、训练等子进程任务都提交到这里，
+# 按 CPU 槽位和内存预算决定能否启动；等待中的任务按 (优先级, 提交顺序) 排队，
+# 队首放不下时后面的任务也不越过它，保证同优先级先进先出且大任务不会饿死
+# 一部分 CPU 槽位和内存只留给交互式任务：测试、训练等后台任务占满其余资源时，语音合成等请求仍能立即运行
+# 任务函数的第一个参数为 Job，子进程通过 job.run_process / job.attach 登记以便取消时终止
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+PRIORITY_INTERACTIVE = 0  # 语音合成、语音克隆等用户等待结果的请求
+PRIORITY_TEST = 1         # 模型测试
+PRIORITY_TRAINING = 2     # 模型训练
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def total_memory_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return 8192
+
+
+class Job:
+    def __init__(self, seq, kind, fn, args, kwargs, cpu, memory_mb, priority, owner=None, meta=None):
+        self.id = uuid.uuid4().hex
+        self.seq = seq
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cpu = cpu
+        self.memory_mb = memory_mb
+        self.priority = priority
+        self.owner = owner  # 例如提交任务的 Socket.IO 会话
+        self.meta = meta or {}
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.result = None
+        self.processes = []
+        self.cancel_requested = False
+        self.lock = threading.Lock()
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def attach(self, process):
+        # 登记子进程；任务已被取消时立即终止
+        with self.lock:
+            self.processes.append(process)
+            cancelled = self.cancel_requested
+        if cancelled:
+            process.terminate()
+
+    def detach(self, process):
+        with self.lock:
+            if process in self.processes:
+                self.processes.remove(process)
+
+    def terminate(self):
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def run_process(self, cmd, on_line, env=None):
+        # 运行子进程并把 stdout/stderr 逐行交给 on_line(行, 是否为 stderr)，返回退出码
+        self.check_cancelled()
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            env=env
+        )
+        self.attach(process)
+
+        def read_stream(stream, is_err):
+            for line in iter(stream.readline, ''):
+                line = line.strip()
+                if line:
+                    on_line(line, is_err)
+            stream.close()
+
+        readers = [threading.Thread(target=read_stream, args=(process.stdout, False), daemon=True),
+                   threading.Thread(target=read_stream, args=(process.stderr, True), daemon=True)]
+        for reader in readers:
+            reader.start()
+        try:
+            return process.wait()
+        finally:
+            for reader in readers:
+                reader.join(timeout=5)
+            self.detach(process)
+
+    def info(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'priority': self.priority,
+            'cpu': self.cpu,
+            'memory_mb': self.memory_mb,
+            'owner': self.owner,
+            'meta': self.meta,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+class Scheduler:
+    def __init__(self, cpu_slots=None, memory_mb=None, kind_limits=None, history=200, reserved_cpu=0,
+                 reserved_memory_mb=0):
+        self.cpu_slots = max(1, cpu_slots or os.cpu_count() or 1)
+        self.memory_mb = max(1, memory_mb or int(total_memory_mb() * 0.8))
+        # 为交互式任务保留的资源，后台任务至少还能使用 1 个槽位
+        self.reserved_cpu = min(max(reserved_cpu, 0), self.cpu_slots - 1)
+        self.reserved_memory_mb = min(max(reserved_memory_mb, 0), self.memory_mb - 1)
+        self.kind_limits = kind_limits or {}  # kind -> 同时运行的上限（可选）
+        self.lock = threading.Lock()
+        self.pending = []  # 按 (优先级, 提交顺序) 排序
+        self.running = []
+        self.jobs = {}  # id -> Job（包括最近完成的任务）
+        self.finished = []
+        self.history = history
+        self.seq = 0
+
+    def submit(self, kind, fn, *args, cpu=1, memory_mb=0, priority=PRIORITY_INTERACTIVE, owner=None, meta=None,
+               **kwargs):
+        # 返回 (任务, 排队位置)；超过机器总量的资源需求按总量计，保证空闲时总能运行
+        # 后台任务按去掉保留资源后的总量计
+        cpu_limit, memory_limit = self._limits(priority)
+        with self.lock:
+            self.seq += 1
+            job = Job(self.seq, kind, fn, args, kwargs, min(max(cpu, 0), cpu_limit),
+                      min(max(memory_mb, 0), memory_limit), priority, owner, meta)
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self.pending.sort(key=lambda j: (j.priority, j.seq))
+            self._dispatch()
+            position = self.pending.index(job) if job in self.pending else 0
+        print(f"任务已提交: {kind} {job.id} (优先级 {priority}, CPU {job.cpu}, 内存 {job.memory_mb} MB, "
+              f"排队位置 {position})", file=sys.stderr)
+        return job, position
+
+    def _limits(self, priority):
+        if priority == PRIORITY_INTERACTIVE:
+            return self.cpu_slots, self.memory_mb
+        return self.cpu_slots - self.reserved_cpu, self.memory_mb - self.reserved_memory_mb
+
+    def _free(self):
+        cpu = self.cpu_slots - sum(job.cpu for job in self.running)
+        memory = self.memory_mb - sum(job.memory_mb for job in self.running)
+        return cpu, memory
+
+    def _dispatch(self):
+        # 调用方持有 self.lock
+        cpu, memory = self._free()
+        for job in list(self.pending):
+            limit = self.kind_limits.get(job.kind)
+            if limit is not None and sum(1 for j in self.running if j.kind == job.kind) >= limit:
+                continue  # 该类任务已达并发上限，不阻塞其他类任务
+            if job.priority == PRIORITY_INTERACTIVE:
+                fits = job.cpu <= cpu and job.memory_mb <= memory
+            else:
+                fits = job.cpu <= cpu - self.reserved_cpu and job.memory_mb <= memory - self.reserved_memory_mb
+            if not fits:
+                break
+            self.pending.remove(job)
+            self.running.append(job)
+            job.state = RUNNING
+            job.started_at = time.time()
+            cpu -= job.cpu
+            memory -= job.memory_mb
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job):
+        try:
+            job.result = job.fn(job, *job.args, **job.kwargs)
+            state, error = (CANCELLED if job.cancel_requested else DONE), None
+        except JobCancelled:
+            state, error = CANCELLED, None
+        except Exception as e:
+            print(f"{job.kind} 任务失败 ({job.id}): {str(e)}", file=sys.stderr)
+            state, error = (CANCELLED if job.cancel_requested else FAILED), str(e)
+        with self.lock:
+            self.running.remove(job)
+            self._finish(job, state, error)
+            self._dispatch()
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished_at = time.time()
+        self.finished.append(job.id)
+        while len(self.finished) > self.history:
+            self.jobs.pop(self.finished.pop(0), None)
+
+    def position(self, job_id):
+        with self.lock:
+            for index, job in enumerate(self.pending):
+                if job.id == job_id:
+                    return index
+        return None
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def active(self, kind=None):
+        # 排队中和运行中的任务
+        with self.lock:
+            return [job for job in self.running + self.pending if kind is None or job.kind == kind]
+
+    def cancel(self, job_id):
+        # 排队中的任务直接移除；运行中的任务标记取消并终止其子进程
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state not in (QUEUED, RUNNING):
+                return False
+            job.cancel_requested = True
+            if job.state == QUEUED:
+                self.pending.remove(job)
+                self._finish(job, CANCELLED)
+                self._dispatch()
+                return True
+        job.terminate()
+        return True
+
+    def list_jobs(self, kind=None, state=None):
+        with self.lock:
+            jobs = [job for job in self.jobs.values()
+                    if (kind is None or job.kind == kind) and (state is None or job.state == state)]
+            positions = {job.id: index for index, job in enumerate(self.pending)}
+            result = []
+            for job in sorted(jobs, key=lambda j: j.seq):
+                info = job.info()
+                info['position'] = positions.get(job.id)
+                result.append(info)
+            return result
+
+    def stats(self):
+        with self.lock:
+            cpu, memory = self._free()
+            return {
+                'cpu_slots': self.cpu_slots,
+                'memory_mb': self.memory_mb,
+                'free_cpu': cpu,
+                'free_memory_mb': memory,
+                'kind_limits': self.kind_limits,
+                'reserved_cpu': self.reserved_cpu,
+                'reserved_memory_mb': self.reserved_memory_mb,
+                'queued': len(self.pending),
+                'running': len(self.running),
+            }
@@ -8,6 +8,16 @@ export const loadModel = (model) => axios.post(`${API_BASE_URL}/load_model`, { m
 export const recognizeAudio = (formData) => axios.post(`${API_BASE_URL}/recognize`, formData, {
   headers: { 'Content-Type': 'multipart/form-data' }
 });
+// 批量识别：返回 fetch Response，按行读取 NDJSON 结果
+export const recognizeBatch = (formData) => fetch(`${API_BASE_URL}/recognize_batch`, {
+  method: 'POST',
+  body: formData
+});
+// 长音频分段识别：返回 fetch Response，逐行读取带时间戳的分段结果
+export const recognizeLong = (formData) => fetch(`${API_BASE_URL}/recognize_long`, {
+  method: 'POST',
+  body: formData
+});
 export const listModels = (section) => axios.get(`${API_BASE_URL}/list_models?section=${section}`);
 export const uploadDataset = (formData) => axios.post(`${API_BASE_URL}/upload_dataset`, formData, {
   headers: { 'Content-Type': 'multipart/form-data' }
@@ -26,8 +36,32 @@ export const vitsTest = (data) => axios.post(`${API_BASE_URL}/vits_test`, data);
 export const getVitsTrainLog = () => `${API_BASE_URL}/vits_train_log`;
 export const getVitsTestLog = () => `${API_BASE_URL}/vits_test_log`;
 
-export const listModelFiles = (section) => axios.get(`${API_BASE_URL}/list_models?section=${section}`);
+export const listModelFiles = (section) => axios.get(`${API_BASE_URL}/list_models?section=${section}&detail=1`);
 export const uploadModelFile = (section, modelName, formData) => axios.post(`${API_BASE_URL}/upload_model_file?section=${section}&model_name=${modelName}`, formData, {
   headers: { 'Content-Type': 'multipart/form-data' }
 });
-export const deleteModelFile = (section, modelName) => axios.post(`${API_BASE_URL}/delete_model_file?section=${section}&model_name=${modelName}`);
\ No newline at end of file
+export const deleteModelFile = (section, modelName) => axios.post(`${API_BASE_URL}/delete_model_file?section=${section}&model_name=${modelName}`);
+export const listJobs = (params = {}) => axios.get(`${API_BASE_URL}/jobs`, { params });
+export const getJob = (jobId) => axios.get(`${API_BASE_URL}/jobs/${jobId}`);
+export const cancelJob = (jobId) => axios.post(`${API_BASE_URL}/jobs/${jobId}/cancel`);
+export const listTrainingMetrics = () => axios.get(`${API_BASE_URL}/training_metrics`);
+export const getTrainingMetrics = (runId, params = {}) => axios.get(`${API_BASE_URL}/training_metrics/${runId}`, { params });
+export const getDatasetManifest = (datasetPath, detail = false) => axios.get(`${API_BASE_URL}/dataset_manifest`, {
+  params: { dataset_path: datasetPath, detail: detail ? 1 : 0 }
+});
+export const preprocessDataset = (data) => axios.post(`${API_BASE_URL}/preprocess_dataset`, data);
+export const getPreprocessLog = () => `${API_BASE_URL}/preprocess_log`;
+export const getDedupReport = (datasetPath) => axios.get(`${API_BASE_URL}/dedup_report`, {
+  params: { dataset_path: datasetPath }
+});
+export const initModelUpload = (data) => axios.post(`${API_BASE_URL}/model_upload/init`, data);
+export const uploadModelChunk = (uploadId, index, blob, checksum) => axios.put(`${API_BASE_URL}/model_upload/${uploadId}/chunk/${index}`, blob, {
+  headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-Sha256': checksum }
+});
+export const getModelUpload = (uploadId) => axios.get(`${API_BASE_URL}/model_upload/${uploadId}`);
+export const completeModelUpload = (uploadId) => axios.post(`${API_BASE_URL}/model_upload/${uploadId}/complete`);
+export const abortModelUpload = (uploadId) => axios.post(`${API_BASE_URL}/model_upload/${uploadId}/abort`);
+export const getStorageGcStats = () => axios.get(`${API_BASE_URL}/storage_gc/stats`);
+export const runStorageGc = (dryRun = false) => axios.post(`${API_BASE_URL}/storage_gc/run`, null, {
+  params: { dry_run: dryRun ? 1 : 0 }
+});
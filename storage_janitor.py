@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import shutil
+import threading
+
+from audio_variants import FORMATS as VARIANT_FORMATS
+
+# 上传目录与音频输出目录的配额清理：每个目录可配置总大小上限和最长保留时间，
+# 后台线程定期扫描，先删除超过保留时间的条目，仍超出大小上限时按最后访问时间从旧到新删除
+# 清理单位为目录下的顶层条目：上传的录音、克隆参考音频、数据集 uuid 目录、批量/长音频识别的临时目录、
+# 生成的 output_*/test_*/tts_output_* 音频；音频的 opus/mp3 压缩副本（<原文件名>.<格式>）与原文件一起计算和删除
+# 仍被任务、缓存或数据集清单引用的条目（由 pins 回调给出路径）以及最近 grace 秒内访问或修改过的条目不会被删除
+# 有多个硬链接的文件（数据集去重的 link 方式）按链接数均摊大小，删除其中一个链接实际释放不了空间
+
+VARIANT_EXTENSIONS = tuple(ext for ext, _, _ in VARIANT_FORMATS.values())
+
+
+class StorageJanitor:
+    def __init__(self, quotas, pins=None, on_removed=None, interval=600.0, grace=3600.0):
+        # quotas: 目录 -> {'max_bytes': 字节数, 'max_age': 秒数, 'exclude': [不参与清理的顶层名称]}，0 表示不限制
+        # pins(): 返回仍被引用的文件或目录路径；on_removed(路径): 条目删除后调用（例如移除数据集指纹）
+        self.quotas = {os.path.abspath(root): quota for root, quota in quotas.items()}
+        self.pins = pins
+        self.on_removed = on_removed
+        self.interval = interval
+        self.grace = grace
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()
+        self.accessed = {}  # (目录, 顶层名称) -> 最后访问时间（服务下载等访问时记录，不依赖文件系统 atime）
+        self.runs = 0
+        self.removed = 0
+        self.reclaimed_bytes = 0
+        self.last_report = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run()
+            except Exception as e:
+                print(f"存储清理失败: {str(e)}", file=sys.stderr)
+
+    def _locate(self, path):
+        # 路径 -> (所属配额目录, 顶层名称)，不在任何配额目录下时返回 None
+        path = os.path.abspath(path)
+        for root in self.quotas:
+            relative = os.path.relpath(path, root)
+            if relative == '.' or relative.startswith('..'):
+                continue
+            name = relative.split(os.sep, 1)[0]
+            for ext in VARIANT_EXTENSIONS:
+                if name.endswith(ext) and os.path.exists(os.path.join(root, name[:-len(ext)])):
+                    name = name[:-len(ext)]
+                    break
+            return root, name
+        return None
+
+    def touch(self, path):
+        location = self._locate(path)
+        if location is not None:
+            with self.lock:
+                self.accessed[location] = time.time()
+
+    def _scan(self, root, exclude):
+        # 返回 {顶层名称: {'paths', 'bytes', 'last_access'}}
+        units = {}
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            return units
+        names = {entry.name for entry in entries}
+        for entry in entries:
+            name = entry.name
+            if name.startswith('.') or name in exclude or name.endswith(('.tmp', '.part')):
+                continue
+            for ext in VARIANT_EXTENSIONS:
+                if name.endswith(ext) and name[:-len(ext)] in names:
+                    name = name[:-len(ext)]
+                    break
+            unit = units.setdefault(name, {'paths': [], 'bytes': 0, 'last_access': 0.0})
+            unit['paths'].append(entry.path)
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if not entry.is_dir(follow_symlinks=False):
+                files = [stat]
+            else:
+                # 目录自身的访问时间会被扫描（包括本清理）更新，只取修改时间
+                unit['last_access'] = max(unit['last_access'], stat.st_mtime)
+                files = []
+                for dirpath, _, filenames in os.walk(entry.path):
+                    for filename in filenames:
+                        try:
+                            files.append(os.stat(os.path.join(dirpath, filename), follow_symlinks=False))
+                        except OSError:
+                            continue
+            for stat in files:
+                unit['last_access'] = max(unit['last_access'], stat.st_atime, stat.st_mtime)
+                unit['bytes'] += stat.st_size // max(stat.st_nlink, 1)
+        with self.lock:
+            for name, unit in units.items():
+                unit['last_access'] = max(unit['last_access'], self.accessed.get((root, name), 0.0))
+        return units
+
+    def _pinned(self):
+        pinned = set()
+        if self.pins is None:
+            return pinned
+        for path in self.pins():
+            if path:
+                location = self._locate(path)
+                if location is not None:
+                    pinned.add(location)
+        return pinned
+
+    def _remove(self, unit):
+        for path in unit['paths']:
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            if self.on_removed is not None:
+                try:
+                    self.on_removed(path)
+                except Exception as e:
+                    print(f"清理回调失败 {path}: {str(e)}", file=sys.stderr)
+
+    def run(self, dry_run=False):
+        # 清理全部配额目录，返回每个目录的报告；dry_run 时只计算将删除的条目
+        with self.run_lock:
+            now = time.time()
+            pinned = self._pinned()
+            reports = []
+            for root, quota in self.quotas.items():
+                units = self._scan(root, set(quota.get('exclude', ())))
+                max_bytes = quota.get('max_bytes') or 0
+                max_age = quota.get('max_age') or 0
+                total = sum(unit['bytes'] for unit in units.values())
+                report = {'root': root, 'entries': len(units), 'bytes_before': total, 'max_bytes': max_bytes,
+                          'max_age': max_age, 'pinned': 0, 'expired': 0, 'evicted': 0, 'reclaimed_bytes': 0,
+                          'removed': [], 'errors': []}
+                candidates = []
+                for name, unit in units.items():
+                    if (root, name) in pinned:
+                        report['pinned'] += 1
+                    elif now - unit['last_access'] > self.grace:
+                        candidates.append((name, unit))
+                candidates.sort(key=lambda item: item[1]['last_access'])
+
+                for name, unit in candidates:
+                    age = now - unit['last_access']
+                    if max_age and age > max_age:
+                        reason = 'expired'
+                    elif max_bytes and total > max_bytes:
+                        reason = 'evicted'
+                    else:
+                        continue
+                    if not dry_run:
+                        try:
+                            self._remove(unit)
+                        except OSError as e:
+                            report['errors'].append({'name': name, 'error': str(e)})
+                            continue
+                        with self.lock:
+                            self.accessed.pop((root, name), None)
+                    total -= unit['bytes']
+                    report[reason] += 1
+                    report['reclaimed_bytes'] += unit['bytes']
+                    report['removed'].append({'name': name, 'bytes': unit['bytes'], 'reason': reason,
+                                              'idle_seconds': round(age)})
+                report['bytes_after'] = total
+                reports.append(report)
+                if report['removed']:
+                    print(f"存储清理{'（预览）' if dry_run else ''}: {root} 删除 {len(report['removed'])} 项, "
+                          f"释放 {report['reclaimed_bytes'] // (1024 * 1024)} MB (过期 {report['expired']}, "
+                          f"超出配额 {report['evicted']}, 保留引用中 {report['pinned']})", file=sys.stderr)
+            result = {'dry_run': dry_run, 'finished_at': time.time(), 'roots': reports,
+                      'reclaimed_bytes': sum(r['reclaimed_bytes'] for r in reports)}
+            if not dry_run:
+                with self.lock:
+                    self.runs += 1
+                    self.removed += sum(len(r['removed']) for r in reports)
+                    self.reclaimed_bytes += result['reclaimed_bytes']
+                    self.last_report = result
+            return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                'quotas': self.quotas,
+                'interval': self.interval,
+                'grace': self.grace,
+                'runs': self.runs,
+                'removed': self.removed,
+                'reclaimed_bytes': self.reclaimed_bytes,
+                'last_report': self.last_report,
+            }
@@ -0,0 +1,62 @@
+import re
+
+# 合成文本切分：先按句末标点和换行切句，过长的句子再按逗号等停顿标点切开，
+# 仍然过长时按长度硬切；标点保留在所属片段末尾
+
+SENTENCE_END = re.compile(r'([。！？；!?;…]+["”’）)]*|\n+)')
+CLAUSE_END = re.compile(r'([，,、：:]+)')
+
+
+def _split_keep(pattern, text):
+    parts = pattern.split(text)
+    pieces = []
+    for i in range(0, len(parts), 2):
+        piece = parts[i] + (parts[i + 1] if i + 1 < len(parts) else '')
+        if piece.strip():
+            pieces.append(piece.strip())
+    return pieces
+
+
+def _merge_short(pieces, max_chars):
+    # 相邻的短片段合并，避免每个片段都单独走一次模型
+    merged = []
+    for piece in pieces:
+        if merged and len(merged[-1]) + len(piece) <= max_chars:
+            merged[-1] += piece
+        else:
+            merged.append(piece)
+    return merged
+
+
+def split_sentences(text, max_chars=60):
+    segments = []
+    for sentence in _split_keep(SENTENCE_END, text):
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+            continue
+        for clause in _merge_short(_split_keep(CLAUSE_END, sentence), max_chars):
+            segments.extend(clause[i:i + max_chars] for i in range(0, len(clause), max_chars))
+    return [s for s in segments if s.strip('。！？；!?;…，,、：: \n"”’）)')] or ([text.strip()] if text.strip() else [])
+
+
+def normalize_text(text):
+    # 统一全角空格和各类换行，合并多余空白，保留段落分隔
+    text = text.replace('　', ' ').replace('\r\n', '\n').replace('\r', '\n')
+    text = re.sub(r'\.{3,}|。{2,}', '…', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    return text.strip()
+
+
+def segment_text(text, max_chars=80):
+    # 长文本并行合成用的分段：规范化后切句，再把相邻短句合并到 max_chars 以内；
+    # 段落结尾的片段保留 "\n" 以便拼接时插入更长的停顿
+    segments = []
+    for paragraph in normalize_text(text).split('\n\n'):
+        merged = _merge_short(split_sentences(paragraph, max_chars), max_chars)
+        if merged:
+            merged[-1] += '\n'
+            segments.extend(merged)
+    if segments:
+        segments[-1] = segments[-1].rstrip('\n')
+    return segments
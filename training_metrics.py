@@ -0,0 +1,214 @@
+import os
+import re
+import ast
+import json
+import math
+import time
+import struct
+import threading
+from array import array
+
+import numpy as np
+
+# 训练指标时序：从训练输出行中解析 step、epoch、loss、验证 loss、学习率和吞吐量，
+# 每个训练任务按列存放在 array('d') 中，并以定长二进制记录追加写入磁盘；
+# 查询时按请求的像素宽度做 min/max 抽稀，百万级步数也只返回约 2×宽度 个点
+
+FIELDS = ('time', 'step', 'epoch', 'loss', 'learning_rate', 'throughput', 'val_loss')
+RECORD = struct.Struct('<' + 'd' * len(FIELDS))
+NAN = float('nan')
+
+# 键名别名 -> 字段；带 train/val 等前缀的键名中空格统一为下划线后查表，未列出的组合忽略
+KEY_ALIASES = {
+    'step': 'step', 'global_step': 'step', 'iter': 'step', 'iteration': 'step',
+    'epoch': 'epoch',
+    'loss': 'loss', 'train_loss': 'loss', 'training_loss': 'loss', 'total_loss': 'loss', 'loss_g': 'loss',
+    'val_loss': 'val_loss', 'valid_loss': 'val_loss', 'validation_loss': 'val_loss', 'eval_loss': 'val_loss',
+    'lr': 'learning_rate', 'learning_rate': 'learning_rate',
+    'it/s': 'throughput', 'samples_per_second': 'throughput', 'train_samples_per_second': 'throughput',
+    'throughput': 'throughput',
+}
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+# 键名按完整的词匹配；不接受复数 steps/epochs，"Total optimization steps = 1000" 这类说明文字不计入
+KEY_VALUE = re.compile(r'\b((?:(?:train|training|val|valid|validation|eval|total)[ _])?'
+                       r'(?:global_step|samples_per_second|learning_rate|loss_g|iteration|throughput|'
+                       r'step|iter|epoch|loss|lr))\b'
+                       r'["\']?\s*[:=]?\s*(' + NUMBER + r')(?:\s*/\s*\d+)?', re.IGNORECASE)
+PROGRESS = re.compile(r'\|\s*(\d+)/(\d+)\s*\[[^\]]*?(' + NUMBER + r')\s*(it/s|s/it)')
+
+
+def parse_metrics(line):
+    # 返回解析出的字段字典，无指标时返回 None
+    values = {}
+    stripped = line.strip()
+    if stripped.startswith('{') and stripped.endswith('}'):
+        # transformers Trainer 输出的 {'loss': 0.5, 'learning_rate': 1e-05, 'epoch': 0.1}
+        try:
+            data = ast.literal_eval(stripped)
+        except (ValueError, SyntaxError):
+            data = None
+        if isinstance(data, dict):
+            for key, value in data.items():
+                field = KEY_ALIASES.get(str(key).lower())
+                if field and isinstance(value, (int, float)):
+                    values[field] = float(value)
+            return values or None
+    for key, value in KEY_VALUE.findall(line):
+        field = KEY_ALIASES.get(re.sub(r'\s+', '_', key.lower()))
+        if field and field not in values:
+            values[field] = float(value)
+    progress = PROGRESS.search(line)
+    if progress:
+        # tqdm 的 n/total 通常每个 epoch 从 0 重新计数，由 MetricRun 换算为累计步数，只在没有显式步数时使用
+        values['progress'] = float(progress.group(1))
+        values['progress_total'] = float(progress.group(2))
+        rate = float(progress.group(3))
+        values.setdefault('throughput', rate if progress.group(4) == 'it/s' else (1.0 / rate if rate else NAN))
+    return values or None
+
+
+def decimate(xs, ys, width):
+    # min/max 抽稀：按顺序把点分成约 width 个等长桶，每桶保留最小值和最大值两个点（按出现顺序）
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    valid = ~(np.isnan(xs) | np.isnan(ys))
+    xs, ys = xs[valid], ys[valid]
+    if width <= 0 or len(ys) <= width * 2:
+        return xs.tolist(), ys.tolist()
+    size = len(ys) // width
+    usable = size * width
+    blocks = ys[:usable].reshape(width, size)
+    offsets = np.arange(width) * size
+    picks = [offsets + blocks.argmin(axis=1), offsets + blocks.argmax(axis=1)]
+    if usable < len(ys):
+        tail = ys[usable:]
+        picks.append(np.array([usable + tail.argmin(), usable + tail.argmax()]))
+    index = np.unique(np.concatenate(picks))
+    return xs[index].tolist(), ys[index].tolist()
+
+
+class MetricRun:
+    def __init__(self, root, run_id, meta=None):
+        self.run_id = run_id
+        self.data_path = os.path.join(root, f"{run_id}.bin")
+        self.meta_path = os.path.join(root, f"{run_id}.json")
+        self.columns = {field: array('d') for field in FIELDS}
+        self.lock = threading.Lock()
+        self.meta = meta or {}
+        self.progress_last = None   # 上一个 tqdm 计数
+        self.progress_offset = 0.0  # 之前各轮 tqdm 计数的累计
+        if os.path.exists(self.data_path):
+            self._load()
+        if meta is not None:
+            self._write_meta()
+
+    def _load(self):
+        with open(self.data_path, 'rb') as f:
+            data = f.read()
+        usable = len(data) // RECORD.size * RECORD.size
+        table = np.frombuffer(data[:usable], dtype='<f8').reshape(-1, len(FIELDS))
+        for index, field in enumerate(FIELDS):
+            self.columns[field].frombytes(np.ascontiguousarray(table[:, index]).tobytes())
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+    def append(self, values):
+        with self.lock:
+            steps = self.columns['step']
+            progress = values.pop('progress', None)
+            total = values.pop('progress_total', None)
+            if progress is not None:
+                # 计数回落说明进入了新一轮进度条，之前一轮的总数计入偏移
+                if self.progress_last is not None and progress < self.progress_last[0]:
+                    self.progress_offset += self.progress_last[1]
+                self.progress_last = (progress, total)
+                if 'step' not in values:
+                    values['step'] = self.progress_offset + progress
+            if 'step' not in values:
+                # 没有显式步数时：新的 loss 记为下一步，其他指标（学习率、吞吐量等）归入当前步
+                if not steps:
+                    values['step'] = 1.0
+                else:
+                    values['step'] = steps[-1] + 1 if 'loss' in values else steps[-1]
+            record = [time.time() if field == 'time' else values.get(field, NAN) for field in FIELDS]
+            for field, value in zip(FIELDS, record):
+                self.columns[field].append(value)
+            with open(self.data_path, 'ab') as f:
+                f.write(RECORD.pack(*record))
+
+    def finish(self, state):
+        with self.lock:
+            self.meta.update(state=state, finished_at=time.time())
+            self._write_meta()
+
+    def series(self, field, x_field='step', width=800):
+        with self.lock:
+            xs = np.frombuffer(self.columns[x_field], dtype=np.float64).copy()
+            ys = np.frombuffer(self.columns[field], dtype=np.float64).copy()
+        out_x, out_y = decimate(xs, ys, width)
+        return {'run_id': self.run_id, 'field': field, 'x_field': x_field, 'points': len(ys),
+                'x': out_x, 'y': out_y}
+
+    def summary(self):
+        with self.lock:
+            count = len(self.columns['step'])
+            last = {field: self.columns[field][-1] for field in FIELDS if count}
+            losses = [v for v in self.columns['loss'] if not math.isnan(v)]
+        return dict(self.meta, run_id=self.run_id, points=count,
+                    last={k: v for k, v in last.items() if not math.isnan(v)},
+                    min_loss=min(losses) if losses else None)
+
+
+class MetricsStore:
+    def __init__(self, root, max_loaded=16):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.runs = {}  # run_id -> MetricRun（进行中的和最近查询过的）
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def start(self, run_id, **meta):
+        run = MetricRun(self.root, run_id, dict(meta, started_at=time.time(), state='running'))
+        with self.lock:
+            self.runs[run_id] = run
+        return run
+
+    def get(self, run_id):
+        if not run_id or not run_id.isalnum():
+            return None
+        with self.lock:
+            run = self.runs.get(run_id)
+        if run is None and os.path.exists(os.path.join(self.root, f"{run_id}.json")):
+            run = MetricRun(self.root, run_id)
+            with self.lock:
+                self.runs[run_id] = run
+                while len(self.runs) > self.max_loaded:
+                    oldest = next(iter(self.runs))
+                    if self.runs[oldest].meta.get('state') == 'running':
+                        break
+                    del self.runs[oldest]
+        return run
+
+    def record(self, run, line):
+        values = parse_metrics(line)
+        if values:
+            run.append(values)
+        return values
+
+    def list_runs(self):
+        runs = []
+        for name in sorted(os.listdir(self.root)):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.root, name), 'r', encoding='utf-8') as f:
+                        runs.append(dict(json.load(f), run_id=name[:-5]))
+                except (OSError, ValueError):
+                    continue
+        return sorted(runs, key=lambda r: r.get('started_at', 0), reverse=True)
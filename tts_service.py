@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import base64
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from worker_pool import WorkerPool, WorkerError
+from output_pump import LatencyStats
+from text_split import segment_text
+from audio_join import join_wavs, pause_after
+
+# 常驻语音合成服务：请求交给 tts_worker.py 常驻进程，模型在进程内按 LRU 保留，
+# 并按模型分别统计冷启动（需加载模型）和热请求的耗时；流式请求另外统计首个分块的到达时间
+
+SERVICE_KEY = 'tts'
+
+
+class TTSService:
+    def __init__(self, build_cmd, workers=1, request_timeout=600, parallel_threads=None):
+        # build_cmd(threads)：threads 为 None 时不限制计算线程数；
+        # parallel_threads：长文本并行合成时临时扩充的进程各自使用的线程数，常驻进程保持默认线程数
+        self.build_cmd = build_cmd
+        self.parallel_threads = parallel_threads
+        self.pool = WorkerPool(lambda _: build_cmd(None), default_size=workers,
+                               request_timeout=request_timeout, label='TTS')
+        self.latency = {}  # model -> {'cold': LatencyStats, 'warm': LatencyStats, 'first_chunk': LatencyStats}
+        self.loaded = []
+        self.versions = {}  # model_path -> 请求使用的模型版本，新版本在所有进程加载完成后才切换
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.pool.warm(SERVICE_KEY)
+        self.pool.start_supervisor()
+
+    def _stats_for(self, model):
+        with self.lock:
+            return self.latency.setdefault(
+                model, {'cold': LatencyStats(), 'warm': LatencyStats(), 'first_chunk': LatencyStats()})
+
+    def synthesize(self, model, model_path, text, params, output_path, on_chunk=None):
+        # 阻塞直到合成完成，返回工作进程的响应字典；
+        # 传入 on_chunk 时按句流式合成，每句完成后回调 on_chunk(index, total, sample_rate, pcm_bytes)
+        with self.lock:
+            version = self.versions.get(model_path, '')
+        job = {
+            'model_path': model_path,
+            'model_version': version,
+            'text': text,
+            'speech_rate': params.get('speech_rate', 1.0),
+            'volume': params.get('volume', 1.0),
+            'pitch': params.get('pitch', 'normal'),
+            'emotion_tone': params.get('emotion_tone', 'calm'),
+            'voice': params.get('voice', 'zhiyan_emo'),
+            'output_path': output_path,
+            'stream': on_chunk is not None,
+        }
+        started = time.time()
+        stats = self._stats_for(model)
+
+        def on_partial(message):
+            if message['index'] == 0:
+                stats['first_chunk'].record((time.time() - started) * 1000.0)
+            on_chunk(message['index'], message['total'], message['sample_rate'], base64.b64decode(message['pcm']))
+
+        result = self.pool.submit(SERVICE_KEY, job, on_partial=on_partial if on_chunk else None)
+        if 'error' in result:
+            raise WorkerError(result['error'])
+        elapsed_ms = (time.time() - started) * 1000.0
+        with self.lock:
+            self.loaded = result.get('loaded_models', self.loaded)
+        stats['cold' if result.get('cold') else 'warm'].record(elapsed_ms)
+        print(f"语音合成完成: {model} ({'冷启动' if result.get('cold') else '热'}, {elapsed_ms:.0f} ms)", file=sys.stderr)
+        return result
+
+    def synthesize_long(self, model, model_path, text, params, output_path, workers, max_chars=80):
+        # 长文本：分段后在多个工作进程上并行合成，再按标点插入停顿、交叉淡化拼接为一个文件
+        segments = segment_text(text, max_chars)
+        if len(segments) <= 1 or workers <= 1:
+            return self.synthesize(model, model_path, text, params, output_path)
+        workers = min(workers, len(segments))
+        work_dir = tempfile.mkdtemp(prefix='tts_long_')
+        started = time.time()
+        try:
+            paths = [os.path.join(work_dir, f"segment_{i:04d}.wav") for i in range(len(segments))]
+            # 本次合成期间临时扩充工作进程，结束后回收到常驻数量
+            with self.pool.expanded(SERVICE_KEY, workers, lambda _: self.build_cmd(self.parallel_threads)), \
+                    ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(self.synthesize, model, model_path, segment.strip(), params, path)
+                    for segment, path in zip(segments, paths)
+                ]
+                for future in futures:
+                    future.result()
+            duration = join_wavs(paths, [pause_after(segment) for segment in segments], output_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        elapsed = time.time() - started
+        print(f"长文本语音合成完成: {model} ({len(segments)} 段, 并行度 {workers}, "
+              f"音频 {duration:.1f} 秒, 耗时 {elapsed:.1f} 秒)", file=sys.stderr)
+        return {'output_path': output_path, 'segments': len(segments), 'workers': workers,
+                'audio_seconds': round(duration, 2), 'elapsed_seconds': round(elapsed, 2)}
+
+    def swap(self, model_path, version):
+        # 模型更新后的热切换：逐个在空闲的工作进程上预加载新版本（其余进程继续用旧版本处理请求），
+        # 全部加载完成后再把后续请求切到新版本，避免更新后的首批请求承担模型加载耗时
+        with self.lock:
+            if self.versions.get(model_path) == version:
+                return
+        with self.pool.lock:
+            workers = [w for w in self.pool.workers.get(SERVICE_KEY, []) if w.alive()]
+            idle = self.pool.idle.get(SERVICE_KEY)
+        done = set()
+        started = time.time()
+        while idle is not None and len(done) < len(workers):
+            worker = idle.get()
+            try:
+                if worker in done or worker not in workers:
+                    time.sleep(0.05)  # 其余进程都在忙，稍后再取
+                    continue
+                result = worker.request({'preload': True, 'model_path': model_path, 'model_version': version},
+                                        self.pool.request_timeout)
+                if 'error' in result:
+                    print(f"TTS 新版本预加载失败，仍使用旧版本: {model_path}: {result['error']}", file=sys.stderr)
+                    return
+                done.add(worker)
+            except WorkerError as e:
+                print(f"TTS 新版本预加载失败 ({model_path}): {str(e)}", file=sys.stderr)
+                done.add(worker)  # 进程已退出，重启后会按新版本加载
+            finally:
+                idle.put(worker)
+        with self.lock:
+            self.versions[model_path] = version
+        print(f"TTS 模型已热切换: {model_path} -> {version} (预加载 {len(done)} 个进程, "
+              f"{time.time() - started:.1f} 秒)", file=sys.stderr)
+
+    def forget(self, model_path):
+        with self.lock:
+            self.versions.pop(model_path, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.pool.stats().get(SERVICE_KEY, {}),
+                'loaded_models': self.loaded,
+                'latency': {
+                    model: {kind: s.snapshot() for kind, s in stats.items()}
+                    for model, stats in self.latency.items()
+                },
+            }
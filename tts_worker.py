@@ -0,0 +1,194 @@
+import os
+os.environ["PYTHONUNBUFFERED"] = "1"
+import gc
+import io
+import sys
+import json
+import time
+import wave
+import base64
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+from text_split import split_sentences
+from prosody import apply_prosody
+
+# 常驻语音合成工作进程：按最近使用顺序在内存中保留多个 TTS 模型，
+# 超出内存预算时淘汰最久未使用的模型；通过 stdin/stdout 逐行 JSON 接收合成任务
+# 用法：python tts_worker.py <内存预算 MB>
+# 请求：{"id", "model_path", "text", "speech_rate", "volume", "pitch", "emotion_tone", "voice", "output_path"}
+# 响应：{"id", "output_path", "cold", "load_seconds", "synth_seconds"} 或 {"id", "error"}
+# 请求带 "stream": true 时按句切分依次合成，每句完成后先发送
+# {"id", "partial": true, "index", "total", "sample_rate", "pcm"}（pcm 为 base64 的 16bit PCM），最后仍写出完整文件
+# 语速、音量和音调在本进程内对合成结果做韵律后处理（见 prosody.py）；
+# 情感语气交给模型（多情感音色的 emotion 参数），默认的 calm 不传，模型不接受该参数时返回错误
+# 模型按 (model_path, model_version) 缓存：{"id", "preload": true, "model_path", "model_version"} 只加载不合成，
+# 用于模型更新后先在后台加载新版本；首个使用新版本的合成请求到达时卸载同一路径的旧版本
+
+warnings.filterwarnings("ignore")
+
+DEFAULT_EMOTION = 'calm'
+
+# stdout 只用于协议消息，模型库的打印统一转到 stderr
+_protocol_out = sys.stdout
+sys.stdout = sys.stderr
+
+
+def send(message):
+    _protocol_out.write(json.dumps(message, ensure_ascii=False) + "\n")
+    _protocol_out.flush()
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+class ModelLRU:
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.models = OrderedDict()  # (model_path, model_version) -> [pipeline, 估算内存]
+
+    def get(self, model_path, version=''):
+        # 返回 (pipeline, 是否冷启动, 加载耗时)
+        key = (model_path, version)
+        if key in self.models:
+            self.models.move_to_end(key)
+            return self.models[key][0], False, 0.0
+        from modelscope.pipelines import pipeline
+        from modelscope.utils.constant import Tasks
+
+        started = time.time()
+        before = rss_bytes()
+        tts = pipeline(task=Tasks.text_to_speech, model=model_path)
+        self.models[key] = [tts, max(rss_bytes() - before, 0)]
+        self.evict(keep=key)
+        return tts, True, time.time() - started
+
+    def drop_other_versions(self, model_path, version):
+        for key in [k for k in self.models if k[0] == model_path and k[1] != version]:
+            self.models.pop(key)
+            print(f"TTS 模型旧版本已卸载: {model_path} ({key[1] or '初始'})", file=sys.stderr)
+
+    def evict(self, keep=None):
+        while len(self.models) > 1 and sum(size for _, size in self.models.values()) > self.budget_bytes:
+            oldest = next(iter(self.models))
+            if oldest == keep:
+                break
+            self.models.pop(oldest)
+            print(f"TTS 模型超出内存预算，已卸载: {oldest}", file=sys.stderr)
+        gc.collect()
+
+    def info(self):
+        return [{"model_path": path, "version": version, "bytes": size}
+                for (path, version), (_, size) in self.models.items()]
+
+
+def read_wav(data):
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        sample_rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2').astype(np.float32) / 32768.0
+    return samples, sample_rate
+
+
+def write_wav(path, samples, sample_rate):
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype('<i2')
+    tmp_path = path + '.tmp'
+    with wave.open(tmp_path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    os.replace(tmp_path, path)
+
+
+def synthesize_samples(tts, job):
+    # 返回 (float32 采样, 采样率)；情感语气由模型合成，语速、音量、音调在此进程内处理
+    from modelscope.outputs import OutputKeys
+    params = {'voice': job.get("voice", "zhiyan_emo")}
+    emotion_tone = job.get("emotion_tone") or DEFAULT_EMOTION
+    if emotion_tone != DEFAULT_EMOTION:
+        params['emotion'] = emotion_tone
+    try:
+        output = tts(input=job["text"], **params)
+    except TypeError as e:
+        if 'emotion' not in params:
+            raise
+        raise ValueError(f"当前模型不支持情感语气 {emotion_tone}: {str(e)}")
+    samples, sample_rate = read_wav(output[OutputKeys.OUTPUT_WAV])
+    samples = apply_prosody(samples, sample_rate, speech_rate=float(job.get("speech_rate", 1.0)),
+                            volume=float(job.get("volume", 1.0)), pitch=job.get("pitch", "normal"))
+    return samples, sample_rate
+
+
+def synthesize_streaming(tts, job):
+    # 逐句合成并发送分块，返回拼接后的完整采样
+    sentences = split_sentences(job["text"])
+    pieces = []
+    sample_rate = None
+    for index, sentence in enumerate(sentences):
+        samples, sample_rate = synthesize_samples(tts, dict(job, text=sentence))
+        pieces.append(samples)
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype('<i2')
+        send({
+            "id": job.get("id"),
+            "partial": True,
+            "index": index,
+            "total": len(sentences),
+            "sample_rate": sample_rate,
+            "pcm": base64.b64encode(pcm.tobytes()).decode("ascii"),
+        })
+    if not pieces:
+        raise ValueError("文本为空")
+    return np.concatenate(pieces), sample_rate
+
+
+def main():
+    budget_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    models = ModelLRU(budget_mb * 1024 * 1024)
+    send({"ready": True, "pid": os.getpid(), "budget_mb": budget_mb})
+    print(f"TTS 工作进程就绪 (PID: {os.getpid()}, 内存预算: {budget_mb} MB)", file=sys.stderr)
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            send({"error": f"无效请求: {str(e)}"})
+            continue
+        job_id = job.get("id")
+        try:
+            version = job.get("model_version", "")
+            tts, cold, load_seconds = models.get(job["model_path"], version)
+            if job.get("preload"):
+                send({"id": job_id, "cold": cold, "load_seconds": round(load_seconds, 3),
+                      "loaded_models": models.info()})
+                continue
+            models.drop_other_versions(job["model_path"], version)
+            started = time.time()
+            if job.get("stream"):
+                samples, sample_rate = synthesize_streaming(tts, job)
+            else:
+                samples, sample_rate = synthesize_samples(tts, job)
+            write_wav(job["output_path"], samples, sample_rate)
+            send({
+                "id": job_id,
+                "output_path": job["output_path"],
+                "cold": cold,
+                "load_seconds": round(load_seconds, 3),
+                "synth_seconds": round(time.time() - started, 3),
+                "loaded_models": models.info(),
+            })
+        except Exception as e:
+            send({"id": job_id, "error": str(e)})
+
+
+if __name__ == "__main__":
+    main()
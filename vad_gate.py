@@ -0,0 +1,121 @@
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+# 流式语音活动检测门：在 Socket.IO 处理函数和识别子进程之间，
+# 根据能量和过零率判断每个音频块是否为语音，丢弃静音块并标记语句边界
+
+
+class VADCounters:
+    # 全局累计计数，供 /realtime_stats 展示
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames_forwarded = 0
+        self.frames_skipped = 0
+        self.utterances = 0
+
+    def add(self, forwarded=0, skipped=0, utterances=0):
+        with self.lock:
+            self.frames_forwarded += forwarded
+            self.frames_skipped += skipped
+            self.utterances += utterances
+
+    def snapshot(self):
+        with self.lock:
+            total = self.frames_forwarded + self.frames_skipped
+            return {
+                'frames_forwarded': self.frames_forwarded,
+                'frames_skipped': self.frames_skipped,
+                'utterances': self.utterances,
+                'skip_ratio': round(self.frames_skipped / total, 4) if total else 0.0,
+            }
+
+
+class StreamingVAD:
+    def __init__(self, sample_rate, hangover_ms=400, preroll_ms=200, margin_db=9.0,
+                 min_energy_db=-50.0, max_zcr=0.35, counters=None):
+        self.sample_rate = sample_rate
+        self.hangover_ms = hangover_ms  # 语音结束后继续转发的时长
+        self.preroll_ms = preroll_ms    # 语音开始前补发的静音时长，避免吞掉首字
+        self.margin_db = margin_db      # 高于噪声底多少 dB 视为语音
+        self.min_energy_db = min_energy_db
+        self.max_zcr = max_zcr
+        self.counters = counters
+        self.noise_db = None
+        self.in_speech = False
+        self.silence_ms = 0.0
+        self.preroll = deque()  # (负载, 时长 ms)
+        self.preroll_total_ms = 0.0
+        self.frames_forwarded = 0
+        self.frames_skipped = 0
+        self.utterances = 0
+
+    def is_speech(self, samples):
+        if len(samples) == 0:
+            return False
+        energy_db = 10.0 * math.log10(float(np.mean(samples.astype(np.float64) ** 2)) + 1e-10)
+        zcr = float(np.mean(np.signbit(samples[1:]) != np.signbit(samples[:-1]))) if len(samples) > 1 else 0.0
+        if self.noise_db is None:
+            self.noise_db = energy_db
+        threshold = max(self.noise_db + self.margin_db, self.min_energy_db)
+        # 过零率很高而能量不够突出的多为底噪或气流声
+        speech = energy_db > threshold and (zcr < self.max_zcr or energy_db > threshold + 10.0)
+        if not speech:
+            self.noise_db = 0.95 * self.noise_db + 0.05 * energy_db
+        return speech
+
+    def process(self, payload, samples):
+        # 返回 (需要转发的负载列表, 是否在此处结束一句话)
+        duration_ms = len(samples) * 1000.0 / self.sample_rate
+        forward = []
+        boundary = False
+        utterances = 0
+        skipped = 0
+        if self.is_speech(samples):
+            if not self.in_speech:
+                self.in_speech = True
+                utterances = 1
+                forward.extend(p for p, _ in self.preroll)
+                self.preroll.clear()
+                self.preroll_total_ms = 0.0
+            self.silence_ms = 0.0
+            forward.append(payload)
+        elif self.in_speech:
+            self.silence_ms += duration_ms
+            forward.append(payload)
+            if self.silence_ms >= self.hangover_ms:
+                self.in_speech = False
+                boundary = True
+        else:
+            self.preroll.append((payload, duration_ms))
+            self.preroll_total_ms += duration_ms
+            while self.preroll and self.preroll_total_ms - self.preroll[0][1] >= self.preroll_ms:
+                _, dropped_ms = self.preroll.popleft()
+                self.preroll_total_ms -= dropped_ms
+                skipped += 1
+        self._count(len(forward), skipped, utterances)
+        return forward, boundary
+
+    def finish(self):
+        # 流结束时尚未转发的预缓冲块计为跳过
+        skipped = len(self.preroll)
+        self.preroll.clear()
+        self.preroll_total_ms = 0.0
+        self._count(0, skipped, 0)
+
+    def _count(self, forwarded, skipped, utterances):
+        self.frames_forwarded += forwarded
+        self.frames_skipped += skipped
+        self.utterances += utterances
+        if self.counters is not None and (forwarded or skipped or utterances):
+            self.counters.add(forwarded, skipped, utterances)
+
+    def stats(self):
+        return {
+            'frames_forwarded': self.frames_forwarded,
+            'frames_skipped': self.frames_skipped,
+            'utterances': self.utterances,
+            'in_speech': self.in_speech,
+        }
@@ -0,0 +1,70 @@
+import os
+import shutil
+import threading
+
+from result_cache import audio_digest
+
+# 语音克隆参考音频：上传的参考音频按内容哈希去重存放，哈希即返回给客户端的 voice_id，
+# 之后的克隆请求可只传 voice_id；参考音频编码出的提示特征（见 clone_worker.py）与音频放在同一目录，
+# 目录由存储配额清理按最后使用时间整体淘汰
+# 目录结构：<root>/<音频哈希>/reference.<扩展名>
+#           <root>/<音频哈希>/prompt-<模型版本>.pt
+
+
+class VoiceReferenceStore:
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.added = 0
+        self.reused = 0
+        os.makedirs(root, exist_ok=True)
+
+    def add_reference(self, path):
+        # 返回 (音频哈希, 参考音频路径, 是否已存在)；已存在时删除新上传的文件
+        digest = audio_digest(path)
+        directory = os.path.join(self.root, digest)
+        os.makedirs(directory, exist_ok=True)
+        reference = self.reference_path(digest)
+        if reference is not None:
+            os.remove(path)
+            existed = True
+        else:
+            reference = os.path.join(directory, 'reference' + os.path.splitext(path)[1].lower())
+            shutil.move(path, reference)
+            existed = False
+        with self.lock:
+            if existed:
+                self.reused += 1
+            else:
+                self.added += 1
+        return digest, reference, existed
+
+    def digest_for(self, path):
+        # 参考音频的内容哈希；库内的参考音频直接取目录名
+        path = os.path.abspath(path)
+        if os.path.dirname(os.path.dirname(path)) == os.path.abspath(self.root):
+            return os.path.basename(os.path.dirname(path))
+        return audio_digest(path)
+
+    def prompt_path(self, digest, model_version):
+        return os.path.join(self.root, os.path.basename(digest), f"prompt-{model_version}.pt")
+
+    def reference_path(self, digest):
+        directory = os.path.join(self.root, os.path.basename(digest))
+        if not os.path.isdir(directory):
+            return None
+        for name in os.listdir(directory):
+            if name.startswith('reference'):
+                return os.path.join(directory, name)
+        return None
+
+    def stats(self):
+        references = 0
+        prompts = 0
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if os.path.isdir(directory):
+                references += 1
+                prompts += sum(1 for f in os.listdir(directory) if f.startswith('prompt-') and f.endswith('.pt'))
+        with self.lock:
+            return {'references': references, 'prompts': prompts, 'added': self.added, 'reused': self.reused}
@@ -0,0 +1,383 @@
+import sys
+import json
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 常驻工作进程池：每个键（通常是模型名）维护若干个已加载模型的子进程，
+# 通过 stdin/stdout 逐行 JSON 收发任务，请求直接交给空闲进程处理，
+# 不再为每个请求重新激活 conda 和加载模型。离线识别 (asr_worker.py) 和语音合成 (tts_worker.py) 共用
+
+
+class WorkerError(Exception):
+    pass
+
+
+class JsonLineWorker:
+    def __init__(self, model, cmd, ready_timeout=300, label='ASR', acquire=None):
+        self.model = model
+        self.cmd = cmd
+        self.label = label
+        self.ready_timeout = ready_timeout
+        self.acquire = acquire  # acquire(模型) 返回释放函数：进程存活期间持有模型目录的引用
+        self.release = None
+        self.retired = False  # 热切换后被替换的旧进程，处理完手头请求即停止
+        self.trimmed = False  # 临时扩充结束后多出的进程，回到空闲队列时停止
+        self.process = None
+        self.lines = queue.Queue()
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.jobs_done = 0
+
+    def start(self):
+        # 每次启动（包括监控线程重启崩溃的进程）都释放上一次的引用并重新获取，
+        # 模型目录在此期间被原子替换时，旧目录可以删除，新目录被正确引用
+        if self.release is not None:
+            self.release()
+            self.release = None
+        if self.acquire is not None:
+            try:
+                self.release = self.acquire(self.model)
+            except Exception as e:
+                raise WorkerError(str(e))
+        self.lines = queue.Queue()
+        self.process = subprocess.Popen(
+            ["/bin/bash", "-c", self.cmd],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=1,
+            text=True,
+            encoding='utf-8'
+        )
+        threading.Thread(target=self._read_stdout, args=(self.process, self.lines), daemon=True).start()
+        threading.Thread(target=self._drain_stderr, args=(self.process,), daemon=True).start()
+        message = self._next_message(self.ready_timeout)
+        if not message.get("ready"):
+            self.stop()
+            raise WorkerError(message.get("error", "工作进程启动失败"))
+        self.started_at = time.time()
+        self.jobs_done = 0
+        print(f"{self.label} 工作进程已就绪: {self.model} (PID: {self.process.pid})", file=sys.stderr)
+
+    def _read_stdout(self, process, lines):
+        for line in iter(process.stdout.readline, ''):
+            line = line.strip()
+            if line.startswith('{'):
+                lines.put(line)
+            elif line:
+                # conda 激活脚本等产生的非协议输出
+                print(f"{self.label} 工作进程[{self.model}]: {line}", file=sys.stderr)
+        lines.put(None)
+
+    def _drain_stderr(self, process):
+        for line in iter(process.stderr.readline, ''):
+            line = line.strip()
+            if line:
+                print(f"{self.label} 工作进程[{self.model}]: {line}", file=sys.stderr)
+
+    def _next_message(self, timeout):
+        try:
+            line = self.lines.get(timeout=timeout)
+        except queue.Empty:
+            raise WorkerError("工作进程响应超时")
+        if line is None:
+            raise WorkerError("工作进程已退出")
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise WorkerError(f"工作进程输出无法解析: {line}")
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def request(self, payload, timeout=600, on_partial=None):
+        # 带 "partial": true 的中间消息交给 on_partial，直到收到最终响应
+        with self.lock:
+            if not self.alive():
+                raise WorkerError("工作进程未运行")
+            job_id = uuid.uuid4().hex
+            payload = dict(payload, id=job_id)
+            try:
+                self.process.stdin.write(json.dumps(payload, ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise WorkerError(f"写入工作进程失败: {str(e)}")
+            deadline = time.time() + timeout
+            while True:
+                message = self._next_message(max(deadline - time.time(), 0))
+                if message.get("id") != job_id:
+                    continue
+                if message.get("partial"):
+                    if on_partial is not None:
+                        on_partial(message)
+                    continue
+                self.jobs_done += 1
+                return message
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+        self.process = None
+        self.started_at = None
+        if self.release is not None:
+            self.release()
+            self.release = None
+
+    def info(self):
+        return {
+            "pid": self.process.pid if self.alive() else None,
+            "alive": self.alive(),
+            "busy": self.lock.locked(),
+            "jobs_done": self.jobs_done,
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at and self.alive() else 0,
+        }
+
+
+class WorkerPool:
+    def __init__(self, build_cmd, pool_sizes=None, default_size=1, request_timeout=600, label='ASR', acquire=None):
+        self.build_cmd = build_cmd
+        self.label = label
+        self.acquire = acquire
+        self.pool_sizes = pool_sizes or {}
+        self.default_size = default_size
+        self.request_timeout = request_timeout
+        self.workers = {}  # model -> [JsonLineWorker]
+        self.idle = {}  # model -> Queue[JsonLineWorker]
+        self.expansions = {}  # model -> 进行中的临时扩充数
+        self.lock = threading.Lock()
+
+    def size_for(self, model):
+        return max(1, int(self.pool_sizes.get(model, self.default_size)))
+
+    def _ensure_model(self, model):
+        with self.lock:
+            if model in self.workers:
+                return
+            workers = [self._new_worker(model) for _ in range(self.size_for(model))]
+            idle = queue.Queue()
+            for worker in workers:
+                idle.put(worker)
+            self.workers[model] = workers
+            self.idle[model] = idle
+
+    def _new_worker(self, model, build_cmd=None):
+        return JsonLineWorker(model, (build_cmd or self.build_cmd)(model), label=self.label, acquire=self.acquire)
+
+    @contextmanager
+    def expanded(self, model, size, build_cmd=None):
+        # 临时扩充某模型的工作进程数（例如批量识别），新进程在首次取用时启动；
+        # build_cmd 为临时进程单独指定启动命令（例如限制计算线程数），常驻进程不受影响；
+        # 最后一个扩充结束后多于 size_for(model) 的进程在空闲时停止，返回扩充后的进程数
+        self._ensure_model(model)
+        with self.lock:
+            workers = self.workers[model]
+            while len(workers) < size:
+                worker = self._new_worker(model, build_cmd)
+                workers.append(worker)
+                self.idle[model].put(worker)
+            self.expansions[model] = self.expansions.get(model, 0) + 1
+            count = len(workers)
+        try:
+            yield count
+        finally:
+            self._shrink(model)
+
+    def _shrink(self, model):
+        with self.lock:
+            remaining = self.expansions.get(model, 1) - 1
+            if remaining > 0:
+                self.expansions[model] = remaining
+                return
+            self.expansions.pop(model, None)
+            workers = self.workers.get(model, [])
+            extra = workers[self.size_for(model):]
+            del workers[self.size_for(model):]
+            for worker in extra:
+                worker.trimmed = True
+            idle = self.idle.get(model)
+        if not extra or idle is None:
+            return
+        # 正在处理请求的进程由 submit 在归还时停止，这里只取出空闲的
+        kept = []
+        while True:
+            try:
+                worker = idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.trimmed:
+                with worker.lock:
+                    worker.stop()
+            else:
+                kept.append(worker)
+        for worker in kept:
+            idle.put(worker)
+        print(f"{self.label} 临时扩充结束，回收 {len(extra)} 个工作进程: {model}", file=sys.stderr)
+
+    def warm(self, model):
+        # 后台预热：提前启动该模型的全部工作进程
+        self._ensure_model(model)
+
+        def start_all():
+            for worker in self.workers[model]:
+                with worker.lock:
+                    if not worker.alive():
+                        try:
+                            worker.start()
+                        except Exception as e:
+                            print(f"预热 {self.label} 工作进程失败 ({model}): {str(e)}", file=sys.stderr)
+        threading.Thread(target=start_all, daemon=True).start()
+
+    def start_supervisor(self, interval=5):
+        # 定期检查已启动过但意外退出的工作进程并重新拉起
+        def supervise():
+            while True:
+                time.sleep(interval)
+                with self.lock:
+                    workers = [w for group in self.workers.values() for w in group]
+                for worker in workers:
+                    if worker.started_at and not worker.alive() and worker.lock.acquire(blocking=False):
+                        try:
+                            print(f"{self.label} 工作进程已退出，正在重启: {worker.model}", file=sys.stderr)
+                            worker.start()
+                        except Exception as e:
+                            print(f"重启 {self.label} 工作进程失败 ({worker.model}): {str(e)}", file=sys.stderr)
+                        finally:
+                            worker.lock.release()
+        threading.Thread(target=supervise, daemon=True).start()
+
+    def submit(self, model, payload, timeout=None, on_partial=None):
+        timeout = timeout or self.request_timeout
+        while True:
+            self._ensure_model(model)
+            with self.lock:
+                idle = self.idle.get(model)
+            if idle is None:
+                continue  # 刚被回收，重新创建
+            worker = idle.get()
+            if worker.trimmed:
+                with worker.lock:
+                    worker.stop()
+                continue
+            if not worker.retired:
+                break
+            # 热切换期间在旧队列上等到的旧进程：放回给回收线程，改从新队列取
+            idle.put(worker)
+        delivered = []
+
+        def forward(message):
+            delivered.append(message.get("index"))
+            on_partial(message)
+
+        try:
+            for attempt in range(2):
+                try:
+                    if not worker.alive():
+                        # 崩溃或尚未启动的进程在取用时重启
+                        with worker.lock:
+                            if not worker.alive():
+                                worker.stop()
+                                worker.start()
+                    return worker.request(payload, timeout, forward if on_partial else None)
+                except WorkerError as e:
+                    print(f"{self.label} 工作进程请求失败 ({model}, 第 {attempt + 1} 次): {str(e)}", file=sys.stderr)
+                    with worker.lock:
+                        worker.stop()
+                    # 已有中间结果发出时不再重试，避免客户端收到重复分块
+                    if attempt == 1 or delivered:
+                        raise
+        finally:
+            if worker.trimmed:
+                with worker.lock:
+                    worker.stop()
+            else:
+                idle.put(worker)
+
+    def transcribe(self, model, audio_path, timeout=None):
+        result = self.submit(model, {"audio_path": audio_path}, timeout)
+        if "error" in result:
+            raise WorkerError(result["error"])
+        return result.get("text", "")
+
+    def transcribe_many(self, model, audio_paths, timeout=None):
+        # 一批文件交给同一个工作进程，返回与输入顺序一致的结果列表
+        result = self.submit(model, {"audio_paths": list(audio_paths)}, timeout)
+        if "error" in result:
+            raise WorkerError(result["error"])
+        return result.get("results", [])
+
+    def reload(self, model):
+        # 热切换：后台启动同样数量的新进程（加载新版本模型），全部就绪后原子替换，
+        # 旧进程处理完进行中的请求后再停止；期间请求照常由旧进程处理。该模型没有进程时返回 False
+        with self.lock:
+            if model not in self.workers:
+                return False
+            size = len(self.workers[model])
+
+        def swap():
+            fresh = [self._new_worker(model) for _ in range(size)]
+            try:
+                for worker in fresh:
+                    worker.start()
+            except Exception as e:
+                print(f"{self.label} 热切换失败，继续使用旧进程 ({model}): {str(e)}", file=sys.stderr)
+                for worker in fresh:
+                    worker.stop()
+                return
+            idle = queue.Queue()
+            for worker in fresh:
+                idle.put(worker)
+            with self.lock:
+                old = self.workers.get(model, [])
+                old_idle = self.idle.get(model)
+                self.workers[model] = fresh
+                self.idle[model] = idle
+                for worker in old:
+                    worker.retired = True
+            print(f"{self.label} 工作进程已热切换: {model} ({size} 个)", file=sys.stderr)
+            self._drain(old, old_idle)
+
+        threading.Thread(target=swap, daemon=True).start()
+        return True
+
+    def retire(self, model):
+        # 模型被删除：不再接收新请求，进行中的请求完成后停止进程
+        with self.lock:
+            old = self.workers.pop(model, [])
+            old_idle = self.idle.pop(model, None)
+            for worker in old:
+                worker.retired = True
+        if old:
+            threading.Thread(target=self._drain, args=(old, old_idle), daemon=True).start()
+
+    def _drain(self, workers, idle):
+        # 逐个等待旧进程回到空闲队列（即手头请求已完成）后停止
+        for _ in workers:
+            worker = idle.get()
+            with worker.lock:
+                worker.stop()
+        if workers:
+            print(f"{self.label} 旧工作进程已停止: {workers[0].model} ({len(workers)} 个)", file=sys.stderr)
+
+    def shutdown(self, model=None):
+        with self.lock:
+            models = [model] if model else list(self.workers)
+            for name in models:
+                for worker in self.workers.pop(name, []):
+                    with worker.lock:
+                        worker.stop()
+                self.idle.pop(name, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                model: {"size": len(workers), "workers": [w.info() for w in workers]}
+                for model, workers in self.workers.items()
+            }